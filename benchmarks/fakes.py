@@ -0,0 +1,388 @@
+import abc
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from aiohttp import ClientSession, web
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class Profile:
+    """Поведение поддельного бэкенда: задержки, очередь и доля отказов."""
+
+    def __init__(self, latency: float = 0.05, generation_time: float = 1.0, queue_depth: int = 0,
+                 failure_rate: float = 0.0, workers: int = 1):
+        """
+        :param latency: Задержка каждого HTTP-ответа (сек).
+        :param generation_time: Время выполнения одной задачи генерации (сек).
+        :param queue_depth: Сколько чужих задач стоит в очереди на момент запуска.
+        :param failure_rate: Доля отказов (503 при создании задачи или ошибка задачи), от 0 до 1.
+        :param workers: Сколько задач бэкенд выполняет одновременно.
+        """
+        self.latency = latency
+        self.generation_time = generation_time
+        self.queue_depth = queue_depth
+        self.failure_rate = failure_rate
+        self.workers = workers
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """Создаёт PNG с шумом, чтобы обработка изображения выполняла реальную работу."""
+    noise = [Image.effect_noise((width, height), 40 + 10 * channel + seed % 7) for channel in range(3)]
+    buffer = io.BytesIO()
+    Image.merge("RGB", noise).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class _TaskQueue:
+    """
+    Модель очереди бэкенда: задачи выполняются по workers штук за раз, каждая generation_time секунд.
+    Время начала и окончания задачи вычисляется при её создании.
+    """
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        now = time.monotonic()
+        # Чужие задачи, уже стоящие в очереди, равномерно заняли все исполнители
+        backlog = profile.queue_depth * profile.generation_time / max(profile.workers, 1)
+        self.free_at = [now + backlog] * max(profile.workers, 1)
+
+    def schedule(self) -> tuple:
+        """Возвращает (начало, окончание) новой задачи по time.monotonic()."""
+        index = min(range(len(self.free_at)), key=self.free_at.__getitem__)
+        started_at = max(time.monotonic(), self.free_at[index])
+        finished_at = started_at + self.profile.generation_time
+        self.free_at[index] = finished_at
+        return started_at, finished_at
+
+    def position(self, started_at: float) -> int:
+        """Оценивает позицию задачи в очереди (0 — выполняется или завершена)."""
+        wait = started_at - time.monotonic()
+        if wait <= 0:
+            return 0
+        return max(1, round(wait * len(self.free_at) / max(self.profile.generation_time, 1e-3)))
+
+
+class FakeBackend(abc.ABC):
+    """
+    Базовый поддельный HTTP-бэкенд на aiohttp.
+    Считает запросы по маршрутам и принятые байты, добавляет задержку к каждому ответу.
+    """
+
+    name = "fake"
+    FAILING_ROUTES: tuple = ()  # Маршруты, которые отвечают 503 с вероятностью failure_rate
+
+    def __init__(self, profile: Profile = None, seed: int = None):
+        self.profile = profile or Profile()
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.failures = 0
+        self.url = None
+        self._runner = None
+        self._ids = itertools.count(1)
+        self.app = web.Application(client_max_size=256 * 1024 * 1024, middlewares=[self._middleware])
+        self.setup_routes(self.app.router)
+
+    @abc.abstractmethod
+    def setup_routes(self, router: web.UrlDispatcher):
+        """Регистрирует маршруты протокола бэкенда."""
+
+    def next_id(self, prefix: str) -> str:
+        return f"{prefix}-{next(self._ids)}"
+
+    def should_fail(self) -> bool:
+        return self.profile.failure_rate > 0 and self.random.random() < self.profile.failure_rate
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        route = f"{request.method} {request.match_info.route.resource.canonical}"
+        self.requests[route] += 1
+        self.bytes_received += request.content_length or 0
+        if self.profile.latency:
+            await asyncio.sleep(self.profile.latency)
+        if request.match_info.route.resource.canonical in self.FAILING_ROUTES and self.should_fail():
+            self.failures += 1
+            return web.json_response({"error": "service unavailable"}, status=503)
+        return await handler(request)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер (port=0 — свободный порт) и возвращает его базовый URL."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound_port}"
+        logger.info(f"Поддельный бэкенд {self.name}: {self.url}")
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+
+class LocalDiffusionFake(FakeBackend):
+    """Протокол Qwen / Z-Image / ERNIE / HiDream: /api/v1/generate, /api/v1/tasks/{id}, /api/v1/health."""
+
+    name = "local_diffusion"
+    FAILING_ROUTES = ("/api/v1/generate",)
+
+    def __init__(self, profile: Profile = None, seed: int = None, image_size: tuple = (1344, 768)):
+        super().__init__(profile, seed)
+        self.queue = _TaskQueue(self.profile)
+        self.tasks: dict = {}
+        self.image = make_png(*image_size)
+
+    def setup_routes(self, router):
+        router.add_get("/api/v1/health", self.health)
+        router.add_post("/api/v1/generate", self.generate)
+        router.add_get("/api/v1/tasks/{task_id}", self.task)
+        router.add_get("/api/v1/images/{name}", self.image_file)
+
+    async def health(self, request):
+        return web.json_response({"status": "healthy", "model_loaded": True})
+
+    async def generate(self, request):
+        await request.json()
+        task_id = self.next_id("task")
+        started_at, finished_at = self.queue.schedule()
+        self.tasks[task_id] = (started_at, finished_at, self.should_fail())
+        return web.json_response({
+            "task_id": task_id,
+            "status": "queued",
+            "queue_position": self.queue.position(started_at),
+        })
+
+    async def task(self, request):
+        task_id = request.match_info["task_id"]
+        if task_id not in self.tasks:
+            return web.json_response({"detail": "Task not found"}, status=404)
+        started_at, finished_at, failed = self.tasks[task_id]
+        now = time.monotonic()
+        info = {"task_id": task_id, "queue_position": self.queue.position(started_at)}
+        if now < started_at:
+            info["status"] = "queued"
+        elif now < finished_at:
+            info["status"] = "processing"
+        elif failed:
+            self.failures += 1
+            info.update(status="failed", error="CUDA out of memory (fake)")
+        else:
+            info.update(
+                status="completed",
+                image_url=f"/api/v1/images/{task_id}.png",
+                generation_time_seconds=round(finished_at - started_at, 3),
+            )
+        return web.json_response(info)
+
+    async def image_file(self, request):
+        return web.Response(body=self.image, content_type="image/png")
+
+
+class KolerskyFake(FakeBackend):
+    """API Kolersky Midjourney v1: generate, status, image/upload и колбэки callBackUrl."""
+
+    name = "kolersky"
+    FAILING_ROUTES = ("/v1/midjourney/generate",)
+
+    def __init__(self, profile: Profile = None, seed: int = None, video_size: int = 2 * 1024 * 1024):
+        super().__init__(profile, seed)
+        self.queue = _TaskQueue(self.profile)
+        self.tasks: dict = {}
+        self.grid = make_png(1456, 816)
+        self.tile = make_png(728, 408, seed=1)
+        self.video = os.urandom(video_size)
+        self._callbacks: set = set()
+
+    def setup_routes(self, router):
+        router.add_post("/v1/midjourney/generate", self.generate)
+        router.add_post("/v1/midjourney/image/upload", self.upload)
+        router.add_get("/v1/status", self.status)
+        router.add_get("/cdn/{name}", self.cdn)
+
+    async def generate(self, request):
+        payload = await request.json()
+        request_id = self.next_id("mj")
+        started_at, finished_at = self.queue.schedule()
+        self.tasks[request_id] = (payload.get("taskType", "text-to-image"), finished_at, self.should_fail())
+        if payload.get("callBackUrl"):
+            task = asyncio.create_task(self._callback(payload["callBackUrl"], request_id, finished_at))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+        return web.json_response({"requestId": request_id, "status": "accepted"})
+
+    async def _callback(self, url: str, request_id: str, finished_at: float):
+        await asyncio.sleep(max(finished_at - time.monotonic(), 0))
+        try:
+            async with ClientSession() as session:
+                await session.post(url, json=self._result(request_id))
+        except Exception as e:
+            logger.warning(f"Колбэк {request_id} не доставлен: {e}")
+
+    def _result(self, request_id: str) -> dict:
+        task_type, finished_at, failed = self.tasks[request_id]
+        if time.monotonic() < finished_at:
+            return {"requestId": request_id, "status": "processing"}
+        if failed:
+            return {"requestId": request_id, "status": "error", "failReason": "fake failure"}
+        if task_type.startswith("image-to-video"):
+            output = {"video_urls": [f"{self.url}/cdn/{request_id}.mp4"]}
+        else:
+            output = {
+                "collage": {"image_url": f"{self.url}/cdn/{request_id}-grid.png"},
+                "images": [{"url": f"{self.url}/cdn/{request_id}-{index}.png"} for index in range(1, 5)],
+            }
+        return {"requestId": request_id, "status": "success", "output": output, "data": {"output": output}}
+
+    async def status(self, request):
+        request_id = request.query.get("requestId")
+        if request_id not in self.tasks:
+            return web.json_response({"error": "not found"}, status=404)
+        result = self._result(request_id)
+        if result["status"] == "error":
+            self.failures += 1
+        return web.json_response(result)
+
+    async def upload(self, request):
+        payload = await request.json()
+        return web.json_response({"url": f"{self.url}/cdn/{self.next_id('upload')}.{payload.get('extension', 'png')}"})
+
+    async def cdn(self, request):
+        name = request.match_info["name"]
+        if name.endswith(".mp4"):
+            return web.Response(body=self.video, content_type="video/mp4")
+        return web.Response(body=self.grid if "grid" in name else self.tile, content_type="image/png")
+
+
+class FluxFake(FakeBackend):
+    """API BFL Flux: создание задачи и /get_result."""
+
+    name = "bfl"
+    FAILING_ROUTES = ("/flux-pro-1.1-ultra",)
+
+    def __init__(self, profile: Profile = None, seed: int = None):
+        super().__init__(profile, seed)
+        self.queue = _TaskQueue(self.profile)
+        self.tasks: dict = {}
+        self.image = make_png(1344, 768, seed=2)
+
+    def setup_routes(self, router):
+        router.add_post("/flux-pro-1.1-ultra", self.create)
+        router.add_get("/get_result", self.result)
+        router.add_get("/samples/{name}", self.sample)
+
+    async def create(self, request):
+        await request.json()
+        request_id = self.next_id("flux")
+        self.tasks[request_id] = self.queue.schedule()[1]
+        return web.json_response({"id": request_id})
+
+    async def result(self, request):
+        request_id = request.query.get("id")
+        if request_id not in self.tasks:
+            return web.json_response({"status": "Task not found"})
+        if time.monotonic() < self.tasks[request_id]:
+            return web.json_response({"id": request_id, "status": "Pending"})
+        return web.json_response({
+            "id": request_id,
+            "status": "Ready",
+            "result": {"sample": f"{self.url}/samples/{request_id}.png"},
+        })
+
+    async def sample(self, request):
+        return web.Response(body=self.image, content_type="image/png")
+
+
+class GeminiFake(FakeBackend):
+    """Gemini generateContent: текстовые ответы и JSON-ответ пакетной генерации пула промптов."""
+
+    name = "gemini"
+    FAILING_ROUTES = ("/v1beta/models/{model}",)
+    # Заголовки разделов пакетного запроса utils.prompt_pool
+    SECTION_RE = re.compile(r"^### (\S+) \(промптов: (\d+)\)", re.MULTILINE)
+
+    def setup_routes(self, router):
+        router.add_post("/v1beta/models/{model}", self.generate)
+
+    def _prompt(self) -> str:
+        return f"A quiet dawn over a misty lake, soft golden light, cinematic, prompt #{next(self._ids)}"
+
+    async def generate(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.profile.generation_time)
+        config = payload.get("generationConfig", {})
+        if config.get("responseMimeType") == "application/json":
+            user_prompt = payload["contents"][0]["parts"][-1]["text"]
+            text = json.dumps({
+                pool: [self._prompt() for _ in range(int(count))]
+                for pool, count in self.SECTION_RE.findall(user_prompt)
+            })
+        else:
+            text = self._prompt()
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+
+class TelegramFake(FakeBackend):
+    """Bot API: sendMessage, sendPhoto, sendVideo и sendMediaGroup."""
+
+    name = "telegram"
+
+    def __init__(self, profile: Profile = None, seed: int = None):
+        super().__init__(profile, seed)
+        self.sent = Counter()  # Метод -> число отправленных сообщений
+        self.uploads = 0  # Отправки с загрузкой файла (а не по file_id)
+
+    def setup_routes(self, router):
+        router.add_post("/bot{token}/{method}", self.method)
+
+    def _message(self, chat_id) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "supergroup", "title": "bench"},
+        }
+
+    def _file(self, value, prefix: str) -> dict:
+        if isinstance(value, str):
+            file_id = value  # Повторная отправка по кэшированному file_id
+        else:
+            self.uploads += 1
+            file_id = self.next_id(prefix)
+        return {"file_id": file_id, "file_unique_id": f"u{file_id}", "width": 1280, "height": 720}
+
+    async def method(self, request):
+        method = request.match_info["method"]
+        data = await request.post()
+        chat_id = data.get("chat_id", "0")
+        if method == "sendMediaGroup":
+            media = json.loads(data["media"])
+            result = []
+            for item in media:
+                value = item["media"]
+                # Вложения передаются как attach://<имя поля>
+                value = data.get(value[len("attach://"):]) if value.startswith("attach://") else value
+                result.append({**self._message(chat_id), "photo": [self._file(value, "photo")]})
+        elif method == "sendPhoto":
+            result = {**self._message(chat_id), "photo": [self._file(data.get("photo"), "photo")]}
+        elif method == "sendVideo":
+            result = {**self._message(chat_id), "video": {**self._file(data.get("video"), "video"), "duration": 5}}
+        elif method == "sendMessage":
+            result = {**self._message(chat_id), "text": data.get("text", "")}
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+        self.sent[method] += 1
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию в путь для импорта
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from benchmarks.fakes import FluxFake, GeminiFake, KolerskyFake, LocalDiffusionFake, Profile, TelegramFake
+
+logger = logging.getLogger("benchmarks")
+
+# Раннеры, для бэкендов которых есть поддельные серверы: имя -> (модуль, функция)
+RUNNERS = {
+    "prompt_pool": ("utils.prompt_pool", "fill_prompt_pool"),
+    "qwen": ("bot.qwen_runner", "send_qwen_story"),
+    "zimage": ("bot.zimage_runner", "send_zimage_story"),
+    "ernie": ("bot.ernie_runner", "send_ernie_story"),
+    "hidream": ("bot.hidream_runner", "send_hidream_story"),
+    "flux": ("bot.flux_runner", "send_flux_story"),
+    "midjourney": ("bot.midjourney_runner", "send_midjourney_story"),
+    "midjourney_video": ("bot.midjourney_video_runner", "send_midjourney_video_story"),
+    "backlog": ("bot.backlog_runner", "send_backlog_story"),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_peak_mb() -> float:
+    """Пиковый RSS процесса (ru_maxrss в КБ на Linux и в байтах на macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def configure_environment(storage: str, fakes: dict, callback_port: int):
+    """
+    Направляет конфигурацию проекта на поддельные бэкенды и временное хранилище.
+    Вызывается до импорта config: значения из .env не перекрывают заданные здесь.
+    """
+    local_url = fakes["local_diffusion"].url
+    os.environ.update({
+        "BASE_STORAGE_PATH": storage,
+        "DB_PATH": os.path.join(storage, "database", "bench.db"),
+        "PROMPTS_DIR": os.path.join(ROOT, "bot", "prompts"),
+        "FONTS_PATH": os.environ.get("FONTS_PATH", os.path.join(ROOT, "fonts")),
+        "TELEGRAM_TOKEN": "123456:BENCHMARK",
+        "TELEGRAM_API_URL": fakes["telegram"].url,
+        "TARGET_CHAT_ID": "-1001",
+        "GEMINI_API_KEYS": "bench-key-1,bench-key-2",
+        "GEMINI_API_URL": f"{fakes['gemini'].url}/v1beta/models/gemini-bench:generateContent",
+        "PROXY_URL": "",
+        "GEMINI_REQUIRE_PROXY": "0",  # Поддельный Gemini доступен напрямую
+        "MIDJOURNEY_API_TOKEN": "bench",
+        "MIDJOURNEY_API_URL": fakes["kolersky"].url,
+        "MIDJOURNEY_CALLBACK_URL": f"http://127.0.0.1:{callback_port}/midjourney/callback",
+        "MIDJOURNEY_CALLBACK_PORT": str(callback_port),
+        "BFL_API_KEY": "bench",
+        "BFL_API_URL": fakes["bfl"].url,
+        "QWEN_API_URL": local_url,
+        "ZIMAGE_API_URL": local_url,
+        "ERNIE_API_URL": local_url,
+        "HIDREAM_API_URL": local_url,
+        "METRICS_PORT": "0",
+    })
+
+
+def _snapshot(fakes: dict) -> dict:
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "requests": {name: fake.total_requests for name, fake in fakes.items()},
+        "sent": sum(fakes["telegram"].sent.values()),
+    }
+
+
+def _measure(name: str, before: dict, after: dict, fakes: dict) -> dict:
+    return {
+        "runner": name,
+        "wall_s": round(after["wall"] - before["wall"], 3),
+        "cpu_s": round(after["cpu"] - before["cpu"], 3),
+        "rss_peak_mb": round(_rss_peak_mb(), 1),
+        "telegram_sent": after["sent"] - before["sent"],
+        "requests": {
+            backend: after["requests"][backend] - before["requests"][backend]
+            for backend in fakes if after["requests"][backend] != before["requests"][backend]
+        },
+    }
+
+
+def load_runners(runners: list) -> dict:
+    """
+    Импортирует функции выбранных раннеров (только их, поэтому --runners prompt_pool
+    не требует aiogram). Вызывается после configure_environment.
+    :raises SystemExit: Если не установлены зависимости раннера.
+    """
+    functions = {}
+    for name in runners:
+        module_name, function_name = RUNNERS[name]
+        try:
+            functions[name] = getattr(importlib.import_module(module_name), function_name)
+        except ModuleNotFoundError as e:
+            raise SystemExit(
+                f"Раннер {name} требует пакет {e.name}, который не установлен. "
+                f"Установите зависимости проекта: pip install -r requirements.txt "
+                f"(без них доступен только --runners prompt_pool)."
+            )
+    return functions
+
+
+async def run_benchmark(runners: list, profile: Profile, concurrent: bool = False, repeat: int = 1) -> dict:
+    """
+    Запускает поддельные бэкенды и раннеры, измеряя время, CPU, память и число запросов.
+    :param runners: Имена раннеров из RUNNERS в порядке запуска.
+    :param profile: Поведение генерирующих бэкендов (Telegram и HTTP-задержки берут только latency).
+    :param concurrent: Запускать раннеры одновременно, как планировщик в одном слоте.
+    :param repeat: Сколько раз повторить набор раннеров.
+    :return: Отчёт: результаты раннеров и итог.
+    """
+    fakes = {
+        "local_diffusion": LocalDiffusionFake(profile, seed=1),
+        "kolersky": KolerskyFake(profile, seed=2),
+        "bfl": FluxFake(profile, seed=3),
+        "gemini": GeminiFake(Profile(latency=profile.latency, generation_time=profile.latency,
+                                     failure_rate=profile.failure_rate), seed=4),
+        "telegram": TelegramFake(Profile(latency=profile.latency), seed=5),
+    }
+    for fake in fakes.values():
+        await fake.start()
+
+    storage = tempfile.mkdtemp(prefix="utriskra-bench-")
+    configure_environment(storage, fakes, _free_port())
+
+    # Модули проекта импортируются только после настройки окружения
+    from config import MIDJOURNEY_CALLBACK_HOST, MIDJOURNEY_CALLBACK_PORT, MIDJOURNEY_CALLBACK_URL
+    from services.http_client import close_clients
+    from services.midjourney_callback import start_callback_receiver, stop_callback_receiver
+    from utils.database import close_database, initialize_database
+    try:
+        functions = load_runners(runners)
+    except SystemExit:
+        for fake in fakes.values():
+            await fake.stop()
+        shutil.rmtree(storage, ignore_errors=True)
+        raise
+
+    initialize_database()
+    await start_callback_receiver(MIDJOURNEY_CALLBACK_URL, host=MIDJOURNEY_CALLBACK_HOST, port=MIDJOURNEY_CALLBACK_PORT)
+
+    results = []
+    start = _snapshot(fakes)
+    try:
+        for iteration in range(1, repeat + 1):
+            if concurrent:
+                async def timed(name):
+                    started_at = time.perf_counter()
+                    await functions[name]()
+                    return name, round(time.perf_counter() - started_at, 3)
+
+                before = _snapshot(fakes)
+                timings = await asyncio.gather(*(timed(name) for name in runners))
+                result = _measure("all", before, _snapshot(fakes), fakes)
+                result.update(iteration=iteration, runner_wall_s=dict(timings))
+                results.append(result)
+            else:
+                for name in runners:
+                    before = _snapshot(fakes)
+                    await functions[name]()
+                    result = _measure(name, before, _snapshot(fakes), fakes)
+                    result["iteration"] = iteration
+                    results.append(result)
+    finally:
+        total = _measure("total", start, _snapshot(fakes), fakes)
+        await stop_callback_receiver()
+        await close_clients()
+        close_database()
+        for fake in fakes.values():
+            await fake.stop()
+        shutil.rmtree(storage, ignore_errors=True)
+
+    total["backend_failures"] = {name: fake.failures for name, fake in fakes.items() if fake.failures}
+    total["telegram_uploads"] = fakes["telegram"].uploads
+    return {
+        "profile": vars(profile),
+        "concurrent": concurrent,
+        "results": results,
+        "total": total,
+    }
+
+
+def print_report(report: dict):
+    header = f"{'runner':<18}{'wall, s':>10}{'cpu, s':>10}{'rss, MB':>10}{'sent':>6}  requests"
+    print(header)
+    print("-" * len(header))
+    for row in report["results"] + [report["total"]]:
+        requests = ", ".join(f"{backend}={count}" for backend, count in row["requests"].items())
+        print(f"{row['runner']:<18}{row['wall_s']:>10.2f}{row['cpu_s']:>10.2f}{row['rss_peak_mb']:>10.1f}"
+              f"{row['telegram_sent']:>6}  {requests}")
+        if "runner_wall_s" in row:
+            print("    " + ", ".join(f"{name}={wall:.2f}s" for name, wall in row["runner_wall_s"].items()))
+    if report["total"]["backend_failures"]:
+        print(f"Отказы бэкендов: {report['total']['backend_failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк раннеров на поддельных бэкендах")
+    parser.add_argument("--runners", default=",".join(RUNNERS),
+                        help=f"Раннеры через запятую (по умолчанию все: {', '.join(RUNNERS)})")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка каждого HTTP-ответа, сек")
+    parser.add_argument("--generation-time", type=float, default=1.0, help="Время одной генерации, сек")
+    parser.add_argument("--queue-depth", type=int, default=0, help="Чужих задач в очереди бэкендов при старте")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Доля отказов бэкендов (0-1)")
+    parser.add_argument("--workers", type=int, default=1, help="Параллельных генераций на бэкенд")
+    parser.add_argument("--concurrent", action="store_true", help="Запускать раннеры одновременно")
+    parser.add_argument("--repeat", type=int, default=1, help="Сколько раз повторить набор раннеров")
+    parser.add_argument("--json", dest="json_path", help="Сохранить отчёт в JSON (для CI)")
+    parser.add_argument("--verbose", action="store_true", help="Показывать логи раннеров")
+    args = parser.parse_args()
+
+    runners = [name.strip() for name in args.runners.split(",") if name.strip()]
+    unknown = [name for name in runners if name not in RUNNERS]
+    if unknown:
+        parser.error(f"Неизвестные раннеры: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    profile = Profile(
+        latency=args.latency,
+        generation_time=args.generation_time,
+        queue_depth=args.queue_depth,
+        failure_rate=args.failure_rate,
+        workers=args.workers,
+    )
+    report = asyncio.run(run_benchmark(runners, profile, concurrent=args.concurrent, repeat=args.repeat))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
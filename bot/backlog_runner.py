@@ -0,0 +1,47 @@
+import os
+import asyncio
+import sys
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import TARGET_CHAT_ID
+from utils.database import get_next_backlog_item, initialize_database, mark_backlog_used
+from utils.telegram_utils import create_bot, send_photo_cached
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def send_backlog_story():
+    """
+    Публикация изображения из запаса (например, неопубликованной ячейки сетки Midjourney).
+    """
+    bot = create_bot()
+
+    try:
+        item = await get_next_backlog_item()
+        if item is None:
+            logger.info("Запас изображений пуст, публиковать нечего.")
+            return
+
+        if not os.path.exists(item["delivery_path"]):
+            # Без файла запись никогда не опубликуется — снимаем её, чтобы не блокировать очередь
+            await mark_backlog_used(item["id"])
+            raise FileNotFoundError(f"Файл из запаса не найден: {item['delivery_path']}")
+
+        logger.info(f"Публикация изображения из запаса ({item['source']}, {item['date']}): {item['generated_prompt']}")
+        await send_photo_cached(bot, TARGET_CHAT_ID, item["delivery_path"])
+        # Отмечаем только после того, как Telegram принял отправку: при ошибке изображение останется в запасе
+        await mark_backlog_used(item["id"])
+        logger.info("Изображение успешно отправлено!")
+    except Exception as e:
+        logger.error(f"Ошибка: {e}")
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    initialize_database()
+    asyncio.run(send_backlog_story())
@@ -7,104 +7,66 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from telethon import TelegramClient
-from telethon.tl.types import MessageMediaPhoto
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from config import TELETHON_API_ID, TELETHON_API_HASH, TELETHON_PEER, TELEGRAM_TOKEN, TARGET_CHAT_ID
+from config import TELETHON_API_ID, TELETHON_API_HASH, TELETHON_PEER, TARGET_CHAT_ID
 from services.midjourney_service import MidjourneyService
-from utils.image_utils import create_image_path, create_video_path, download_video
+from utils.stage_graph import StageGraph
+from utils.reaction_index import top_reacted, update_reaction_index
+from utils.image_utils import create_video_path, download_video
+from utils.telegram_utils import create_bot, send_photo_cached, send_video_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def get_most_popular_image():
+SESSION_FILE = '/home/user/UtrIskra/best_image_session'
+
+
+async def connect_telethon() -> TelegramClient:
+    """
+    Запускает клиент Telethon для чтения группы.
+    При первом запуске требуется интерактивная авторизация,
+    затем сессия сохраняется и используется автоматически.
+    """
+    # Используем абсолютный путь к файлу сессии, чтобы избежать проблем с рабочей директорией
+    logger.info(f"Используется файл сессии: {SESSION_FILE}.session")
+    logger.info(f"Файл сессии существует: {os.path.exists(SESSION_FILE + '.session')}")
+    client = TelegramClient(SESSION_FILE, TELETHON_API_ID, TELETHON_API_HASH)
+    # При первом запуске потребуется ввести номер телефона и код подтверждения
+    await client.start()
+    logger.info("Telethon клиент запущен")
+    return client
+
+
+async def get_most_popular_image(client: TelegramClient, entity):
     """
     Анализирует сообщения в Telegram-группе за последнюю неделю
     и находит изображение с наибольшим количеством реакций.
+    :param client: Подключённый клиент Telethon.
+    :param entity: Группа, в которой ищется изображение.
     """
-    # Создаём клиент Telethon для чтения сообщений
-    # При первом запуске требуется интерактивная авторизация,
-    # затем сессия сохраняется и используется автоматически
-    # Используем абсолютный путь к файлу сессии, чтобы избежать проблем с рабочей директорией
-    # Всегда используем корневую директорию проекта для хранения сессии
-    session_file = '/home/user/UtrIskra/best_image_session'
-    logger.info(f"Используется файл сессии: {session_file}.session")
-    logger.info(f"Файл сессии существует: {os.path.exists(session_file + '.session')}")
-    client = TelegramClient(session_file, TELETHON_API_ID, TELETHON_API_HASH)
+    # Вычисляем дату недельной давности (даты сообщений Telethon в UTC)
+    week_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
+    logger.info(f"Поиск изображений с {week_ago.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    try:
-        # Авторизуемся через пользовательский аккаунт
-        # При первом запуске потребуется ввести номер телефона и код подтверждения
-        # Затем сессия сохранится в файл best_image_session.session
-        await client.start()
-        logger.info("Telethon клиент запущен")
-
-        # Получаем целевой чат/группу (преобразуем в int для числовых ID)
-        peer_id = int(TELETHON_PEER) if TELETHON_PEER.lstrip('-').isdigit() else TELETHON_PEER
-        entity = await client.get_entity(peer_id)
-        logger.info(f"Подключение к группе: {entity.title if hasattr(entity, 'title') else TELETHON_PEER}")
-
-        # Вычисляем дату недельной давности
-        week_ago = datetime.datetime.now() - datetime.timedelta(days=7)
-        logger.info(f"Поиск изображений с {week_ago.strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Список для хранения сообщений с фото и их реакциями
-        images_with_reactions = []
-
-        # Получаем сообщения за последнюю неделю
-        async for message in client.iter_messages(entity, offset_date=week_ago, limit=None):
-            # Проверяем, что это фото
-            if message.media and isinstance(message.media, MessageMediaPhoto):
-                # Получаем реакции
-                reactions_count = 0
-                if message.reactions:
-                    # Подсчитываем общее количество реакций
-                    for reaction in message.reactions.results:
-                        reactions_count += reaction.count
-
-                # Сохраняем информацию о сообщении
-                images_with_reactions.append({
-                    'message_id': message.id,
-                    'date': message.date,
-                    'reactions_count': reactions_count,
-                    'message': message
-                })
-
-                logger.info(
-                    f"Найдено изображение: ID {message.id}, "
-                    f"Дата: {message.date.strftime('%Y-%m-%d %H:%M')}, "
-                    f"Реакций: {reactions_count}"
-                )
-
-        logger.info(f"Всего найдено изображений: {len(images_with_reactions)}")
-
-        # Находим изображение с максимальным количеством реакций
-        if not images_with_reactions:
-            logger.info("Не найдено изображений с реакциями за последнюю неделю")
-            return None
-
-        # Сортируем по количеству реакций
-        best_image = max(images_with_reactions, key=lambda x: x['reactions_count'])
-
-        # Если нет реакций вообще, не обрабатываем
-        if best_image['reactions_count'] == 0:
-            logger.info("Все изображения имеют 0 реакций. Пропускаем обработку.")
-            return None
-
-        logger.info(
-            f"\nСамое популярное изображение:\n"
-            f"  ID: {best_image['message_id']}\n"
-            f"  Дата: {best_image['date'].strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"  Реакций: {best_image['reactions_count']}"
-        )
+    # Дочитываем в индекс только новые сообщения и обновляем реакции за неделю
+    await update_reaction_index(client, entity, str(TELETHON_PEER), since=week_ago)
 
-        return best_image
+    # Изображение с максимальным количеством реакций (фото без реакций не учитываются)
+    top = await top_reacted(str(TELETHON_PEER), since=week_ago, limit=1)
+    if not top:
+        logger.info("Не найдено изображений с реакциями за последнюю неделю")
+        return None
 
-    finally:
-        await client.disconnect()
-        logger.info("Telethon клиент отключен")
+    best_image = top[0]
+    logger.info(
+        f"\nСамое популярное изображение:\n"
+        f"  ID: {best_image['message_id']}\n"
+        f"  Дата: {best_image['date'].strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"  Реакций: {best_image['reactions_count']}"
+    )
+
+    return best_image
 
 
 async def send_best_image_video_story():
@@ -127,119 +89,111 @@ async def send_best_image_video_story():
         )
         return
 
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = create_bot()
 
     try:
-        # Находим самое популярное изображение
-        best_image = await get_most_popular_image()
-
-        if best_image is None:
-            logger.info("Нет подходящих изображений для обработки")
-            return
-
-        # Формируем сообщение об оживлении
-        message_text = (
-            f"🎬 Оживление популярного изображения!\n\n"
-            f"📊 Статистика:\n"
-            f"• ID сообщения: {best_image['message_id']}\n"
-            f"• Дата публикации: {best_image['date'].strftime('%d.%m.%Y %H:%M')}\n"
-            f"• Количество реакций: {best_image['reactions_count']}\n\n"
-            f"⏳ Начинаю создание видео из этого изображения..."
-        )
-
-        # Отправляем уведомление в группу
-        await bot.send_message(chat_id=TARGET_CHAT_ID, text=message_text)
-        logger.info("Уведомление о создании видео отправлено!")
-
-        # Скачивание изображения из Telegram
-        logger.info("Скачивание популярного изображения...")
-        image_path = create_image_path(prefix="best_image")
-
-        # Повторно подключаемся к Telethon для скачивания
-        session_file = '/home/user/UtrIskra/best_image_session'
-        client = TelegramClient(session_file, TELETHON_API_ID, TELETHON_API_HASH)
-        await client.start()
-
+        # Одна сессия Telethon: поиск по индексу реакций и скачивание изображения в память
+        client = await connect_telethon()
         try:
-            # Получаем сообщение по ID
+            # Получаем целевой чат/группу (преобразуем в int для числовых ID)
             peer_id = int(TELETHON_PEER) if TELETHON_PEER.lstrip('-').isdigit() else TELETHON_PEER
-            message = await client.get_messages(peer_id, ids=best_image['message_id'])
-
-            # Скачиваем изображение
-            await client.download_media(message, file=image_path)
-            logger.info(f"Изображение скачано: {image_path}")
+            entity = await client.get_entity(peer_id)
+            logger.info(f"Подключение к группе: {entity.title if hasattr(entity, 'title') else TELETHON_PEER}")
+
+            # Находим самое популярное изображение
+            best_image = await get_most_popular_image(client, entity)
+            if best_image is None:
+                logger.info("Нет подходящих изображений для обработки")
+                return
+
+            # Скачивание изображения из Telegram сразу в память
+            logger.info("Скачивание популярного изображения...")
+            message = await client.get_messages(entity, ids=best_image['message_id'])
+            if message is None:
+                logger.info("Сообщение с изображением удалено, пропускаем обработку")
+                return
+            image_data = await client.download_media(message, file=bytes)
+            logger.info(f"Изображение скачано: {len(image_data)} байт")
         finally:
             await client.disconnect()
+            logger.info("Telethon клиент отключен")
 
-        # Отправляем исходное изображение в группу
-        logger.info("Отправка исходного изображения в группу...")
-        sent_photo = await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
-        logger.info("Исходное изображение отправлено!")
-
-        # Загружаем изображение на catbox.moe для получения публичного URL
-        logger.info("Загрузка изображения на catbox.moe...")
-        import requests
-        with open(image_path, 'rb') as f:
-            upload_response = requests.post(
-                'https://catbox.moe/user/api.php',
-                data={'reqtype': 'fileupload'},
-                files={'fileToUpload': f}
-            )
-        upload_response.raise_for_status()
-        image_url = upload_response.text.strip()
-        logger.info(f"Публичный URL изображения: {image_url}")
-
-        # Инициализируем сервис Midjourney
         midjourney_service = MidjourneyService()
 
-        # Шаг 1: Загружаем изображение в Midjourney через image-to-image с минимальными изменениями
-        logger.info("Загрузка изображения в Midjourney (image-to-image)...")
-
-        # Создаем image-to-image с минимальным промптом для обработки изображения (с повторами)
-        image_result = midjourney_service.execute_with_retry(
-            task_func=lambda: midjourney_service.create_image_to_image_task(
-                file_url=image_url,
-                prompt="high quality, detailed",
-                aspect_ratio="16:9"
-            ),
-            task_name="image-to-image",
-            max_retries=2,
-            retry_delay=300  # 5 минут
-        )
-
-        # Шаг 2: Создаем видео используя обработанное изображение (с повторами)
-        logger.info("Создание видео из обработанного изображения...")
-
-        video_result = midjourney_service.execute_with_retry(
-            task_func=lambda: midjourney_service.create_video_task(
-                file_url=image_url,
-                prompt="gentle movement, cinematic camera motion",
-                motion="high",
-                video_batch_size=1,
-                task_type="image-to-video-hd"  # HD качество
-            ),
-            task_name="image-to-video-hd",
-            max_retries=2,
-            retry_delay=300  # 5 минут
-        )
-
-        # Получаем URL видео
-        video_urls = video_result.get("data", {}).get("output", {}).get("video_urls", [])
-        if not video_urls:
-            raise ValueError(f"Не удалось получить URL видео. Структура ответа: {video_result}")
-
-        video_url = video_urls[0]
-        logger.info(f"Получен URL видео: {video_url}")
+        async def notify():
+            # Формируем сообщение об оживлении
+            message_text = (
+                f"🎬 Оживление популярного изображения!\n\n"
+                f"📊 Статистика:\n"
+                f"• ID сообщения: {best_image['message_id']}\n"
+                f"• Дата публикации: {best_image['date'].strftime('%d.%m.%Y %H:%M')}\n"
+                f"• Количество реакций: {best_image['reactions_count']}\n\n"
+                f"⏳ Начинаю создание видео из этого изображения..."
+            )
 
-        # Скачивание видео
-        video_path = create_video_path(prefix="best_image_video")
-        logger.info("Скачивание видео...")
-        download_video(video_url, video_path)
+            # Отправляем уведомление в группу
+            await bot.send_message(chat_id=TARGET_CHAT_ID, text=message_text)
+            logger.info("Уведомление о создании видео отправлено!")
+
+        async def send_image():
+            # Отправляем исходное изображение в группу
+            logger.info("Отправка исходного изображения в группу...")
+            await send_photo_cached(bot, TARGET_CHAT_ID, image_data)
+            logger.info("Исходное изображение отправлено!")
+
+        async def upload() -> str:
+            # Загружаем те же байты напрямую в API Midjourney для получения публичного URL
+            image_url = await midjourney_service.upload_image_bytes(image_data, extension="jpeg")
+            logger.info(f"Публичный URL изображения: {image_url}")
+            return image_url
+
+        async def generate_video(image_url: str) -> str:
+            # Создаем видео из исходного изображения (с повторами)
+            logger.info("Создание видео из изображения...")
+            video_result = await midjourney_service.execute_with_retry(
+                task_func=lambda: midjourney_service.create_video_task(
+                    file_url=image_url,
+                    prompt="gentle movement, cinematic camera motion",
+                    motion="high",
+                    video_batch_size=1,
+                    task_type="image-to-video-hd"  # HD качество
+                ),
+                task_name="image-to-video-hd",
+                max_retries=2,
+                retry_delay=300  # 5 минут
+            )
 
-        # Отправка видео в Telegram
-        logger.info("Отправка видео в Telegram...")
-        await bot.send_video(chat_id=TARGET_CHAT_ID, video=FSInputFile(video_path))
-        logger.info("✅ Видео успешно отправлено!")
+            # Получаем URL видео
+            video_urls = video_result.get("data", {}).get("output", {}).get("video_urls", [])
+            if not video_urls:
+                raise ValueError(f"Не удалось получить URL видео. Структура ответа: {video_result}")
+
+            video_url = video_urls[0]
+            logger.info(f"Получен URL видео: {video_url}")
+            return video_url
+
+        async def download(video_url: str) -> str:
+            # Скачивание видео
+            video_path = create_video_path(prefix="best_image_video")
+            logger.info("Скачивание видео...")
+            await download_video(video_url, video_path)
+            return video_path
+
+        async def send_video(video_path: str):
+            # Отправка видео в Telegram
+            logger.info("Отправка видео в Telegram...")
+            await send_video_cached(bot, TARGET_CHAT_ID, video_path)
+            logger.info("✅ Видео успешно отправлено!")
+
+        # Видео создаётся из исходного изображения и готовится параллельно с отправкой сообщений в группу
+        graph = StageGraph(name="best_image_video")
+        graph.add("notified", notify)
+        graph.add("image_sent", send_image, after=("notified",))
+        graph.add("uploaded", upload)
+        graph.add("video", generate_video, inputs=("uploaded",))
+        graph.add("video_downloaded", download, inputs=("video",))
+        graph.add("sent", send_video, inputs=("video_downloaded",), after=("image_sent",))
+        await graph.run()
 
     except Exception as e:
         logger.error(f"Ошибка: {e}", exc_info=True)
@@ -1,21 +1,21 @@
 import os
 import asyncio
+import base64
 import datetime
 import sys
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from aiogram.client.session.aiohttp import AiohttpSession
 from aiohttp import ClientTimeout
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.dalle_service import DalleService
 from services.gemini_service import GeminiService
+from utils.concurrency import run_blocking
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, create_image_path, download_image, save_image_from_base64
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.image_utils import create_image_path, download_bytes, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -27,27 +27,22 @@ async def send_dalle_story():
     """
     Генерация и отправка изображения через DALL·E API.
     """
-    session = AiohttpSession(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
-    bot = Bot(token=TELEGRAM_TOKEN, session=session)
+    bot = create_bot(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
     dalle_service = DalleService()
     gemini_service = GeminiService()
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE, max_theme=50)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=1.0
-        )
+        # Промпт из дневного пула или, если пул пуст, отдельным запросом к Gemini
+        prompts = await draw_prompt("dalle", PROMPTS_FILE, gemini_service, temperature=1.0, max_theme=50)
+        system_prompt, user_prompt = prompts["system_prompt"], prompts["user_prompt"]
+        generated_prompt = prompts["generated_prompt"]
 
         logger.info(f"Сгенерированный промпт для DALL·E: {generated_prompt}")
 
-        # Генерация изображения через DALL·E
-        image_data, data_type = dalle_service.generate_image(
+        # Генерация изображения через DALL·E (синхронный клиент — в отдельном потоке)
+        image_data, data_type = await run_blocking(
+            "openai",
+            dalle_service.generate_image,
             prompt=generated_prompt,
 #            model="dall-e-3",
             #model="gpt-image-1.5",
@@ -63,13 +58,13 @@ async def send_dalle_story():
         raw_image_path = create_image_path(prefix="dalle_image")
         logger.info("Сохранение изображения...")
         if data_type == "b64_json":
-            save_image_from_base64(image_data, raw_image_path)
+            image_bytes = base64.b64decode(image_data)
         else:
-            download_image(image_data, raw_image_path)
+            image_bytes = await download_bytes(image_data)
 
         # Добавление даты на изображение
         current_date_text = "D " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(raw_image_path, current_date_text)
+        delivery_path = await process_image(image_bytes, raw_image_path, date_text=current_date_text)
 
         # Сохранение в базу данных
         save_to_database(
@@ -84,7 +79,7 @@ async def send_dalle_story():
         logger.info("Отправка изображения в Telegram...")
         for attempt in range(3):
             try:
-                await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(raw_image_path))
+                await send_photo_cached(bot, TARGET_CHAT_ID, delivery_path)
                 logger.info("Изображение успешно отправлено!")
                 break
             except Exception as e:
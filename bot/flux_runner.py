@@ -6,14 +6,13 @@ import sys
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.flux_service import FluxService
 from services.gemini_service import GeminiService  # Вернул импорт GeminiService
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, create_image_path, download_image
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.image_utils import create_image_path, download_bytes, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -26,21 +25,15 @@ async def send_flux_story():
     """
     Генерация и отправка изображения через Flux API.
     """
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = create_bot()
     flux_service = FluxService()
     gemini_service = GeminiService()  # Создаем экземпляр GeminiService
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.7
-        )
+        # Промпт из дневного пула или, если пул пуст, отдельным запросом к Gemini
+        prompts = await draw_prompt("flux", PROMPTS_FILE, gemini_service, temperature=0.7)
+        system_prompt, user_prompt = prompts["system_prompt"], prompts["user_prompt"]
+        generated_prompt = prompts["generated_prompt"]
 
         logger.info(f"Сгенерированный промпт для Flux: {generated_prompt}")
 
@@ -51,10 +44,10 @@ async def send_flux_story():
 
         # Сохранение изображения
         image_path = create_image_path(prefix="flux_story")
-        download_image(image_url, image_path)
+        image_data = await download_bytes(image_url)
 
         current_date_text = "F " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(image_path, current_date_text)
+        delivery_path = await process_image(image_data, image_path, date_text=current_date_text)
 
         # Сохранение в базу данных
         save_to_database(
@@ -67,7 +60,7 @@ async def send_flux_story():
 
         # Отправка изображения в Telegram
         logger.info("Отправка изображения в Telegram...")
-        await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
+        await send_photo_cached(bot, TARGET_CHAT_ID, delivery_path)
         logger.info("Изображение успешно отправлено!")
     except Exception as e:
         logger.error(f"Ошибка: {e}")
@@ -1,19 +1,20 @@
 import os
 import asyncio
+import base64
 import datetime
 import sys
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.gemini_service import GeminiService
 from services.kandinsky_service import KandinskyService
+from utils.concurrency import run_blocking
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, save_image_from_base64, create_image_path
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.image_utils import create_image_path, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -23,21 +24,15 @@ PROMPTS_FILE = os.path.join(PROMPTS_DIR, "kandinsky_runner.txt")  # Путь к
 
 async def send_kandinsky_story():
     """Генерация и отправка изображения через Kandinsky API."""
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = create_bot()
     gemini_service = GeminiService()
     kandinsky_service = KandinskyService()
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=1.0
-        )
+        # Промпт из дневного пула или, если пул пуст, отдельным запросом к Gemini
+        prompts = await draw_prompt("kandinsky", PROMPTS_FILE, gemini_service, temperature=1.0)
+        system_prompt, user_prompt = prompts["system_prompt"], prompts["user_prompt"]
+        generated_prompt = prompts["generated_prompt"]
 
         # Проверяем длину промпта
         if len(generated_prompt) > 1000:
@@ -48,21 +43,21 @@ async def send_kandinsky_story():
 
         # Работа с Kandinsky API
         logger.info("Получаем ID модели Kandinsky...")
-        model_id = kandinsky_service.get_model_id()
-        kandinsky_service.check_availability_with_timeout(model_id)
+        # Синхронный клиент выполняется в отдельном потоке, чтобы не останавливать другие раннеры
+        model_id = await run_blocking("kandinsky", kandinsky_service.get_model_id)
+        await run_blocking("kandinsky", kandinsky_service.check_availability_with_timeout, model_id)
 
         logger.info("Генерация изображения через Kandinsky...")
-        uuid = kandinsky_service.generate_image(generated_prompt, model_id)
+        uuid = await run_blocking("kandinsky", kandinsky_service.generate_image, generated_prompt, model_id)
 
         logger.info("Ожидание результата генерации...")
-        base64_image = kandinsky_service.get_image(uuid, attempts=120, delay=10)
+        base64_image = await run_blocking("kandinsky", kandinsky_service.get_image, uuid, attempts=120, delay=10)
 
         # Сохранение изображения
         image_path = create_image_path(prefix="kandinsky_story")
-        save_image_from_base64(base64_image, image_path)
 
         current_date_text = "K " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(image_path, current_date_text)
+        delivery_path = await process_image(base64.b64decode(base64_image), image_path, date_text=current_date_text)
 
         # Сохранение в базу данных
         save_to_database(
@@ -75,7 +70,7 @@ async def send_kandinsky_story():
 
         # Отправка изображения в Telegram
         logger.info("Отправка изображения в Telegram...")
-        await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
+        await send_photo_cached(bot, TARGET_CHAT_ID, delivery_path)
         logger.info("Изображение успешно отправлено!")
     except Exception as e:
         logger.error(f"Ошибка: {e}")
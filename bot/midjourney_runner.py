@@ -1,98 +1,141 @@
 import os
 import asyncio
-import datetime
 import sys
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR, MIDJOURNEY_TILES
 from services.midjourney_service import MidjourneyService
 from services.gemini_service import GeminiService
-from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, create_image_path, download_image, crop_image
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.database import add_to_backlog, initialize_database, save_to_database
+from utils.job_journal import open_job
+from utils.image_utils import create_image_path, download_bytes, save_bytes, split_grid
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_album_cached, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 PROMPTS_FILE = os.path.join(PROMPTS_DIR, "midjourney_runner.txt")  # Путь к файлу с промптами
+JOB_NAME = "midjourney"  # Имя раннера в журнале заданий
 
 async def send_midjourney_story():
     """
     Генерация и отправка вдохновляющего изображения через Midjourney API.
     """
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = create_bot()
     midjourney_service = MidjourneyService()
     gemini_service = GeminiService()
+    job = None
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=1
-        )
-
-        # Удаляем дополнительные символы из промпта
-        if '---' in generated_prompt:
-            generated_prompt = generated_prompt.split('---')[0].strip()
-        else:
-            generated_prompt = generated_prompt.strip()
+        job = await open_job(JOB_NAME)
+
+        async def generate_prompts() -> dict:
+            prompts = await draw_prompt(JOB_NAME, PROMPTS_FILE, gemini_service, temperature=1)
+
+            # Удаляем дополнительные символы из промпта
+            generated_prompt = prompts["generated_prompt"]
+            if '---' in generated_prompt:
+                generated_prompt = generated_prompt.split('---')[0].strip()
+            else:
+                generated_prompt = generated_prompt.strip()
+            return {**prompts, "generated_prompt": generated_prompt}
+
+        prompts = await job.stage("prompt", generate_prompts)
+        generated_prompt = prompts["generated_prompt"]
         logger.info(f"Сгенерированный промпт для Midjourney: {generated_prompt}")
 
-        # Генерация изображения через Midjourney с повторными попытками
-        logger.info("Генерация изображения через Midjourney...")
-        imagine_result = midjourney_service.execute_with_retry(
-            task_func=lambda: midjourney_service.create_imagine_task(generated_prompt, aspect_ratio="16:9"),
-            task_name="text-to-image",
-            max_retries=2,
-            retry_delay=300  # 5 минут
-        )
-
-        # Проверка URL изображения (структура: output.collage.image_url согласно документации)
-        grid_image_url = imagine_result.get("output", {}).get("collage", {}).get("image_url")
-        if not grid_image_url:
-            # Резервный вариант для старой структуры data.output.collage.image_url
-            grid_image_url = imagine_result.get("data", {}).get("output", {}).get("collage", {}).get("image_url")
-        if not grid_image_url:
-            raise ValueError(f"Не удалось получить URL сетки изображений. Структура ответа: {imagine_result}")
-
-        # Скачивание необработанного изображения
-        raw_image_path = create_image_path(prefix="midjourney_story")
-        logger.info("Сохранение необработанного изображения...")
-        download_image(grid_image_url, raw_image_path)
-
-        # Вырезание первого изображения
-        processed_image_path = raw_image_path.replace(".png", "_processed.png")
-        crop_image(raw_image_path, processed_image_path, position=1)
-
-        # Добавление даты на обработанное изображение
-        current_date_text = "M " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(processed_image_path, current_date_text)
+        async def generate_grid() -> str:
+            # Генерация изображения через Midjourney с повторными попытками
+            logger.info("Генерация изображения через Midjourney...")
+            imagine_result = await midjourney_service.execute_with_retry(
+                task_func=lambda: midjourney_service.create_imagine_task(generated_prompt, aspect_ratio="16:9"),
+                task_name="text-to-image",
+                max_retries=2,
+                retry_delay=300,  # 5 минут
+                request_id=job.remote_id("imagine"),
+                on_task_created=job.remote_saver("imagine"),
+            )
+
+            # Проверка URL изображения (структура: output.collage.image_url согласно документации)
+            grid_image_url = imagine_result.get("output", {}).get("collage", {}).get("image_url")
+            if not grid_image_url:
+                # Резервный вариант для старой структуры data.output.collage.image_url
+                grid_image_url = imagine_result.get("data", {}).get("output", {}).get("collage", {}).get("image_url")
+            if not grid_image_url:
+                raise ValueError(f"Не удалось получить URL сетки изображений. Структура ответа: {imagine_result}")
+            return grid_image_url
+
+        grid_image_url = await job.stage("imagine", generate_grid)
+
+        async def download_and_split() -> list:
+            # Скачивание сетки в память и сохранение исходника без перекодирования
+            raw_image_path = create_image_path(prefix="midjourney_story", extension="png")
+            logger.info("Сохранение необработанного изображения...")
+            grid_data = await download_bytes(grid_image_url)
+            await save_bytes(grid_data, raw_image_path)
+
+            # Все четыре ячейки сетки вырезаются и подписываются датой за одно декодирование
+            image_paths = [create_image_path(prefix=f"midjourney_story_processed_{position}") for position in range(1, 5)]
+            current_date_text = "M " + job.date.strftime("%d.%m.%Y")
+            delivery_paths = await split_grid(grid_data, image_paths, date_text=current_date_text)
+            return [
+                {"image_path": image_path, "delivery_path": delivery_path}
+                for image_path, delivery_path in zip(image_paths, delivery_paths)
+            ]
+
+        tiles = await job.stage("tiles", download_and_split)
+
+        def save_tiles():
+            # Каждая ячейка сохраняется в базу как отдельное изображение
+            for tile in tiles:
+                save_to_database(
+                    date=job.date.strftime("%Y-%m-%d"),
+                    system_prompt=prompts["system_prompt"],
+                    user_prompt=prompts["user_prompt"],
+                    generated_prompt=generated_prompt,
+                    image_path=tile["image_path"]
+                )
 
         # Сохранение в базу данных
-        save_to_database(
-            date=datetime.datetime.now().strftime("%Y-%m-%d"),
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            generated_prompt=generated_prompt,
-            image_path=processed_image_path
-        )
-
-        # Отправка изображения в Telegram
-        logger.info("Отправка изображения в Telegram...")
-        await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(processed_image_path))
-        logger.info("Изображение успешно отправлено!")
+        await job.stage("saved", save_tiles)
+
+        async def send():
+            # Отправка изображения в Telegram
+            if MIDJOURNEY_TILES == "album":
+                logger.info("Отправка альбома из четырёх изображений в Telegram...")
+                await send_album_cached(bot, TARGET_CHAT_ID, [tile["delivery_path"] for tile in tiles])
+                logger.info("Альбом успешно отправлен!")
+                return
+
+            logger.info("Отправка изображения в Telegram...")
+            await send_photo_cached(bot, TARGET_CHAT_ID, tiles[0]["delivery_path"])
+            logger.info("Изображение успешно отправлено!")
+
+        await job.stage("sent", send)
+
+        def add_spares():
+            # Остальные ячейки остаются в запасе для других слотов публикации
+            for tile in tiles[1:]:
+                add_to_backlog(
+                    source=JOB_NAME,
+                    date=job.date.strftime("%Y-%m-%d"),
+                    generated_prompt=generated_prompt,
+                    image_path=tile["image_path"],
+                    delivery_path=tile["delivery_path"],
+                )
+            logger.info(f"В запас добавлено изображений: {len(tiles) - 1}")
+
+        if MIDJOURNEY_TILES == "backlog":
+            await job.stage("backlog", add_spares)
+        await job.complete()
     except Exception as e:
         logger.error(f"Ошибка: {e}")
+        if job is not None:
+            await job.fail(str(e))
     finally:
         await bot.session.close()
 
@@ -1,90 +1,96 @@
 import os
 import asyncio
-import datetime
 import sys
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from aiogram.client.session.aiohttp import AiohttpSession
 from aiohttp import ClientTimeout
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
-from services.qwen_service import QwenService
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.gemini_service import GeminiService
+from services.routing import generate_local_image, publish_deadline
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, create_image_path, download_image
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.job_journal import open_job
+from utils.image_utils import create_image_path, download_bytes, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 PROMPTS_FILE = os.path.join(PROMPTS_DIR, "qwen_runner.txt")
+JOB_NAME = "qwen"  # Имя раннера в журнале заданий
 
 
 async def send_qwen_story():
     """
     Генерация и отправка изображения через Qwen-Image API.
     """
-    session = AiohttpSession(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
-    bot = Bot(token=TELEGRAM_TOKEN, session=session)
-    qwen_service = QwenService()
+    bot = create_bot(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
     gemini_service = GeminiService()
+    job = None
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.7
-        )
-
+        job = await open_job(JOB_NAME)
+        prompts = await job.stage("prompt", lambda: draw_prompt(
+            JOB_NAME, PROMPTS_FILE, gemini_service, temperature=0.7
+        ))
+        generated_prompt = prompts["generated_prompt"]
         logger.info(f"Сгенерированный промпт для Qwen: {generated_prompt}")
 
         # Генерация изображения через Qwen API
         logger.info("Генерация изображения через Qwen...")
-        image_url = await qwen_service.generate_image(
+        # При недоступности Qwen генерация передаётся исправной локальной модели
+        image = await job.stage("image", lambda: generate_local_image(
+            "qwen",
             prompt=generated_prompt,
             aspect_ratio="16:9",
-        )
+            job=job,
+            deadline=publish_deadline(job.date),
+        ))
+
+        async def download_and_process() -> dict:
+            # Сохранение изображения
+            image_path = create_image_path(prefix=f"{image['backend']}_story")
+            image_data = await download_bytes(image["image_url"])
 
-        # Сохранение изображения
-        image_path = create_image_path(prefix="qwen_story")
-        download_image(image_url, image_path)
+            current_date_text = f"{image['label']} " + job.date.strftime("%d.%m.%Y")
+            delivery_path = await process_image(image_data, image_path, date_text=current_date_text)
+            return {"image_path": image_path, "delivery_path": delivery_path}
 
-        current_date_text = "Q " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(image_path, current_date_text)
+        files = await job.stage("processed", download_and_process)
 
         # Сохранение в базу данных
-        save_to_database(
-            date=datetime.datetime.now().strftime("%Y-%m-%d"),
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
+        await job.stage("saved", lambda: save_to_database(
+            date=job.date.strftime("%Y-%m-%d"),
+            system_prompt=prompts["system_prompt"],
+            user_prompt=prompts["user_prompt"],
             generated_prompt=generated_prompt,
-            image_path=image_path
-        )
-
-        # Отправка изображения в Telegram с retry
-        logger.info("Отправка изображения в Telegram...")
-        for attempt in range(3):
-            try:
-                await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
-                logger.info("Изображение успешно отправлено!")
-                break
-            except Exception as e:
-                if attempt < 2:
-                    logger.warning(f"Попытка {attempt + 1}/3 не удалась: {e}. Повтор через 10 сек...")
-                    await asyncio.sleep(10)
-                else:
-                    raise
+            image_path=files["image_path"]
+        ))
+
+        async def send():
+            # Отправка изображения в Telegram с retry
+            logger.info("Отправка изображения в Telegram...")
+            for attempt in range(3):
+                try:
+                    await send_photo_cached(bot, TARGET_CHAT_ID, files["delivery_path"])
+                    logger.info("Изображение успешно отправлено!")
+                    break
+                except Exception as e:
+                    if attempt < 2:
+                        logger.warning(f"Попытка {attempt + 1}/3 не удалась: {e}. Повтор через 10 сек...")
+                        await asyncio.sleep(10)
+                    else:
+                        raise
+
+        await job.stage("sent", send)
+        await job.complete()
     except Exception as e:
         logger.error(f"Ошибка: {e}")
+        if job is not None:
+            await job.fail(str(e))
     finally:
         await bot.session.close()
 
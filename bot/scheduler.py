@@ -9,29 +9,113 @@ from bot.flux_runner import send_flux_story
 from bot.yandex_runner import send_yandex_story
 from bot.gemini_image_runner import send_gemini_image_story
 from bot.zimage_runner import send_zimage_story
+from bot.backlog_runner import send_backlog_story
+from config import (
+    BACKLOG_HOURS,
+    MIDJOURNEY_TILES,
+    MIDJOURNEY_CALLBACK_URL,
+    MIDJOURNEY_CALLBACK_HOST,
+    MIDJOURNEY_CALLBACK_PORT,
+    MIDJOURNEY_CALLBACK_TOKEN,
+    METRICS_HOST,
+    METRICS_PORT,
+)
+from services.http_client import close_clients
+from services.midjourney_callback import start_callback_receiver, stop_callback_receiver
+from utils.concurrency import pipeline
+from utils.database import initialize_database, close_database
+from utils.job_journal import unfinished_runners
+from utils.metrics import start_metrics_server, stop_metrics_server
+from utils.prompt_pool import fill_prompt_pool
 import logging
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Раннеры с журналом заданий: имя задания -> функция (для продолжения после перезапуска)
+RESUMABLE_RUNNERS = {
+    "midjourney": send_midjourney_story,
+    "midjourney_video": send_midjourney_video_story,
+    "zimage": send_zimage_story,
+}
+
+
+async def resume_unfinished_jobs(scheduler: AsyncIOScheduler):
+    """
+    Сразу запускает раннеры, задания которых были прерваны перезапуском процесса.
+    Раннер продолжит задание с последнего выполненного этапа и дождётся уже созданной удалённой задачи.
+    """
+    for runner in await unfinished_runners():
+        func = RESUMABLE_RUNNERS.get(runner)
+        if func is None:
+            continue
+        logger.info(f"Найдено незавершённое задание {runner}, продолжаем.")
+        scheduler.add_job(pipeline(runner, func), "date")
+
+
 async def start_scheduler():
     """
     Запускает планировщик задач для отправки историй.
     """
-    scheduler = AsyncIOScheduler()
+    initialize_database()
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if MIDJOURNEY_CALLBACK_URL:
+        # Задачи Midjourney завершаются по колбэку, опрос статуса остаётся резервным
+        await start_callback_receiver(
+            MIDJOURNEY_CALLBACK_URL,
+            host=MIDJOURNEY_CALLBACK_HOST,
+            port=MIDJOURNEY_CALLBACK_PORT,
+            token=MIDJOURNEY_CALLBACK_TOKEN,
+        )
+
+    # Раннеры выполняются как независимые задачи event loop; нагрузку на каждого провайдера
+    # ограничивают семафоры utils.concurrency, а не интервалы между слотами расписания.
+    scheduler = AsyncIOScheduler(job_defaults={
+        "coalesce": True,  # Пропущенные запуски одного раннера схлопываются в один
+        "max_instances": 2,  # Новый запуск не отменяется, если предыдущий ещё выполняется
+        "misfire_grace_time": 15 * 60,  # Запуск, опоздавший не более чем на 15 минут, всё равно выполняется
+    })
+
+    # Промпты на день для всех раннеров одним запросом к Gemini (и сразу при запуске, если пул пуст)
+    scheduler.add_job(pipeline("prompt_pool", fill_prompt_pool), "cron", hour=6, minute=30)
+    scheduler.add_job(pipeline("prompt_pool", fill_prompt_pool), "date")
 
     # Добавление задач для каждого раннера
-    scheduler.add_job(send_daily_story, "cron", hour=7, minute=0)
-    scheduler.add_job(send_kandinsky_story, "cron", hour=8, minute=0)
-    scheduler.add_job(send_midjourney_story, "cron", hour=9, minute=0)
-    scheduler.add_job(send_dalle_story, "cron", hour=10, minute=0)
-    scheduler.add_job(send_flux_story, "cron", hour=11, minute=0)
-    scheduler.add_job(send_yandex_story, "cron", hour=12, minute=0)
-    scheduler.add_job(send_gemini_image_story, "cron", hour=13, minute=0)
-    scheduler.add_job(send_midjourney_video_story, "cron", hour=14, minute=0)
-    scheduler.add_job(send_best_image_video_story, "cron", hour=15, minute=0)
-    scheduler.add_job(send_zimage_story, "cron", hour=16, minute=0)
+    scheduler.add_job(pipeline("daily", send_daily_story), "cron", hour=7, minute=0)
+    scheduler.add_job(pipeline("kandinsky", send_kandinsky_story), "cron", hour=8, minute=0)
+    scheduler.add_job(pipeline("midjourney", send_midjourney_story), "cron", hour=9, minute=0)
+    scheduler.add_job(pipeline("dalle", send_dalle_story), "cron", hour=10, minute=0)
+    scheduler.add_job(pipeline("flux", send_flux_story), "cron", hour=11, minute=0)
+    scheduler.add_job(pipeline("yandex", send_yandex_story), "cron", hour=12, minute=0)
+    scheduler.add_job(pipeline("gemini_image", send_gemini_image_story), "cron", hour=13, minute=0)
+    scheduler.add_job(pipeline("midjourney_video", send_midjourney_video_story), "cron", hour=14, minute=0)
+    scheduler.add_job(pipeline("best_image_video", send_best_image_video_story), "cron", hour=15, minute=0)
+    scheduler.add_job(pipeline("zimage", send_zimage_story), "cron", hour=16, minute=0)
+
+    # Дополнительные слоты публикации изображений из запаса
+    if MIDJOURNEY_TILES == "backlog" and not BACKLOG_HOURS:
+        logger.warning(
+            "MIDJOURNEY_TILES=backlog, но BACKLOG_HOURS не задан: ячейки Midjourney копятся в запасе "
+            "и не публикуются. Задайте BACKLOG_HOURS или MIDJOURNEY_TILES=single/album."
+        )
+    for hour in BACKLOG_HOURS:
+        scheduler.add_job(pipeline("backlog", send_backlog_story), "cron", hour=hour, minute=0)
 
     scheduler.start()
     logger.info("Планировщик запущен.")
+    await resume_unfinished_jobs(scheduler)
+    return scheduler
+
+
+async def stop_scheduler(scheduler: AsyncIOScheduler):
+    """
+    Останавливает планировщик, приёмник колбэков и сервер метрик, закрывает общие HTTP-клиенты и соединение с базой данных.
+    """
+    scheduler.shutdown(wait=False)
+    await stop_callback_receiver()
+    await stop_metrics_server()
+    await close_clients()
+    close_database()
+    logger.info("Планировщик остановлен.")
@@ -1,14 +1,13 @@
 import os
 import asyncio
 import datetime
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.stability_service import StabilityService
 from services.gemini_service import GeminiService
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, create_image_path
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.image_utils import create_image_path, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -21,21 +20,15 @@ async def send_daily_story():
     """
     Генерация и отправка изображения через Stability API в Telegram-группу.
     """
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = create_bot()
     gemini_service = GeminiService()
     stability_service = StabilityService()
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.7
-        )
+        # Промпт из дневного пула или, если пул пуст, отдельным запросом к Gemini
+        prompts = await draw_prompt("stability", PROMPTS_FILE, gemini_service, temperature=0.7)
+        system_prompt, user_prompt = prompts["system_prompt"], prompts["user_prompt"]
+        generated_prompt = prompts["generated_prompt"]
 
         logger.info(f"Сгенерированный промпт для Stability: {generated_prompt}")
 
@@ -43,14 +36,9 @@ async def send_daily_story():
         logger.info("Генерация изображения через Stability AI...")
         image_path = create_image_path(prefix="stability_story")
         image_content = await stability_service.generate_image(generated_prompt)
-        with open(image_path, "wb") as file:
-            file.write(image_content)
-
-        logger.info(f"Изображение сохранено в {image_path}")
-
         # Добавление даты на изображение
         current_date_text = "S " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(image_path, current_date_text)
+        delivery_path = await process_image(image_content, image_path, date_text=current_date_text)
 
         # Сохранение в базу данных
         save_to_database(
@@ -63,7 +51,7 @@ async def send_daily_story():
 
         # Отправка изображения в Telegram
         logger.info("Отправка изображения в Telegram...")
-        await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
+        await send_photo_cached(bot, TARGET_CHAT_ID, delivery_path)
         logger.info("Изображение успешно отправлено!")
     except Exception as e:
         logger.error(f"Ошибка: {e}")
@@ -1,21 +1,21 @@
 import os
 import asyncio
+import base64
 import datetime
 import sys
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from aiogram.client.session.aiohttp import AiohttpSession
 from aiohttp import ClientTimeout
-from config import TELEGRAM_TOKEN, TARGET_CHAT_ID, PROMPTS_DIR
+from config import TARGET_CHAT_ID, PROMPTS_DIR
 from services.gemini_service import GeminiService
 from services.yandex_service import YandexArtService
+from utils.concurrency import run_blocking
 from utils.database import initialize_database, save_to_database
-from utils.image_utils import add_date_to_image, save_image_from_base64, create_image_path
-from utils.prompt_utils import generate_dynamic_prompt
+from utils.image_utils import create_image_path, process_image
+from utils.prompt_pool import draw_prompt
+from utils.telegram_utils import create_bot, send_photo_cached
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -25,35 +25,27 @@ PROMPTS_FILE = os.path.join(PROMPTS_DIR, "yandex_runner.txt")  # Путь к ф
 
 async def send_daily_story():
     """Генерация и отправка вдохновляющей картинки в Telegram-группу."""
-    session = AiohttpSession(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
-    bot = Bot(token=TELEGRAM_TOKEN, session=session)
+    bot = create_bot(timeout=ClientTimeout(total=300, sock_connect=30, sock_read=300))
     gemini_service = GeminiService()
     yandex_art_service = YandexArtService()
 
     try:
-        # Читаем промпты из файла
-        system_prompt, user_prompt = generate_dynamic_prompt(PROMPTS_FILE)
-
-        logger.info(f"Системный промпт: {system_prompt}")
-        logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
-        generated_prompt = gemini_service.generate_prompt(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.9
-        )
+        # Промпт из дневного пула или, если пул пуст, отдельным запросом к Gemini
+        prompts = await draw_prompt("yandex", PROMPTS_FILE, gemini_service, temperature=0.9)
+        system_prompt, user_prompt = prompts["system_prompt"], prompts["user_prompt"]
+        generated_prompt = prompts["generated_prompt"]
 
         logger.info(f"Сгенерированный промпт: {generated_prompt}")
 
         # Генерация изображения через Yandex-Art
         logger.info("Генерация изображения через Yandex-Art...")
-        base64_image = yandex_art_service.generate_image(generated_prompt)
+        base64_image = await run_blocking("yandex", yandex_art_service.generate_image, generated_prompt)
 
         # Сохранение изображения
         image_path = create_image_path(prefix="yandex_story")
-        save_image_from_base64(base64_image, image_path)
 
         current_date_text = "Y " + datetime.datetime.now().strftime("%d.%m.%Y")
-        add_date_to_image(image_path, current_date_text)
+        delivery_path = await process_image(base64.b64decode(base64_image), image_path, date_text=current_date_text)
 
         # Сохранение в базу данных
         save_to_database(
@@ -68,7 +60,7 @@ async def send_daily_story():
         logger.info("Отправка изображения в Telegram-группу...")
         for attempt in range(3):
             try:
-                await bot.send_photo(chat_id=TARGET_CHAT_ID, photo=FSInputFile(image_path))
+                await send_photo_cached(bot, TARGET_CHAT_ID, delivery_path)
                 logger.info("Изображение успешно отправлено!")
                 break
             except Exception as e:
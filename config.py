@@ -11,12 +11,19 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # Telegram Bot Token
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Свой сервер Bot API (по умолчанию api.telegram.org)
 
 # Target Group Chat ID
 TARGET_CHAT_ID = os.getenv("TARGET_CHAT_ID")
 
 PROXY_URL = os.getenv("PROXY_URL")
+GEMINI_REQUIRE_PROXY = os.getenv("GEMINI_REQUIRE_PROXY", "1") != "0"  # 0 — разрешить запросы к Gemini без прокси (бенчмарки)
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-3.5-flash:generateContent",
+)
 GEMINI_API_KEYS = os.getenv("GEMINI_API_KEYS").split(",")
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() == "true"  # Дублировать запрос на второй ключ
 
 # Telethon API Credentials
 TELETHON_API_ID = os.getenv("TELETHON_API_ID")  # Ваш API ID для Telethon
@@ -29,15 +36,66 @@ IMAGES_PATH = os.path.join(BASE_STORAGE_PATH, "images")  # Путь для из
 DB_PATH = os.getenv("DB_PATH")  # Путь к базе данных
 FONTS_PATH = os.getenv("FONTS_PATH")  # Абсолютный путь к шрифту Roboto
 
+# Параллелизм: сколько операций одновременно допускается к каждому провайдеру (формат "gemini=2,telegram=1")
+PROVIDER_CONCURRENCY = {
+    "gemini": 2,
+    "midjourney": 2,
+    "local_gpu": 1,
+    "telegram": 1,
+}
+PROVIDER_CONCURRENCY.update({
+    name.strip(): int(limit)
+    for name, limit in (item.split("=") for item in os.getenv("PROVIDER_CONCURRENCY", "").split(",") if item.strip())
+})
+DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv("DEFAULT_PROVIDER_CONCURRENCY", 1))  # Для остальных провайдеров
+
+JOB_RESUME_HOURS = int(os.getenv("JOB_RESUME_HOURS", 12))  # Сколько часов незавершённое задание можно продолжить
+MIDJOURNEY_TILES = os.getenv("MIDJOURNEY_TILES", "single")  # Ячейки сетки Midjourney: single, album или backlog (требует BACKLOG_HOURS)
+BACKLOG_HOURS = [int(hour) for hour in os.getenv("BACKLOG_HOURS", "").split(",") if hour.strip()]  # Слоты публикации запаса
+PROMPT_POOL_SIZE = int(os.getenv("PROMPT_POOL_SIZE", 1))  # Сколько промптов в день заготавливать на каждый раннер
+
+# Автоматы защиты бэкендов и маршрутизация между локальными моделями (services/routing.py)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))  # Ошибок подряд до размыкания автомата
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))  # Доля ошибок в окне, размыкающая автомат
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", 10))  # Сколько последних обращений учитывать
+CIRCUIT_COOLDOWN = int(os.getenv("CIRCUIT_COOLDOWN", 600))  # Пауза до пробного запроса к разомкнутому бэкенду (сек)
+HEALTH_CHECK_TIMEOUT = int(os.getenv("HEALTH_CHECK_TIMEOUT", 10))  # Тайм-аут проверки /api/v1/health (сек)
+HEALTH_CHECK_TTL = int(os.getenv("HEALTH_CHECK_TTL", 60))  # Сколько секунд доверять результату проверки здоровья
+# Порядок замены локальных моделей при недоступности основной; пусто — без замены, только быстрый отказ
+LOCAL_FALLBACKS = [name.strip() for name in os.getenv("LOCAL_FALLBACKS", "zimage,qwen,hidream,ernie").split(",") if name.strip()]
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", 50))  # Сколько последних генераций бэкенда учитывать в p50/p95
+# Срок публикации от запуска локального раннера (мин): если задан, раннер берёт модель, которая вероятнее
+# успеет к сроку по p95 прошлых генераций, а не только основную; 0 — всегда основная модель
+LOCAL_DEADLINE_MINUTES = int(os.getenv("LOCAL_DEADLINE_MINUTES", 0))
+
+# Эндпоинт /metrics (формат Prometheus); METRICS_PORT=0 отключает сервер метрик
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
+# Профили кодирования изображений (см. utils/image_utils.OUTPUT_PROFILES)
+ARCHIVE_PROFILE = os.getenv("ARCHIVE_PROFILE", "png")  # Архивная копия без потерь: png или webp_lossless
+DELIVERY_PROFILE = os.getenv("DELIVERY_PROFILE", "jpeg")  # Копия для Telegram: jpeg, webp, avif или пусто
+DELIVERY_MAX_BYTES = int(os.getenv("DELIVERY_MAX_BYTES", 2 * 1024 * 1024))  # Бюджет размера копии для Telegram
+
 # Yandex Cloud Configuration
 FOLDER_ID = os.getenv("FOLDER_ID")           # Идентификатор папки в Yandex Cloud
 OAUTH_TOKEN = os.getenv("OAUTH_TOKEN")         # OAuth-токен (legacy, для старых сервисов)
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")   # Yandex Cloud API-key для Images API (aliceai-image-art-3.0)
 
 MIDJOURNEY_API_TOKEN = os.getenv("MIDJOURNEY_API_TOKEN")
+MIDJOURNEY_API_URL = os.getenv("MIDJOURNEY_API_URL", "https://api.kolersky.com")
+MIDJOURNEY_UPLOAD_TTL_HOURS = int(os.getenv("MIDJOURNEY_UPLOAD_TTL_HOURS", 24))  # Сколько часов переиспользовать CDN URL загруженного изображения
+
+# Колбэки Midjourney (callBackUrl): при заданном URL планировщик поднимает приёмник, а опрос статуса становится редким
+MIDJOURNEY_CALLBACK_URL = os.getenv("MIDJOURNEY_CALLBACK_URL")  # Внешний URL, например https://bot.example.com/midjourney/callback
+MIDJOURNEY_CALLBACK_HOST = os.getenv("MIDJOURNEY_CALLBACK_HOST", "0.0.0.0")
+MIDJOURNEY_CALLBACK_PORT = int(os.getenv("MIDJOURNEY_CALLBACK_PORT", 8085))
+MIDJOURNEY_CALLBACK_TOKEN = os.getenv("MIDJOURNEY_CALLBACK_TOKEN")  # Секрет в query-параметре token
+MIDJOURNEY_FALLBACK_POLL = int(os.getenv("MIDJOURNEY_FALLBACK_POLL", 60))  # Интервал резервного опроса при колбэках
 
 # Flux API Key
 BFL_API_KEY = os.getenv("BFL_API_KEY")
+BFL_API_URL = os.getenv("BFL_API_URL", "https://api.bfl.ml/v1")
 
 KANDINSKY_API_KEY = os.getenv("KANDINSKY_API_KEY")
 KANDINSKY_SECRET_KEY = os.getenv("KANDINSKY_SECRET_KEY")
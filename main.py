@@ -1,11 +1,14 @@
 import asyncio
-from bot.scheduler import start_scheduler
+from bot.scheduler import start_scheduler, stop_scheduler
 
 async def main():
     print("Запуск бота...")
-    await start_scheduler()
-    while True:
-        await asyncio.sleep(3600)  # Бесконечное ожидание
+    scheduler = await start_scheduler()
+    try:
+        while True:
+            await asyncio.sleep(3600)  # Бесконечное ожидание
+    finally:
+        await stop_scheduler(scheduler)
 
 if __name__ == "__main__":
     asyncio.run(main())
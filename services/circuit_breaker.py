@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import deque
+from config import CIRCUIT_COOLDOWN, CIRCUIT_FAILURE_RATE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_WINDOW
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"        # Бэкенд работает, запросы идут как обычно
+OPEN = "open"            # Бэкенд считается недоступным, запросы не отправляются
+HALF_OPEN = "half_open"  # Пауза истекла, разрешён один пробный запрос
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers: dict = {}
+_lock = threading.Lock()  # Синхронные клиенты (Kandinsky) сообщают результат из потоков
+
+
+class BackendUnavailableError(RuntimeError):
+    """Бэкенд недоступен (разомкнут автомат или не прошла проверка здоровья)."""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты бэкенда по последним результатам обращений.
+    Размыкается после CIRCUIT_FAILURE_THRESHOLD ошибок подряд, при доле ошибок
+    не ниже CIRCUIT_FAILURE_RATE среди последних CIRCUIT_WINDOW обращений
+    или сразу — при неудачной проверке здоровья.
+    Через CIRCUIT_COOLDOWN секунд пропускает один пробный запрос: успех замыкает автомат,
+    ошибка снова размыкает его на ту же паузу.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 failure_rate: float = CIRCUIT_FAILURE_RATE, window: int = CIRCUIT_WINDOW,
+                 cooldown: float = CIRCUIT_COOLDOWN):
+        """
+        :param name: Имя бэкенда (SERVICE_NAME сервиса).
+        :param failure_threshold: Ошибок подряд для размыкания.
+        :param failure_rate: Доля ошибок в окне для размыкания (0-1).
+        :param window: Сколько последних обращений учитывать.
+        :param cooldown: Пауза до пробного запроса (сек).
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)  # True — успех, False — ошибка
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_started_at = None  # Пробный запрос, результат которого ещё не учтён
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Сколько секунд осталось до пробного запроса (0, если автомат не разомкнут)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Проверяет, можно ли обращаться к бэкенду.
+        В полуоткрытом состоянии разрешает только один пробный запрос одновременно
+        (зависший пробный запрос, не сообщивший результат, перестаёт учитываться через cooldown).
+        """
+        with _lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            now = time.monotonic()
+            if state == HALF_OPEN and (self._probe_started_at is None or now - self._probe_started_at >= self.cooldown):
+                self._probe_started_at = now
+                logger.info(f"{self.name}: пауза автомата истекла, пробный запрос")
+                return True
+            return False
+
+    def check(self):
+        """
+        :raises BackendUnavailableError: Если обращаться к бэкенду сейчас нельзя.
+        """
+        if not self.allow():
+            raise BackendUnavailableError(
+                f"{self.name} недоступен (последняя ошибка: {self.last_error}), "
+                f"следующая попытка через {self.retry_in:.0f} сек"
+            )
+
+    def record_success(self):
+        """Учитывает успешное обращение; пробный успех замыкает автомат."""
+        with _lock:
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self._probe_started_at = None
+            if self.opened_at is not None:
+                self.opened_at = None
+                logger.info(f"{self.name}: бэкенд снова доступен, автомат замкнут")
+
+    def record_failure(self, error=None):
+        """
+        Учитывает ошибку обращения и размыкает автомат, если ошибок стало слишком много.
+        :param error: Исключение или описание ошибки для логов.
+        """
+        with _lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else self.last_error
+            failures = self.outcomes.count(False)
+            rate_exceeded = (
+                len(self.outcomes) >= self.failure_threshold
+                and failures / len(self.outcomes) >= self.failure_rate
+            )
+            if self._probe_started_at is not None or self.consecutive_failures >= self.failure_threshold or rate_exceeded:
+                self._open()
+
+    def trip(self, error=None):
+        """Сразу размыкает автомат (например, бэкенд не ответил на проверку здоровья)."""
+        with _lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else self.last_error
+            self._open()
+
+    def _open(self):
+        self._probe_started_at = None
+        self.opened_at = time.monotonic()
+        TRIPS.inc(backend=self.name)
+        logger.warning(
+            f"{self.name}: автомат разомкнут на {self.cooldown:.0f} сек "
+            f"(ошибок подряд: {self.consecutive_failures}, последняя: {self.last_error})"
+        )
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Возвращает общий автомат бэкенда (создаётся при первом обращении).
+    :param name: Имя бэкенда (SERVICE_NAME сервиса).
+    """
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+CIRCUIT_STATE = Gauge(
+    "utriskra_circuit_state", "Состояние автомата бэкенда: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут",
+    ("backend",), collect=lambda: {(name,): _STATE_VALUES[breaker.state] for name, breaker in _breakers.items()})
+TRIPS = Counter("utriskra_circuit_trips_total", "Размыкания автомата бэкенда", ("backend",))
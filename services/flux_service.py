@@ -2,7 +2,10 @@ import httpx
 import random
 import logging
 import asyncio  # Добавляем импорт asyncio
-from config import BFL_API_KEY
+from collections import deque
+from services.http_client import get_client
+from services.polling import AdaptivePoller, median_duration
+from config import BFL_API_KEY, BFL_API_URL
 
 logger = logging.getLogger(__name__)
 
@@ -10,8 +13,10 @@ logger = logging.getLogger(__name__)
 class FluxService:
     """Асинхронный класс для взаимодействия с FLUX API."""
 
-    BASE_URL = "https://api.bfl.ml/v1"
+    BASE_URL = BFL_API_URL
     FLUX_ENDPOINT = "/flux-pro-1.1-ultra"
+    # Последние длительности генерации (сек) для адаптивного polling
+    _durations = deque(maxlen=20)
 
     def __init__(self, api_key: str = BFL_API_KEY, timeout: int = 60):
         """
@@ -45,51 +50,65 @@ class FluxService:
             "steps": 50,
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.post(
-                    f"{self.BASE_URL}{self.FLUX_ENDPOINT}",
-                    headers=self.headers,
-                    json=payload,
-                )
-                response.raise_for_status()
-                return response.json()["id"]
-            except httpx.RequestError as e:
-                logger.error(f"Ошибка подключения к Flux API: {e}")
-                raise
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Ошибка статуса HTTP: {e.response.status_code} - {e.response.text}")
-                raise
+        client = get_client(self.BASE_URL)
+        try:
+            response = await client.post(
+                f"{self.BASE_URL}{self.FLUX_ENDPOINT}",
+                headers=self.headers,
+                timeout=self.timeout,
+                json=payload,
+            )
+            response.raise_for_status()
+            return response.json()["id"]
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка подключения к Flux API: {e}")
+            raise
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Ошибка статуса HTTP: {e.response.status_code} - {e.response.text}")
+            raise
 
     async def poll_for_result(self, request_id: str, delay: int = 5, attempts: int = 60) -> str:
         """
         Ожидает завершения задачи и возвращает URL результата.
+        Паузы адаптивные: около медианы прошлых генераций проверки идут чаще, дальше — реже.
         :param request_id: ID задачи.
-        :param delay: Интервал между попытками (в секундах).
-        :param attempts: Максимальное количество попыток.
+        :param delay: Минимальный интервал между попытками (в секундах).
+        :param attempts: Общее время ожидания в интервалах delay (attempts * delay секунд).
         :return: Ссылка на результат (URL изображения).
         """
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            for attempt in range(attempts):
-                try:
-                    response = await client.get(
-                        f"{self.BASE_URL}/get_result",
-                        headers=self.headers,
-                        params={"id": request_id},
-                    )
-                    response.raise_for_status()
-                    result_data = response.json()
+        client = get_client(self.BASE_URL)
+        timeout = attempts * delay
+        poller = AdaptivePoller(
+            expected_duration=median_duration(self._durations),
+            min_interval=min(delay, 2),
+            max_interval=max(delay, 15),
+            initial_interval=delay,
+            timeout=timeout,
+        )
+        attempt = 0
+        while not poller.expired:
+            attempt += 1
+            try:
+                response = await client.get(
+                    f"{self.BASE_URL}/get_result",
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    params={"id": request_id},
+                )
+                response.raise_for_status()
+                result_data = response.json()
 
-                    if result_data["status"] == "Ready":
-                        return result_data["result"]["sample"]
-                    elif result_data["status"] not in {"Pending", "Processing"}:
-                        raise ValueError(f"Ошибка статуса задачи: {result_data['status']}")
+                if result_data["status"] == "Ready":
+                    self._durations.append(poller.elapsed)
+                    return result_data["result"]["sample"]
+                elif result_data["status"] not in {"Pending", "Processing"}:
+                    raise ValueError(f"Ошибка статуса задачи: {result_data['status']}")
 
-                    logger.info(f"Задача {request_id} обрабатывается. Попытка {attempt + 1}/{attempts}")
-                    await asyncio.sleep(delay)
-                except httpx.RequestError as e:
-                    logger.error(f"Ошибка подключения к Flux API: {e}")
-                except Exception as e:
-                    logger.error(f"Ошибка при ожидании результата: {e}")
+                logger.info(f"Задача {request_id} обрабатывается. Попытка {attempt}")
+            except httpx.RequestError as e:
+                logger.error(f"Ошибка подключения к Flux API: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка при ожидании результата: {e}")
+            await poller.sleep()
 
-        raise TimeoutError(f"Задача {request_id} не завершилась за {attempts * delay} секунд.")
+        raise TimeoutError(f"Задача {request_id} не завершилась за {timeout} секунд.")
@@ -1,24 +1,63 @@
+import asyncio
+import logging
+import re
 import time
 import httpx
-from httpx_socks import SyncProxyTransport
-from config import GEMINI_API_KEYS, PROXY_URL
-import sys  # Для завершения программы
+from services.http_client import get_client
+from utils.concurrency import GEMINI, provider_slot
+from utils.metrics import PROVIDER_CALL_SECONDS, RETRIES
+from config import GEMINI_API_KEYS, GEMINI_API_URL, GEMINI_HEDGE, GEMINI_REQUIRE_PROXY, PROXY_URL
+
+logger = logging.getLogger(__name__)
+
+GEMINI_URL = (
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro-latest:generateContent",
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-pro-exp-02-05:generateContent",
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent",
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent",
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent",
+    #"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-flash-preview:generateContent",
+    # "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent",
+    GEMINI_API_URL
+)
+
+
+class _KeyUnavailable(Exception):
+    """Ключ временно или окончательно непригоден, нужно попробовать другой."""
+
+    def __init__(self, key: str, reason: str):
+        super().__init__(reason)
+        self.key = key
 
 
 class GeminiService:
-    """Класс для взаимодействия с Gemini Pro через SOCKS5-прокси и балансировку ключей."""
+    """Асинхронный класс для взаимодействия с Gemini Pro через SOCKS5-прокси и балансировку ключей."""
+
+    DEFAULT_COOLDOWN = 60  # Пауза для ключа после 429, если API не прислал retryDelay
+    RETRIES_503 = 3
+    RETRY_DELAY_503 = 10
+
+    # Время (time.monotonic), до которого ключ не используется. Общее для всех экземпляров процесса.
+    _key_cooldowns: dict = {}
 
-    def __init__(self, timeout: int = 120):
+    def __init__(self, timeout: int = 120, hedge: bool = GEMINI_HEDGE, hedge_delay: float = 5.0):
+        """
+        :param timeout: Тайм-аут запроса.
+        :param hedge: Дублировать запрос на второй исправный ключ и брать первый ответ.
+        :param hedge_delay: Через сколько секунд без ответа запускать дублирующий запрос.
+        """
         if not GEMINI_API_KEYS:
             raise ValueError("GEMINI_API_KEYS отсутствуют. Проверьте файл config.py.")
-        if not PROXY_URL:
+        if not PROXY_URL and GEMINI_REQUIRE_PROXY:
             raise ValueError("PROXY_URL отсутствует. Проверьте файл config.py.")
         self.api_keys = GEMINI_API_KEYS
         self.current_key_index = 0
         self.proxy_url = PROXY_URL
-        # Настройка прокси
-        self.transport = SyncProxyTransport.from_url(self.proxy_url)
-        self.client = httpx.Client(transport=self.transport, timeout=httpx.Timeout(timeout))
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.timeout = httpx.Timeout(timeout)
+        # Общий клиент с SOCKS5-прокси (без него только при GEMINI_REQUIRE_PROXY=0)
+        self.client = get_client(GEMINI_URL, proxy_url=self.proxy_url)
 
     @property
     def current_key(self) -> str:
@@ -28,74 +67,140 @@ class GeminiService:
     def switch_to_next_key(self):
         """Переключает на следующий ключ."""
         self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        print(f"[INFO] Переключение на следующий ключ: {self.current_key}")
+        logger.info(f"Переключение на следующий ключ Gemini (#{self.current_key_index})")
+
+    def _healthy_keys(self) -> list:
+        """Возвращает ключи без активной паузы, начиная с текущего."""
+        now = time.monotonic()
+        ordered = self.api_keys[self.current_key_index:] + self.api_keys[:self.current_key_index]
+        return [key for key in ordered if self._key_cooldowns.get(key, 0) <= now]
+
+    def _cool_down(self, key: str, seconds: float):
+        """Помечает ключ как недоступный на указанное время."""
+        self._key_cooldowns[key] = time.monotonic() + seconds
+
+    def _bench(self, key: str):
+        """Даёт короткую паузу ключу, не ответившему из-за 503 или сетевой ошибки (429/400 уже назначили свою)."""
+        if self._key_cooldowns.get(key, 0) <= time.monotonic():
+            self._cool_down(key, self.RETRY_DELAY_503)
+
+    @classmethod
+    def _retry_delay(cls, response: httpx.Response) -> float:
+        """Извлекает время паузы из ответа 429 (заголовок Retry-After или поле retryDelay)."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        match = re.search(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"', response.text)
+        if match:
+            return float(match.group(1))
+        return cls.DEFAULT_COOLDOWN
+
+    async def _request(self, key: str, payload: dict) -> str:
+        """
+        Выполняет запрос с одним ключом.
+        :raises _KeyUnavailable: Если ключ исчерпан, неверен или модель перегружена.
+        :raises RuntimeError: При прочих ошибках API.
+        """
+        for attempt in range(1, self.RETRIES_503 + 1):
+            try:
+                response = await self.client.post(
+                    GEMINI_URL,
+                    params={"key": key},
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout,
+                    json=payload,
+                )
+            except httpx.HTTPError as e:
+                logger.error(f"Ошибка при запросе к Gemini: {e}")
+                raise _KeyUnavailable(key, str(e)) from e
+
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+            elif response.status_code == 503:
+                logger.warning(
+                    f"Модель перегружена (503). Повтор через {self.RETRY_DELAY_503 * attempt} секунд... "
+                    f"(Попытка {attempt} из {self.RETRIES_503})"
+                )
+                RETRIES.inc(provider=GEMINI, reason="503")
+                await asyncio.sleep(self.RETRY_DELAY_503 * attempt)
+                continue
+            elif response.status_code == 429:
+                delay = self._retry_delay(response)
+                logger.warning(f"Ключ Gemini исчерпан (429). Пауза для ключа {delay:.0f} секунд.")
+                self._cool_down(key, delay)
+                RETRIES.inc(provider=GEMINI, reason="429")
+                raise _KeyUnavailable(key, "429")
+            elif response.status_code == 400 and "API_KEY_INVALID" in response.text:
+                logger.error("Неверный ключ Gemini. Исключаем его до перезапуска.")
+                self._cool_down(key, float("inf"))
+                raise _KeyUnavailable(key, "API_KEY_INVALID")
+            else:
+                raise RuntimeError(f"Ошибка API Gemini {response.status_code}: {response.text}")
+
+        raise _KeyUnavailable(key, "503")
+
+    async def _request_hedged(self, keys: list, payload: dict) -> str:
+        """
+        Отправляет запрос с первым ключом и, если ответа нет за hedge_delay секунд,
+        дублирует его со вторым ключом. Возвращает первый успешный ответ.
+        Ключ, не давший ответа, сразу получает паузу, даже если ответил другой.
+        """
+        first = asyncio.create_task(self._request(keys[0], payload))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        logger.info("Gemini не ответил вовремя, дублируем запрос на второй ключ.")
+        pending = {first, asyncio.create_task(self._request(keys[1], payload))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    if isinstance(error, _KeyUnavailable):
+                        self._bench(error.key)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
 
-    def generate_prompt(self, system_prompt: str, user_prompt: str, temperature: float = 0.9,
-                        max_output_tokens: int = 8000) -> str:
+    async def generate_prompt(self, system_prompt: str, user_prompt: str, temperature: float = 0.9,
+                              max_output_tokens: int = 8000, response_mime_type: str = None) -> str:
         """
         Генерирует ответ на основе промпта.
         :param system_prompt: Системное сообщение.
         :param user_prompt: Запрос пользователя.
         :param temperature: Температура генерации.
         :param max_output_tokens: Максимальное количество токенов.
+        :param response_mime_type: Формат ответа (например, "application/json" для структурированного вывода).
         :return: Ответ в текстовом виде.
+        :raises RuntimeError: Если ни один ключ не дал ответа.
         """
-        generation_config = {
-            "temperature": temperature,
-            "max_output_tokens": max_output_tokens,
+        payload = {
+            "generationConfig": {
+                "temperature": temperature,
+                "max_output_tokens": max_output_tokens,
+            },
+            "contents": [{"parts": [{"text": system_prompt}, {"text": user_prompt}]}],
         }
-        # Пытаемся использовать ключи по очереди
-        for _ in range(len(self.api_keys)):
-            retries = 0  # Счетчик повторных попыток при статусе 503
-            while retries < 3:
+        if response_mime_type:
+            payload["generationConfig"]["responseMimeType"] = response_mime_type
+
+        async with provider_slot(GEMINI), PROVIDER_CALL_SECONDS.time(provider=GEMINI, operation="llm"):
+            # Пытаемся использовать исправные ключи по очереди
+            while True:
+                keys = self._healthy_keys()
+                if not keys:
+                    raise RuntimeError("Все API-ключи Gemini недействительны или временно исчерпаны.")
                 try:
-                    response = self.client.post(
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro-latest:generateContent",
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-pro-exp-02-05:generateContent",
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent",
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent",
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent",
-                        #"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-flash-preview:generateContent",
-                        "https://generativelanguage.googleapis.com/v1beta/models/gemini-3.5-flash:generateContent",
-                        # "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent",
-
-                        params={"key": self.current_key},
-                        headers={"Content-Type": "application/json"},
-                        json={
-                            "generationConfig": generation_config,
-                            "contents": [{"parts": [{"text": system_prompt}, {"text": user_prompt}]}],
-                        },
-                    )
-                except Exception as e:
-                    print(f"[ERROR] Ошибка при запросе: {e}")
-                    self.switch_to_next_key()
-                    break  # Переходим к следующему ключу
-
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-                elif response.status_code == 503:
-                    retries += 1
-                    print(
-                        f"[WARNING] Модель перегружена (503). Попытка повторить запрос через 5 секунд... (Попытка {retries} из 5)")
-                    time.sleep(50)
-                    continue  # Повторяем запрос с тем же ключом
-                elif response.status_code == 429:
-                    print(f"[WARNING] Ключ {self.current_key} исчерпан. Переключаемся.")
+                    if self.hedge and len(keys) > 1:
+                        return await self._request_hedged(keys[:2], payload)
+                    return await self._request(keys[0], payload)
+                except _KeyUnavailable as e:
+                    # Пауза назначается ключу, который не ответил (в паре дублирующих запросов это может быть второй)
+                    self._bench(e.key)
                     self.switch_to_next_key()
-                    break  # Переходим к следующему ключу
-                elif response.status_code == 400 and "API_KEY_INVALID" in response.text:
-                    print(f"[ERROR] Неверный ключ: {self.current_key}. Пропускаем его.")
-                    self.switch_to_next_key()
-                    break  # Переходим к следующему ключу
-                else:
-                    print(f"[ERROR] Ошибка API {response.status_code}: {response.text}")
-                    return ""
-            else:
-                # Если 3 попытки с кодом 503 исчерпаны, завершаем работу программы
-                print("[CRITICAL] Превышено число попыток получения ответа с кодом 503. Завершение работы.")
-                sys.exit(1)
-
-        # Если все ключи исчерпаны
-        print("[CRITICAL] Все API-ключи недействительны или исчерпаны. Завершение работы.")
-        sys.exit(1)
@@ -0,0 +1,77 @@
+import importlib.util
+import logging
+import httpx
+from httpx_socks import AsyncProxyTransport
+from utils.metrics import HTTP_BYTES, HTTP_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 включается только если установлен пакет h2 (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+DEFAULT_TIMEOUT = httpx.Timeout(60, connect=30)
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+
+# Общие клиенты процесса: ключ — (origin, proxy_url)
+_clients: dict = {}
+
+
+def _origin(url: str) -> str:
+    """Возвращает scheme://host:port для URL."""
+    parsed = httpx.URL(url)
+    port = f":{parsed.port}" if parsed.port else ""
+    return f"{parsed.scheme}://{parsed.host}{port}"
+
+
+async def _count_request(request: httpx.Request):
+    size = request.headers.get("Content-Length")
+    if size and size.isdigit():
+        HTTP_BYTES.inc(int(size), host=request.url.host, direction="sent")
+
+
+async def _count_response(response: httpx.Response):
+    host = response.request.url.host
+    HTTP_RESPONSES.inc(host=host, status=response.status_code)
+    size = response.headers.get("Content-Length")
+    if size and size.isdigit():
+        HTTP_BYTES.inc(int(size), host=host, direction="received")
+
+
+# Хуки общих клиентов: коды ответов (в том числе 429/503) и объём трафика по каждому хосту
+EVENT_HOOKS = {"request": [_count_request], "response": [_count_response]}
+
+
+def get_client(url: str, proxy_url: str = None) -> httpx.AsyncClient:
+    """
+    Возвращает общий httpx.AsyncClient для хоста из URL (и прокси, если указан).
+    Клиент держит keep-alive пул соединений и переиспользуется всеми сервисами процесса.
+    Тайм-ауты и заголовки передаются в каждом запросе.
+    :param url: Любой URL на целевом хосте.
+    :param proxy_url: URL SOCKS/HTTP-прокси.
+    :return: Общий асинхронный клиент.
+    """
+    key = (_origin(url), proxy_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        if proxy_url:
+            transport = AsyncProxyTransport.from_url(proxy_url)
+            client = httpx.AsyncClient(transport=transport, timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS,
+                                       event_hooks=EVENT_HOOKS)
+        else:
+            client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS, http2=HTTP2_AVAILABLE,
+                                       event_hooks=EVENT_HOOKS)
+        _clients[key] = client
+        logger.debug(f"Создан HTTP-клиент для {key[0]}{' через прокси' if proxy_url else ''}")
+    return client
+
+
+async def close_clients():
+    """Закрывает все общие HTTP-клиенты (вызывается при остановке планировщика)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии HTTP-клиента: {e}")
+    logger.info(f"Закрыто HTTP-клиентов: {len(clients)}")
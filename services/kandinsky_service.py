@@ -2,6 +2,9 @@ import json
 import time
 import requests
 import logging
+from collections import deque
+from services.circuit_breaker import CLOSED, BackendUnavailableError, get_breaker
+from services.polling import AdaptivePoller, median_duration
 from config import KANDINSKY_API_KEY, KANDINSKY_SECRET_KEY
 
 # Настройка логирования
@@ -12,7 +15,10 @@ logger = logging.getLogger(__name__)
 class KandinskyService:
     """Класс для взаимодействия с Kandinsky 3.1 API."""
     BASE_URL = "https://api-key.fusionbrain.ai/"
+    SERVICE_NAME = "Kandinsky"
     TIMEOUT = 30  # Тайм-аут в секундах
+    # Последние длительности генерации (сек) для адаптивного polling
+    _durations = deque(maxlen=20)
 
     def __init__(self):
         if not KANDINSKY_API_KEY or not KANDINSKY_SECRET_KEY:
@@ -21,6 +27,7 @@ class KandinskyService:
             "X-Key": f"Key {KANDINSKY_API_KEY}",
             "X-Secret": f"Secret {KANDINSKY_SECRET_KEY}",
         }
+        self.breaker = get_breaker(self.SERVICE_NAME)
 
     def get_model_id(self):
         """Получение ID доступной модели."""
@@ -33,7 +40,11 @@ class KandinskyService:
     def check_availability_with_timeout(self, model_id, attempts: int = 6, delay: int = 300):
         """
         Проверяет доступность API каждые `delay` секунд в течение `attempts` попыток.
+        Каждая неудачная проверка учитывается автоматом защиты: если он разомкнут,
+        ожидание прекращается сразу, а следующие запуски отказывают без запросов до конца паузы.
+        :raises BackendUnavailableError: Если сервис недоступен.
         """
+        self.breaker.check()
         for attempt in range(attempts):
             try:
                 logger.debug(f"Отправляем запрос на проверку доступности с model_id={model_id}.")
@@ -49,15 +60,19 @@ class KandinskyService:
                 status = response_data.get("pipeline_status")
                 if status == "DISABLED_BY_QUEUE":
                     logger.warning(f"API недоступен: {status}. Попытка {attempt + 1} из {attempts}.")
+                    self.breaker.record_failure(status)
                 else:
                     # Любые состояния, кроме DISABLED_BY_QUEUE, считаются доступными
                     logger.info(f"API доступен: статус {status}.")
                     return
             except requests.exceptions.RequestException as e:
                 logger.error(f"Ошибка при проверке доступности API: {e}")
+                self.breaker.record_failure(e)
+            if self.breaker.state != CLOSED:
+                break
             if attempt < attempts - 1:
                 time.sleep(delay)  # Ждем перед следующей проверкой
-        raise Exception("Сервис остается недоступным более 30 минут.")
+        raise BackendUnavailableError(f"Сервис Kandinsky недоступен: {self.breaker.last_error}")
 
     def generate_image(self, prompt: str, model_id: str, width: int = 1344, height: int = 768):
         """
@@ -90,17 +105,33 @@ class KandinskyService:
     def get_image(self, uuid: str, attempts: int = 120, delay: int = 10):
         """
         Получение результата генерации.
+        Паузы адаптивные: около медианы прошлых генераций проверки идут чаще, дальше — реже.
+        :param attempts: Общее время ожидания в интервалах delay (attempts * delay секунд).
+        :param delay: Базовый интервал между проверками.
         """
-        while attempts > 0:
+        poller = AdaptivePoller(
+            expected_duration=median_duration(self._durations),
+            min_interval=min(delay, 3),
+            max_interval=max(delay, 30),
+            initial_interval=delay,
+            timeout=attempts * delay,
+        )
+        while not poller.expired:
             # Исправлено с text2image на pipeline согласно документации
-            response = requests.get(f"{self.BASE_URL}key/api/v1/pipeline/status/{uuid}", headers=self.auth_headers)
+            response = requests.get(
+                f"{self.BASE_URL}key/api/v1/pipeline/status/{uuid}",
+                headers=self.auth_headers,
+                timeout=self.TIMEOUT
+            )
             response.raise_for_status()
             data = response.json()
             if data["status"] == "DONE":
+                self._durations.append(poller.elapsed)
+                self.breaker.record_success()
                 # Исправлено с images[0] на result.files[0] согласно документации
                 return data["result"]["files"][0]
             elif data["status"] == "FAIL":
+                self.breaker.record_failure("FAIL")
                 raise ValueError("Не удалось сгенерировать изображение.")
-            attempts -= 1
-            time.sleep(delay)
-        raise TimeoutError("Превышено количество попыток ожидания результата.")
\ No newline at end of file
+            time.sleep(poller.next_delay())
+        raise TimeoutError("Превышено количество попыток ожидания результата.")
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import math
+from collections import deque
+from config import LATENCY_WINDOW
+from utils.database import get_backend_timings, save_backend_timing
+from utils.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+GENERATION = "generation"  # Время генерации по данным бэкенда (generation_time_seconds)
+QUEUE = "queue"            # Ожидание в очереди бэкенда до начала генерации
+TOTAL = "total"            # От создания задачи до результата по нашим часам
+
+_stats: dict = {}
+
+
+def percentile(values, q: float) -> float:
+    """
+    Возвращает перцентиль с линейной интерполяцией или None, если значений нет.
+    :param values: Значения.
+    :param q: Уровень от 0 до 1 (0.5 — медиана, 0.95 — p95).
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class LatencyStats:
+    """
+    Скользящая статистика времён бэкенда по последним LATENCY_WINDOW генерациям.
+    Замеры сохраняются в базу, поэтому оценки переживают перезапуск процесса,
+    хотя каждый раннер генерирует всего несколько изображений в день.
+    """
+
+    def __init__(self, backend: str, window: int = LATENCY_WINDOW):
+        """
+        :param backend: Имя бэкенда (SERVICE_NAME).
+        :param window: Сколько последних генераций учитывать.
+        """
+        self.backend = backend
+        self.samples = {kind: deque(maxlen=window) for kind in (GENERATION, QUEUE, TOTAL)}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def load(self):
+        """Загружает последние замеры из базы (один раз за процесс)."""
+        async with self._load_lock:
+            if self._loaded:
+                return
+            window = self.samples[TOTAL].maxlen
+            for generation, queue, total in await get_backend_timings(self.backend, window):
+                self._append(generation, queue, total)
+            self._loaded = True
+            if self.samples[TOTAL]:
+                logger.info(f"{self.backend}: загружено замеров времени генерации: {len(self.samples[TOTAL])}")
+
+    def _append(self, generation, queue, total):
+        if generation is not None:
+            self.samples[GENERATION].append(generation)
+        if queue is not None:
+            self.samples[QUEUE].append(queue)
+        self.samples[TOTAL].append(total)
+
+    async def record(self, total: float, generation: float = None, queue: float = None):
+        """
+        Добавляет замер одной генерации и сохраняет его в базу.
+        :param total: Время от создания задачи до результата (сек).
+        :param generation: Время генерации по данным бэкенда (сек).
+        :param queue: Ожидание в очереди бэкенда (сек).
+        """
+        await self.load()
+        self._append(generation, queue, total)
+        save_backend_timing(self.backend, generation, queue, total)
+
+    def p50(self, kind: str = TOTAL) -> float:
+        return percentile(self.samples[kind], 0.5)
+
+    def p95(self, kind: str = TOTAL) -> float:
+        return percentile(self.samples[kind], 0.95)
+
+    def summary(self) -> str:
+        """Строка для логов: p50/p95 генерации, очереди и полного времени."""
+        parts = []
+        for kind in (GENERATION, QUEUE, TOTAL):
+            if self.samples[kind]:
+                parts.append(f"{kind} p50={self.p50(kind):.0f}/p95={self.p95(kind):.0f} сек")
+        return ", ".join(parts) or "нет замеров"
+
+
+def get_latency_stats(backend: str) -> LatencyStats:
+    """
+    Возвращает общую статистику бэкенда (создаётся при первом обращении).
+    :param backend: Имя бэкенда (SERVICE_NAME).
+    """
+    if backend not in _stats:
+        _stats[backend] = LatencyStats(backend)
+    return _stats[backend]
+
+
+def _collect_quantiles() -> dict:
+    values = {}
+    for backend, stats in _stats.items():
+        for kind, samples in stats.samples.items():
+            if samples:
+                values[(backend, kind, "0.5")] = percentile(samples, 0.5)
+                values[(backend, kind, "0.95")] = percentile(samples, 0.95)
+    return values
+
+
+BACKEND_LATENCY = Gauge(
+    "utriskra_backend_latency_seconds", "Скользящие p50/p95 времён бэкенда (generation, queue, total)",
+    ("backend", "kind", "quantile"), collect=_collect_quantiles)
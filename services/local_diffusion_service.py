@@ -0,0 +1,248 @@
+import httpx
+import logging
+import asyncio
+from services.circuit_breaker import get_breaker
+from services.http_client import get_client
+from services.latency import GENERATION, get_latency_stats
+from services.polling import AdaptivePoller
+from utils.concurrency import LOCAL_GPU, provider_slot
+from utils.metrics import PROVIDER_CALL_SECONDS, REMOTE_QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Общая статистика по всем локальным бэкендам: SERVICE_NAME -> счётчики задач
+_stats: dict = {}
+
+
+def get_stats(service_name: str) -> dict:
+    """
+    Возвращает статистику бэкенда (создаётся при первом обращении).
+    :param service_name: Имя сервиса (SERVICE_NAME).
+    :return: Словарь со счётчиками задач (времена генерации — в services.latency).
+    """
+    if service_name not in _stats:
+        _stats[service_name] = {
+            "created": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+    return _stats[service_name]
+
+
+class LocalDiffusionService:
+    """
+    Базовый асинхронный класс для self-hosted моделей с протоколом
+    /api/v1/health, /api/v1/generate и /api/v1/tasks/{task_id}.
+    Наследники задают SERVICE_NAME и схему параметров PARAMETERS.
+    """
+
+    SERVICE_NAME = "Local Diffusion"
+    LABEL = "L"  # Буква модели в водяном знаке с датой
+    # Параметры генерации: имя -> значение по умолчанию.
+    # Параметры со значением None не передаются в API, если не заданы явно.
+    PARAMETERS: dict = {}
+
+    def __init__(self, base_url: str, timeout: int = 60):
+        """
+        :param base_url: Базовый URL API.
+        :param timeout: Тайм-аут для запросов.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.headers = {
+            "accept": "application/json",
+            "Content-Type": "application/json",
+        }
+        self.stats = get_stats(self.SERVICE_NAME)
+        self.latency = get_latency_stats(self.SERVICE_NAME)
+        self.breaker = get_breaker(self.SERVICE_NAME)
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        """Выполняет запрос к API через общий клиент и возвращает JSON."""
+        client = get_client(self.base_url)
+        try:
+            response = await client.request(
+                method,
+                f"{self.base_url}{path}",
+                headers=self.headers,
+                timeout=self.timeout,
+                **kwargs,
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка подключения к {self.SERVICE_NAME} API: {e}")
+            raise
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Ошибка статуса HTTP: {e.response.status_code} - {e.response.text}")
+            raise
+
+    def build_payload(self, prompt: str, **params) -> dict:
+        """
+        Собирает тело запроса по схеме PARAMETERS.
+        :param prompt: Промпт для генерации.
+        :param params: Параметры модели (переопределяют значения по умолчанию).
+        :return: Тело запроса для /api/v1/generate.
+        :raises TypeError: Если передан параметр, которого нет в схеме модели.
+        """
+        unknown = set(params) - set(self.PARAMETERS)
+        if unknown:
+            raise TypeError(f"{self.SERVICE_NAME} не поддерживает параметры: {', '.join(sorted(unknown))}")
+
+        payload = {"prompt": prompt}
+        for name, default in self.PARAMETERS.items():
+            value = params.get(name, default)
+            if value is not None:
+                payload[name] = value
+        return payload
+
+    async def health_check(self) -> dict:
+        """Проверка доступности API и статуса модели."""
+        return await self._request("GET", "/api/v1/health")
+
+    async def create_task(self, prompt: str, **params) -> str:
+        """
+        Создает задачу на генерацию изображения.
+        :param prompt: Промпт для генерации.
+        :param params: Параметры модели из PARAMETERS.
+        :return: ID задачи.
+        """
+        payload = self.build_payload(prompt, **params)
+        result = await self._request("POST", "/api/v1/generate", json=payload)
+        self.stats["created"] += 1
+        logger.info(f"Задача создана: {result['task_id']}, позиция в очереди: {result['queue_position']}")
+        return result["task_id"]
+
+    async def get_task_status(self, task_id: str) -> dict:
+        """Получает статус задачи генерации."""
+        return await self._request("GET", f"/api/v1/tasks/{task_id}")
+
+    async def wait_for_completion(
+        self,
+        task_id: str,
+        timeout: int = 1200,
+        poll_interval: int = None,
+    ) -> dict:
+        """
+        Ожидает завершения задачи с адаптивным polling.
+        Паузы рассчитываются по позиции в очереди и медиане прошлых времён генерации.
+        :param task_id: ID задачи.
+        :param timeout: Максимальное время ожидания в секундах.
+        :param poll_interval: Фиксированный интервал между проверками (None — адаптивный).
+        :return: Информация о завершённой задаче.
+        """
+        if poll_interval:
+            poller = AdaptivePoller(min_interval=poll_interval, max_interval=poll_interval, jitter=0, timeout=timeout)
+        else:
+            await self.latency.load()
+            poller = AdaptivePoller(
+                expected_duration=self.latency.p50(GENERATION),
+                timeout=timeout,
+            )
+        attempt = 0
+
+        while not poller.expired:
+            attempt += 1
+            task_info = await self.get_task_status(task_id)
+            status = task_info["status"]
+
+            if status == "completed":
+                generation_time = task_info.get("generation_time_seconds")
+                queue_time = None
+                if generation_time is not None:
+                    generation_time = float(generation_time)
+                    queue_time = max(poller.elapsed - generation_time, 0)
+                    REMOTE_QUEUE_SECONDS.observe(queue_time, provider=self.SERVICE_NAME)
+                await self.latency.record(poller.elapsed, generation=generation_time, queue=queue_time)
+                PROVIDER_CALL_SECONDS.observe(poller.elapsed, provider=self.SERVICE_NAME, operation="generation")
+                self.stats["completed"] += 1
+                logger.info(
+                    f"Задача {task_id} завершена за {generation_time or '?'} сек "
+                    f"(ожидание {poller.elapsed:.0f} сек, запросов статуса: {attempt})"
+                )
+                return task_info
+            elif status == "failed":
+                self.stats["failed"] += 1
+                error_msg = task_info.get("error", "Неизвестная ошибка")
+                logger.error(f"Задача {task_id} завершилась с ошибкой: {error_msg}")
+                raise RuntimeError(f"Генерация не удалась: {error_msg}")
+            else:
+                queue_pos = task_info.get("queue_position")
+                pos_info = f", позиция в очереди: {queue_pos}" if queue_pos else ""
+                delay = poller.next_delay(queue_pos)
+                logger.info(
+                    f"Задача {task_id}: статус '{status}'{pos_info}. "
+                    f"Попытка {attempt}, следующая проверка через {delay:.0f} сек"
+                )
+                await asyncio.sleep(delay)
+
+        raise TimeoutError(f"Задача {task_id} не завершилась за {timeout} секунд")
+
+    def resolve_image_url(self, task_info: dict) -> str:
+        """Возвращает полный URL изображения из информации о задаче."""
+        image_url = task_info.get("image_url")
+        if not image_url:
+            raise RuntimeError("Изображение сгенерировано, но URL не получен")
+
+        # Формируем полный URL если это относительный путь
+        if image_url.startswith("/"):
+            image_url = f"{self.base_url}{image_url}"
+
+        return image_url
+
+    async def generate_image(
+        self,
+        prompt: str,
+        timeout: int = 1200,
+        poll_interval: int = None,
+        task_id: str = None,
+        on_task_created=None,
+        **params,
+    ) -> str:
+        """
+        Полный цикл генерации изображения.
+        :param prompt: Промпт для генерации.
+        :param timeout: Максимальное время ожидания в секундах.
+        :param poll_interval: Фиксированный интервал между проверками (None — адаптивный).
+        :param task_id: ID ранее созданной задачи, ожидание которой нужно продолжить.
+        :param on_task_created: Асинхронный колбэк, получающий ID новой задачи сразу после создания.
+        :param params: Параметры модели из PARAMETERS.
+        :return: URL сгенерированного изображения.
+        """
+        # Все локальные модели работают на одном GPU-хосте: ограничиваем число задач в работе
+        async with provider_slot(LOCAL_GPU):
+            try:
+                image_url = await self._generate_image(prompt, timeout, poll_interval, task_id, on_task_created, **params)
+            except (httpx.RequestError, httpx.HTTPStatusError, RuntimeError, TimeoutError) as e:
+                # Ошибка запроса (4xx) вызвана нашими параметрами: бэкенд отвечает, поэтому это успех
+                # для автомата (иначе пробный запрос в полуоткрытом состоянии остался бы незавершённым)
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure(e)
+                raise
+            self.breaker.record_success()
+            return image_url
+
+    async def _generate_image(self, prompt: str, timeout: int, poll_interval: int, task_id: str,
+                              on_task_created, **params) -> str:
+        if task_id:
+            logger.info(f"Продолжаем ожидание задачи {task_id}")
+            try:
+                task_info = await self.wait_for_completion(task_id, timeout=timeout, poll_interval=poll_interval)
+                return self.resolve_image_url(task_info)
+            except httpx.HTTPStatusError as e:
+                # Сервер мог перезапуститься и потерять очередь задач
+                if e.response.status_code != 404:
+                    raise
+                logger.warning(f"Задача {task_id} не найдена на сервере, создаём новую.")
+
+        task_id = await self.create_task(prompt, **params)
+        if on_task_created:
+            await on_task_created(task_id)
+        task_info = await self.wait_for_completion(
+            task_id=task_id,
+            timeout=timeout,
+            poll_interval=poll_interval,
+        )
+        return self.resolve_image_url(task_info)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from aiohttp import web
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("success", "error")
+
+
+class MidjourneyCallbackReceiver:
+    """
+    Встроенный HTTP-сервер для callBackUrl API Kolersky.
+    Каждый ожидающий requestId получает asyncio.Future, который завершается при приходе колбэка,
+    поэтому ожидание задачи не требует частых запросов /v1/status.
+    """
+
+    MAX_UNCLAIMED = 100  # Колбэки, пришедшие раньше, чем их начали ждать (хранятся последние)
+
+    def __init__(self, public_url: str, host: str = "0.0.0.0", port: int = 8085, token: str = None):
+        """
+        :param public_url: Внешний URL, который передаётся в API как callBackUrl.
+        :param host: Адрес, на котором слушает сервер.
+        :param port: Порт сервера.
+        :param token: Секрет, добавляемый в callBackUrl как ?token=...; колбэки без него отклоняются.
+        """
+        self.path = URL(public_url).path or "/"
+        self.callback_url = str(URL(public_url).update_query(token=token)) if token else public_url
+        self.host = host
+        self.port = port
+        self.token = token
+        self._waiters: dict = {}
+        self._unclaimed: OrderedDict = OrderedDict()
+        self._runner = None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    async def start(self):
+        """Запускает HTTP-сервер."""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Приём колбэков Midjourney на {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Останавливает сервер и отменяет ожидания."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for future in self._waiters.values():
+            future.cancel()
+        self._waiters.clear()
+
+    def expect(self, request_id: str) -> asyncio.Future:
+        """
+        Возвращает Future, который завершится данными колбэка для requestId.
+        Если колбэк уже пришёл, Future возвращается завершённым. Пока Future не завершён,
+        повторные вызовы возвращают его же, поэтому ожидающему достаточно зарегистрироваться
+        один раз до первой проверки статуса.
+        """
+        future = self._waiters.get(request_id)
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[request_id] = future
+        if request_id in self._unclaimed and not future.done():
+            future.set_result(self._unclaimed.pop(request_id))
+        return future
+
+    def discard(self, request_id: str):
+        """Прекращает ожидание колбэка для requestId."""
+        future = self._waiters.pop(request_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.token and request.query.get("token") != self.token:
+            logger.warning(f"Колбэк Midjourney отклонён: неверный токен ({request.remote})")
+            return web.json_response({"ok": False}, status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.json_response({"ok": False}, status=400)
+
+        request_id = data.get("requestId") or data.get("data", {}).get("requestId")
+        status = data.get("status")
+        logger.info(f"Колбэк Midjourney: requestId={request_id}, статус={status}")
+        if request_id and status in FINAL_STATUSES:
+            self._deliver(request_id, data)
+        return web.json_response({"ok": True})
+
+    def _deliver(self, request_id: str, data: dict):
+        """Завершает Future ожидающего или сохраняет колбэк, пока его не начали ждать."""
+        future = self._waiters.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+        else:
+            self._unclaimed[request_id] = data
+            while len(self._unclaimed) > self.MAX_UNCLAIMED:
+                self._unclaimed.popitem(last=False)
+
+
+_receiver = None
+
+
+def get_callback_receiver():
+    """Возвращает запущенный приёмник колбэков процесса или None."""
+    return _receiver if _receiver is not None and _receiver.running else None
+
+
+async def start_callback_receiver(public_url: str, host: str, port: int, token: str = None):
+    """Запускает общий приёмник колбэков (вызывается планировщиком, если задан MIDJOURNEY_CALLBACK_URL)."""
+    global _receiver
+    if get_callback_receiver() is None:
+        _receiver = MidjourneyCallbackReceiver(public_url, host=host, port=port, token=token)
+        await _receiver.start()
+    return _receiver
+
+
+async def stop_callback_receiver():
+    """Останавливает общий приёмник колбэков."""
+    global _receiver
+    if _receiver is not None:
+        await _receiver.stop()
+        _receiver = None
@@ -1,23 +1,78 @@
 import httpx
 import logging
+import asyncio
+import base64
+import hashlib
+import json
 import time
-from config import MIDJOURNEY_API_TOKEN
+from services.http_client import get_client
+from services.midjourney_callback import get_callback_receiver
+from utils.concurrency import MIDJOURNEY, provider_slot
+from utils.metrics import PROVIDER_CALL_SECONDS, RETRIES
+from utils.database import get_cached_upload, save_cached_upload
+from utils.image_utils import file_sha256
+from config import MIDJOURNEY_API_TOKEN, MIDJOURNEY_API_URL, MIDJOURNEY_FALLBACK_POLL, MIDJOURNEY_UPLOAD_TTL_HOURS
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK = 3 * 64 * 1024  # Кратно 3: части base64 склеиваются без промежуточного паддинга
+UPLOAD_CACHE_SERVICE = "midjourney"
+
+
+def _base64_json_body(chunks, size: int, extension: str) -> tuple:
+    """
+    Строит тело {"extension": ..., "image": "<base64>"} потоково, не держа в памяти всю base64-строку.
+    :param chunks: Асинхронный итератор частей изображения (кратных 3 байтам, кроме последней).
+    :param size: Размер изображения в байтах.
+    :param extension: Расширение изображения.
+    :return: Кортеж (длина тела в байтах, асинхронный итератор частей тела).
+    """
+    prefix = json.dumps({"extension": extension})[:-1].encode() + b', "image": "'
+    suffix = b'"}'
+    content_length = len(prefix) + 4 * ((size + 2) // 3) + len(suffix)
+
+    async def _body():
+        yield prefix
+        async for chunk in chunks:
+            yield base64.b64encode(chunk)
+        yield suffix
+
+    return content_length, _body()
+
+
 class MidjourneyService:
     """Сервис для взаимодействия с API Kolersky Midjourney (v1)."""
 
     BASE_URL = "https://api.kolersky.com/v1/midjourney"
     STATUS_URL = "https://api.kolersky.com/v1/status"
 
-    def __init__(self):
+    def __init__(self, base_url: str = None, callback_receiver=None):
+        """
+        :param base_url: Адрес API (по умолчанию MIDJOURNEY_API_URL), например локальный тестовый сервер.
+        :param callback_receiver: Приёмник колбэков (по умолчанию — запущенный планировщиком, если есть).
+        """
         if not MIDJOURNEY_API_TOKEN:
             raise ValueError("MIDJOURNEY_API_TOKEN отсутствует. Проверьте файл config.py.")
+        api_url = (base_url or MIDJOURNEY_API_URL).rstrip("/")
+        self.BASE_URL = f"{api_url}/v1/midjourney"
+        self.STATUS_URL = f"{api_url}/v1/status"
         self.headers = {"Authorization": f"Bearer {MIDJOURNEY_API_TOKEN}"}
-        self.client = httpx.Client(headers=self.headers, timeout=30)
-
-    def create_imagine_task(self, prompt: str, aspect_ratio: str = "1:1", speed: str = "relaxed") -> dict:
+        self.timeout = 30
+        self.client = get_client(self.BASE_URL)
+        self.callback_receiver = callback_receiver
+
+    @property
+    def receiver(self):
+        """Активный приёмник колбэков или None (тогда используется обычный опрос статуса)."""
+        return self.callback_receiver or get_callback_receiver()
+
+    def _with_callback(self, payload: dict) -> dict:
+        """Добавляет callBackUrl в тело запроса, если приёмник колбэков запущен."""
+        if self.receiver is not None:
+            payload["callBackUrl"] = self.receiver.callback_url
+        return payload
+
+    async def create_imagine_task(self, prompt: str, aspect_ratio: str = "1:1", speed: str = "relaxed") -> dict:
         """Создание задачи генерации изображения (text-to-image)."""
         # Ограничиваем длину промпта (Midjourney имеет лимит ~600 символов)
         MAX_PROMPT_LENGTH = 600
@@ -33,13 +88,16 @@ class MidjourneyService:
             "speed": speed
         }
         logger.info(f"Отправка запроса text-to-image, длина промпта: {len(prompt)} символов")
-        response = self.client.post(url, json=payload)
+        response = await self.client.post(url, headers=self.headers, timeout=self.timeout,
+                                         json=self._with_callback(payload))
         response.raise_for_status()
         return response.json()
 
-    def upload_image(self, image_path: str, extension: str = None) -> str:
+    async def upload_image(self, image_path: str, extension: str = None) -> str:
         """
         Загружает изображение напрямую в API и возвращает CDN URL.
+        Файл не читается в память целиком: тело запроса кодируется в base64 по частям.
+        Повторная загрузка того же содержимого в пределах MIDJOURNEY_UPLOAD_TTL_HOURS берёт URL из кэша.
 
         Args:
             image_path: Путь к файлу изображения
@@ -48,27 +106,65 @@ class MidjourneyService:
         Returns:
             URL загруженного изображения на CDN
         """
-        import base64
         import os
 
         # Определяем расширение файла
         if extension is None:
             extension = os.path.splitext(image_path)[1].lstrip('.').lower()
-            if extension == 'jpg':
-                extension = 'jpeg'
 
-        # Читаем файл и конвертируем в base64
-        with open(image_path, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
+        content_hash = await asyncio.to_thread(file_sha256, image_path)
+        size = os.path.getsize(image_path)
 
-        url = f"{self.BASE_URL}/image/upload"
-        payload = {
-            "image": image_data,
-            "extension": extension
-        }
+        async def _chunks():
+            with open(image_path, 'rb') as f:
+                while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK):
+                    yield chunk
+
+        logger.info(f"Загрузка изображения {image_path}...")
+        return await self._upload(content_hash, size, _chunks, extension)
+
+    async def upload_image_bytes(self, image_data: bytes, extension: str) -> str:
+        """
+        Загружает изображение из памяти в API и возвращает CDN URL (без промежуточного файла).
+
+        Args:
+            image_data: Содержимое изображения
+            extension: Расширение (png, jpg, jpeg, webp)
 
-        logger.info(f"Загрузка изображения {image_path} (расширение: {extension})...")
-        response = self.client.post(url, json=payload)
+        Returns:
+            URL загруженного изображения на CDN
+        """
+        async def _chunks():
+            view = memoryview(image_data)
+            for start in range(0, len(view), UPLOAD_CHUNK):
+                yield view[start:start + UPLOAD_CHUNK]
+
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        return await self._upload(content_hash, len(image_data), _chunks, extension)
+
+    async def _upload(self, content_hash: str, size: int, chunks, extension: str) -> str:
+        """
+        Отправляет изображение в /image/upload потоковым JSON-телом или возвращает URL из кэша.
+        :param content_hash: SHA-256 содержимого.
+        :param size: Размер изображения в байтах.
+        :param chunks: Функция, возвращающая асинхронный итератор частей изображения.
+        :param extension: Расширение изображения.
+        """
+        if extension == 'jpg':
+            extension = 'jpeg'
+
+        cdn_url = await get_cached_upload(content_hash, UPLOAD_CACHE_SERVICE, MIDJOURNEY_UPLOAD_TTL_HOURS)
+        if cdn_url:
+            logger.info(f"✅ Изображение уже загружено, URL из кэша: {cdn_url}")
+            return cdn_url
+
+        content_length, body = _base64_json_body(chunks(), size, extension)
+        headers = {**self.headers, "Content-Type": "application/json", "Content-Length": str(content_length)}
+
+        url = f"{self.BASE_URL}/image/upload"
+        logger.info(f"Загрузка изображения: {size} байт (расширение: {extension})...")
+        with PROVIDER_CALL_SECONDS.time(provider=MIDJOURNEY, operation="upload"):
+            response = await self.client.post(url, headers=headers, timeout=self.timeout, content=body)
         response.raise_for_status()
         result = response.json()
 
@@ -76,10 +172,11 @@ class MidjourneyService:
             raise ValueError(f"URL отсутствует в ответе: {result}")
 
         cdn_url = result["url"]
+        save_cached_upload(content_hash, UPLOAD_CACHE_SERVICE, cdn_url)
         logger.info(f"✅ Изображение загружено: {cdn_url}")
         return cdn_url
 
-    def create_image_to_image_task(self, file_url: str, prompt: str, aspect_ratio: str = "16:9") -> dict:
+    async def create_image_to_image_task(self, file_url: str, prompt: str, aspect_ratio: str = "16:9") -> dict:
         """Создание задачи image-to-image (минимальные изменения изображения)."""
         url = f"{self.BASE_URL}/generate"
         payload = {
@@ -89,13 +186,14 @@ class MidjourneyService:
             "aspectRatio": aspect_ratio
         }
         logger.info(f"Отправка запроса image-to-image: {payload}")
-        response = self.client.post(url, json=payload)
+        response = await self.client.post(url, headers=self.headers, timeout=self.timeout,
+                                         json=self._with_callback(payload))
         response.raise_for_status()
         result = response.json()
         logger.info(f"Ответ API на image-to-image: {result}")
         return result
 
-    def create_video_task(self, file_url: str, prompt: str = "", motion: str = "high",
+    async def create_video_task(self, file_url: str, prompt: str = "", motion: str = "high",
                          video_batch_size: int = 1, task_type: str = "image-to-video-hd") -> dict:
         """
         Создание задачи генерации видео из изображения.
@@ -118,49 +216,81 @@ class MidjourneyService:
             payload["prompt"] = prompt
 
         logger.info(f"Отправка запроса на создание видео: {payload}")
-        response = self.client.post(url, json=payload)
+        response = await self.client.post(url, headers=self.headers, timeout=self.timeout,
+                                         json=self._with_callback(payload))
         response.raise_for_status()
         result = response.json()
         logger.info(f"Ответ API на создание видео: {result}")
         return result
 
-    def get_task_status(self, request_id: str) -> dict:
+    async def get_task_status(self, request_id: str) -> dict:
         """Получение статуса задачи."""
         url = f"{self.STATUS_URL}?requestId={request_id}"
-        response = self.client.get(url)
+        response = await self.client.get(url, headers=self.headers, timeout=self.timeout)
         response.raise_for_status()
         return response.json()
 
-    def wait_for_task_completion(self, request_id: str, timeout: int = 300) -> dict:
-        """Ожидание завершения задачи."""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            result = self.get_task_status(request_id)
-            # API возвращает статус на верхнем уровне
-            status = result.get("status")
-            if status == "success":
-                return result
-            elif status == "error":
-                # failReason может быть: верхнем уровне, в output, или в data.output
-                fail_reason = (
-                    result.get("failReason") or
-                    result.get("output", {}).get("failReason") or
-                    result.get("data", {}).get("output", {}).get("failReason", "Unknown error")
-                )
-                logger.error(f"Полный ответ API с ошибкой: {result}")
-                raise Exception(f"Задача {request_id} завершилась с ошибкой: {fail_reason}")
-            time.sleep(10)  # Интервал проверки 10 секунд
+    async def wait_for_task_completion(self, request_id: str, timeout: int = 300, poll_interval: int = 10) -> dict:
+        """
+        Ожидание завершения задачи.
+        Если запущен приёмник колбэков, статус запрашивается сразу после колбэка
+        и изредка (MIDJOURNEY_FALLBACK_POLL) на случай потерянного колбэка.
+        Ожидание не блокирует event loop и может быть отменено через отмену корутины.
+        """
+        receiver = self.receiver
+        callback = None
+        if receiver is not None:
+            poll_interval = max(poll_interval, MIDJOURNEY_FALLBACK_POLL)
+            # Future регистрируется до первой проверки статуса и остаётся зарегистрированным между итерациями:
+            # колбэк, пришедший во время запроса /v1/status, завершит его, а не потеряется
+            callback = receiver.expect(request_id)
+        start_time = time.monotonic()
+        try:
+            while time.monotonic() - start_time < timeout:
+                if callback is not None:
+                    remaining = timeout - (time.monotonic() - start_time)
+                    try:
+                        await asyncio.wait_for(asyncio.shield(callback), min(poll_interval, remaining))
+                        logger.info(f"Получен колбэк для задачи {request_id}")
+                        # Если статус ещё не итоговый, следующий колбэк ждём новым Future
+                        callback = receiver.expect(request_id)
+                    except asyncio.TimeoutError:
+                        logger.info(f"Колбэк для задачи {request_id} не пришёл, резервная проверка статуса")
+
+                # Итоговый ответ берётся из /v1/status, чтобы его структура не зависела от формата колбэка
+                result = await self.get_task_status(request_id)
+                # API возвращает статус на верхнем уровне
+                status = result.get("status")
+                if status == "success":
+                    return result
+                elif status == "error":
+                    # failReason может быть: верхнем уровне, в output, или в data.output
+                    fail_reason = (
+                        result.get("failReason") or
+                        result.get("output", {}).get("failReason") or
+                        result.get("data", {}).get("output", {}).get("failReason", "Unknown error")
+                    )
+                    logger.error(f"Полный ответ API с ошибкой: {result}")
+                    raise Exception(f"Задача {request_id} завершилась с ошибкой: {fail_reason}")
+                if receiver is None:
+                    await asyncio.sleep(poll_interval)
+        finally:
+            if receiver is not None:
+                receiver.discard(request_id)
         raise TimeoutError(f"Задача {request_id} не завершилась за {timeout} секунд.")
 
-    def execute_with_retry(self, task_func, task_name: str, max_retries: int = 2, retry_delay: int = 300):
+    async def execute_with_retry(self, task_func, task_name: str, max_retries: int = 2, retry_delay: int = 300,
+                                 request_id: str = None, on_task_created=None):
         """
         Выполняет задачу с повторными попытками при ошибках.
 
         Args:
-            task_func: Функция для выполнения (должна возвращать request_id)
+            task_func: Функция без аргументов, возвращающая корутину создания задачи (ответ с requestId)
             task_name: Название задачи для логирования
             max_retries: Максимальное количество попыток (по умолчанию 2: первая + 1 повтор)
             retry_delay: Задержка между попытками в секундах (по умолчанию 300 = 5 минут)
+            request_id: requestId ранее созданной задачи: первая попытка продолжает её ожидание без новой генерации
+            on_task_created: Асинхронный колбэк, получающий requestId новой задачи сразу после создания
 
         Returns:
             Результат успешного выполнения задачи
@@ -172,24 +302,36 @@ class MidjourneyService:
             try:
                 logger.info(f"Попытка {attempt}/{max_retries} для задачи: {task_name}")
 
-                # Выполняем функцию создания задачи
-                task_result = task_func()
-
-                if "requestId" not in task_result:
-                    logger.error(f"Ключ 'requestId' отсутствует в ответе: {task_result}")
-                    raise KeyError("Ключ 'requestId' отсутствует в ответе.")
-
-                request_id = task_result["requestId"]
-                logger.info(f"Ожидание завершения задачи {task_name} (requestId: {request_id})...")
-
-                # Ожидаем завершения
-                result = self.wait_for_task_completion(request_id)
-                logger.info(f"✅ Задача {task_name} успешно завершена!")
-                return result
+                # Слот занимается на время генерации, но не на паузу между попытками
+                if attempt > 1:
+                    RETRIES.inc(provider=MIDJOURNEY, reason="error")
+                async with provider_slot(MIDJOURNEY), PROVIDER_CALL_SECONDS.time(provider=MIDJOURNEY, operation="generation"):
+                    if request_id:
+                        # Задача уже оплачена и создана (например, до перезапуска процесса)
+                        logger.info(f"Продолжаем ожидание задачи {task_name} (requestId: {request_id})...")
+                    else:
+                        # Выполняем функцию создания задачи
+                        task_result = await task_func()
+
+                        if "requestId" not in task_result:
+                            logger.error(f"Ключ 'requestId' отсутствует в ответе: {task_result}")
+                            raise KeyError("Ключ 'requestId' отсутствует в ответе.")
+
+                        request_id = task_result["requestId"]
+                        if on_task_created:
+                            await on_task_created(request_id)
+                        logger.info(f"Ожидание завершения задачи {task_name} (requestId: {request_id})...")
+
+                    # Ожидаем завершения
+                    result = await self.wait_for_task_completion(request_id)
+                    logger.info(f"✅ Задача {task_name} успешно завершена!")
+                    return result
 
             except Exception as e:
                 error_message = str(e)
                 logger.error(f"❌ Попытка {attempt}/{max_retries} не удалась: {error_message}")
+                # Следующая попытка создаёт новую задачу
+                request_id = None
 
                 # Если это последняя попытка - прокидываем ошибку дальше
                 if attempt >= max_retries:
@@ -198,5 +340,5 @@ class MidjourneyService:
 
                 # Иначе ждем перед следующей попыткой
                 logger.info(f"⏳ Ожидание {retry_delay} секунд перед следующей попыткой...")
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
                 logger.info(f"🔄 Начинаем повторную попытку...")
@@ -0,0 +1,102 @@
+import asyncio
+import random
+import statistics
+import time
+
+
+def median_duration(durations) -> float:
+    """Возвращает медиану истории длительностей или None, если истории нет."""
+    durations = list(durations)
+    return statistics.median(durations) if durations else None
+
+
+class AdaptivePoller:
+    """
+    Вычисляет паузы между запросами статуса задачи.
+
+    Если известна типичная длительность генерации, пауза равна половине ожидаемого
+    оставшегося времени (с учётом позиции в очереди), поэтому частые запросы идут
+    только вблизи ожидаемого завершения. Без оценки или после её превышения паузы
+    растут экспоненциально. К каждой паузе добавляется случайный разброс.
+    """
+
+    def __init__(
+        self,
+        expected_duration: float = None,
+        min_interval: float = 2,
+        max_interval: float = 60,
+        initial_interval: float = 5,
+        backoff: float = 1.5,
+        jitter: float = 0.2,
+        timeout: float = None,
+    ):
+        """
+        :param expected_duration: Ожидаемое время генерации одной задачи (сек), например медиана истории.
+        :param min_interval: Минимальная пауза.
+        :param max_interval: Максимальная пауза.
+        :param initial_interval: Первая пауза при отсутствии оценки.
+        :param backoff: Множитель экспоненциального роста паузы.
+        :param jitter: Доля случайного разброса паузы (0.2 = ±20%).
+        :param timeout: Общее время ожидания; паузы не выходят за него.
+        """
+        self.expected_duration = expected_duration
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout if timeout else None
+        self.processing_started_at = None
+        self._backoff_interval = initial_interval
+
+    @property
+    def elapsed(self) -> float:
+        """Время с начала ожидания."""
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        """Истекло ли общее время ожидания."""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def estimate_remaining(self, queue_position: int = None) -> float:
+        """
+        Оценивает оставшееся время до завершения задачи.
+        :param queue_position: Позиция в очереди (0/None — задача уже выполняется).
+        :return: Оценка в секундах (может быть отрицательной, если оценка превышена) или None.
+        """
+        if not self.expected_duration:
+            return None
+        if queue_position:
+            self.processing_started_at = None
+            return (queue_position + 1) * self.expected_duration
+        if self.processing_started_at is None:
+            self.processing_started_at = time.monotonic()
+        return self.expected_duration - (time.monotonic() - self.processing_started_at)
+
+    def next_delay(self, queue_position: int = None) -> float:
+        """
+        Возвращает паузу перед следующим запросом статуса.
+        :param queue_position: Позиция задачи в очереди, если API её сообщает.
+        :return: Пауза в секундах.
+        """
+        remaining = self.estimate_remaining(queue_position)
+        if remaining is not None and remaining > self.min_interval:
+            delay = remaining / 2
+            self._backoff_interval = self.min_interval
+        else:
+            # Оценки нет или она превышена: экспоненциальный рост паузы
+            delay = self._backoff_interval
+            self._backoff_interval = min(self._backoff_interval * self.backoff, self.max_interval)
+
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.deadline is not None:
+            delay = max(0.0, min(delay, self.deadline - time.monotonic()))
+        return delay
+
+    async def sleep(self, queue_position: int = None) -> float:
+        """Асинхронно ждёт следующую паузу и возвращает её длительность."""
+        delay = self.next_delay(queue_position)
+        await asyncio.sleep(delay)
+        return delay
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import logging
+import time
+import httpx
+from config import HEALTH_CHECK_TIMEOUT, HEALTH_CHECK_TTL, LOCAL_DEADLINE_MINUTES, LOCAL_FALLBACKS
+from services.circuit_breaker import OPEN, BackendUnavailableError
+from services.ernie_service import ErnieService
+from services.hidream_service import HiDreamService
+from services.latency import TOTAL
+from services.qwen_service import QwenService
+from services.zimage_service import ZImageService
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Взаимозаменяемые локальные модели: имя раннера -> класс сервиса
+LOCAL_BACKENDS = {
+    "qwen": QwenService,
+    "zimage": ZImageService,
+    "ernie": ErnieService,
+    "hidream": HiDreamService,
+}
+
+HEALTHY_STATUSES = ("healthy", "ok")
+
+# Параметры, одинаковые по смыслу у всех локальных моделей; только они передаются замене.
+# Остальные (model, num_inference_steps, guidance_scale и т.п.) у замены остаются по умолчанию.
+PORTABLE_PARAMETERS = ("negative_prompt", "aspect_ratio", "width", "height", "seed")
+
+_health: dict = {}  # SERVICE_NAME -> (время проверки, здоров ли)
+
+REROUTES = Counter(
+    "utriskra_reroutes_total", "Генерации, переданные другому бэкенду", ("preferred", "backend"))
+
+
+async def check_health(service) -> bool:
+    """
+    Проверяет /api/v1/health бэкенда с коротким тайм-аутом; результат кэшируется на HEALTH_CHECK_TTL.
+    Неудачная проверка сразу размыкает автомат бэкенда.
+    :param service: Экземпляр LocalDiffusionService.
+    :return: True, если бэкенд отвечает и модель загружена.
+    """
+    cached = _health.get(service.SERVICE_NAME)
+    if cached and time.monotonic() - cached[0] < HEALTH_CHECK_TTL:
+        return cached[1]
+
+    try:
+        info = await asyncio.wait_for(service.health_check(), HEALTH_CHECK_TIMEOUT)
+        healthy = info.get("status") in HEALTHY_STATUSES and info.get("model_loaded", True) is not False
+        reason = f"ответ {info}"
+    except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as e:
+        healthy, reason = False, repr(e)
+
+    _health[service.SERVICE_NAME] = (time.monotonic(), healthy)
+    if not healthy:
+        logger.warning(f"{service.SERVICE_NAME} не прошёл проверку здоровья: {reason}")
+        service.breaker.trip(f"проверка здоровья: {reason}")
+    return healthy
+
+
+def local_candidates(preferred: str) -> list:
+    """
+    Возвращает бэкенды в порядке попыток: основной, затем замены из LOCAL_FALLBACKS.
+    :param preferred: Имя основного бэкенда (ключ LOCAL_BACKENDS).
+    :return: Список пар (имя, экземпляр сервиса).
+    """
+    names = [preferred] + [name for name in LOCAL_FALLBACKS if name != preferred and name in LOCAL_BACKENDS]
+    return [(name, LOCAL_BACKENDS[name]()) for name in names]
+
+
+def forwarded_params(service, params: dict, rerouted: bool) -> dict:
+    """
+    Отбирает параметры генерации для бэкенда.
+    :param service: Экземпляр LocalDiffusionService, выполняющий генерацию.
+    :param params: Параметры, заданные раннером для основной модели.
+    :param rerouted: True, если генерация передана замене.
+    :return: Параметры, которые поддерживает бэкенд (для замены — только из PORTABLE_PARAMETERS).
+    """
+    return {
+        key: value for key, value in params.items()
+        if key in service.PARAMETERS and (not rerouted or key in PORTABLE_PARAMETERS)
+    }
+
+
+def _remote_key(stage: str, name: str, preferred: str) -> str:
+    # Основной бэкенд использует прежний ключ этапа, чтобы продолжались задачи, созданные до маршрутизации
+    return stage if name == preferred else f"{stage}:{name}"
+
+
+def publish_deadline(started_at: datetime.datetime):
+    """
+    Возвращает срок публикации для раннера, запущенного в started_at, или None,
+    если LOCAL_DEADLINE_MINUTES не задан (раннер всегда использует основную модель).
+    """
+    if not LOCAL_DEADLINE_MINUTES:
+        return None
+    return started_at + datetime.timedelta(minutes=LOCAL_DEADLINE_MINUTES)
+
+
+async def select_by_deadline(candidates: list, deadline: datetime.datetime) -> list:
+    """
+    Упорядочивает бэкенды по шансам успеть к сроку публикации.
+    Основной бэкенд (первый) остаётся первым, если его p95 полного времени укладывается в срок
+    или замеров ещё нет. Иначе вперёд идут бэкенды, чей p95 укладывается в срок (быстрые первыми),
+    затем бэкенды без замеров, затем остальные по p50.
+    :param candidates: Пары (имя, экземпляр сервиса), основной первым.
+    :param deadline: Срок публикации (naive datetime по локальному времени).
+    :return: Пары в порядке попыток.
+    """
+    remaining = (deadline - datetime.datetime.now()).total_seconds()
+    for _, service in candidates:
+        await service.latency.load()
+
+    def fits(service) -> bool:
+        p95 = service.latency.p95(TOTAL)
+        return p95 is not None and p95 <= remaining
+
+    preferred = candidates[0][1]
+    if fits(preferred) or preferred.latency.p95(TOTAL) is None:
+        return candidates
+
+    def rank(pair):
+        latency = pair[1].latency
+        if fits(pair[1]):
+            return 0, latency.p95(TOTAL)
+        if latency.p50(TOTAL) is None:
+            return 1, 0
+        return 2, latency.p50(TOTAL)
+
+    ranked = sorted(candidates, key=rank)
+    logger.info(
+        f"До срока публикации {remaining:.0f} сек, {preferred.SERVICE_NAME} не успевает "
+        f"({preferred.latency.summary()}); порядок: "
+        + ", ".join(f"{service.SERVICE_NAME} ({service.latency.summary()})" for _, service in ranked)
+    )
+    return ranked
+
+
+async def generate_local_image(preferred: str, prompt: str, job=None, stage: str = "image",
+                               timeout: int = 1200, deadline: datetime.datetime = None, **params) -> dict:
+    """
+    Генерирует изображение на основном локальном бэкенде или, если он недоступен, на исправной замене.
+    Бэкенды с разомкнутым автоматом пропускаются без запросов, остальные проверяются через /api/v1/health,
+    поэтому упавший сервер не съедает тайм-аут генерации.
+    :param preferred: Имя основного бэкенда (ключ LOCAL_BACKENDS).
+    :param prompt: Промпт для генерации.
+    :param job: Задание журнала: ID удалённой задачи сохраняется отдельно для каждого бэкенда.
+    :param stage: Этап задания, к которому относится удалённая задача.
+    :param timeout: Максимальное время ожидания одной генерации (сек).
+    :param deadline: Срок публикации; если задан, бэкенд выбирается по p95 прошлых генераций
+                     (см. select_by_deadline), и раннер перестаёт быть привязан к одной модели.
+    :param params: Параметры основной модели; замене передаются только общие (PORTABLE_PARAMETERS).
+    :return: Словарь с backend (имя), label (буква для водяного знака) и image_url.
+    :raises BackendUnavailableError: Если ни один бэкенд не смог выполнить генерацию.
+    """
+    errors, available = [], []
+    for name, service in local_candidates(preferred):
+        if service.breaker.state == OPEN:
+            errors.append(f"{service.SERVICE_NAME}: автомат разомкнут ({service.breaker.last_error})")
+        elif not await check_health(service):
+            errors.append(f"{service.SERVICE_NAME}: не прошёл проверку здоровья")
+        else:
+            available.append((name, service))
+
+    if job is not None and any(job.remote_id(_remote_key(stage, name, preferred)) for name, _ in available):
+        # Уже созданная задача продолжается на своём бэкенде, а не выбирается заново
+        available.sort(key=lambda pair: job.remote_id(_remote_key(stage, pair[0], preferred)) is None)
+    elif deadline is not None and available:
+        available = await select_by_deadline(available, deadline)
+
+    for name, service in available:
+        if not service.breaker.allow():
+            errors.append(f"{service.SERVICE_NAME}: пробный запрос уже выполняется")
+            continue
+
+        remote_key = _remote_key(stage, name, preferred)
+        if name != preferred:
+            logger.warning(f"{preferred}: генерация передана {service.SERVICE_NAME} ({'; '.join(errors) or 'по сроку'})")
+            REROUTES.inc(preferred=preferred, backend=name)
+        supported = forwarded_params(service, params, rerouted=name != preferred)
+        try:
+            image_url = await service.generate_image(
+                prompt=prompt,
+                timeout=timeout,
+                task_id=job.remote_id(remote_key) if job is not None else None,
+                on_task_created=job.remote_saver(remote_key) if job is not None else None,
+                **supported,
+            )
+        except (httpx.HTTPError, RuntimeError, asyncio.TimeoutError) as e:
+            logger.error(f"{service.SERVICE_NAME}: генерация не удалась: {e}")
+            errors.append(f"{service.SERVICE_NAME}: {e}")
+            continue
+        return {"backend": name, "label": service.LABEL, "image_url": image_url}
+
+    raise BackendUnavailableError(f"Нет доступного бэкенда для {preferred}: {'; '.join(errors)}")
+
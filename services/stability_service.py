@@ -1,6 +1,7 @@
 import httpx
 import random
 import logging
+from services.http_client import get_client
 from config import STABILITY_API_KEY
 
 logger = logging.getLogger(__name__)
@@ -34,26 +35,27 @@ class StabilityService:
             "seed": (None, str(random_seed))
         }
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                response = await client.post(
-                    self.API_URL,
-                    headers=self.headers,
-                    files=files
-                )
+        client = get_client(self.API_URL)
+        try:
+            response = await client.post(
+                self.API_URL,
+                headers=self.headers,
+                timeout=self.timeout,
+                files=files
+            )
 
-                if response.status_code == 200:
-                    logger.info("Изображение успешно сгенерировано.")
-                    return response.content
-                else:
-                    logger.error(f"Ошибка API Stability AI: {response.status_code} - {response.text}")
-                    response.raise_for_status()
-            except httpx.RequestError as e:
-                logger.error(f"Ошибка подключения к Stability AI: {e}")
-                raise
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Ошибка статуса HTTP: {e.response.status_code} - {e.response.text}")
-                raise
-            except Exception as e:
-                logger.error(f"Неизвестная ошибка: {e}")
-                raise
+            if response.status_code == 200:
+                logger.info("Изображение успешно сгенерировано.")
+                return response.content
+            else:
+                logger.error(f"Ошибка API Stability AI: {response.status_code} - {response.text}")
+                response.raise_for_status()
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка подключения к Stability AI: {e}")
+            raise
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Ошибка статуса HTTP: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Неизвестная ошибка: {e}")
+            raise
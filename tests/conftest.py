@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# config.py требует эти переменные при импорте; база и файлы тестов — во временном каталоге
+_storage = tempfile.mkdtemp(prefix="utriskra-tests-")
+os.environ.setdefault("GEMINI_API_KEYS", "test-key")
+os.environ.setdefault("BASE_STORAGE_PATH", _storage)
+os.environ.setdefault("DB_PATH", os.path.join(_storage, "test.db"))
+os.environ.setdefault("METRICS_PORT", "0")
+
+
+@pytest.fixture
+def process_database(tmp_path, monkeypatch):
+    """Общее соединение utils.database на временной базе."""
+    from utils import database
+
+    database.close_database()
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "db" / "test.db"))
+    database.initialize_database()
+    yield
+    database.close_database()
@@ -0,0 +1,120 @@
+import asyncio
+import httpx
+import pytest
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, BackendUnavailableError, CircuitBreaker
+from services.qwen_service import QwenService
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет time.monotonic модуля автомата управляемыми часами."""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def clean_breakers():
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = dict(failure_threshold=3, failure_rate=0.5, window=10, cooldown=60)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = make_breaker(failure_rate=1.0)
+    for _ in range(2):
+        breaker.record_failure("boom")
+        assert breaker.state == CLOSED
+    breaker.record_failure("boom")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    with pytest.raises(BackendUnavailableError):
+        breaker.check()
+
+
+def test_opens_on_failure_rate_in_window(clock):
+    breaker = make_breaker(failure_threshold=3, failure_rate=0.5)
+    for outcome in (True, False, True, False):
+        breaker.record_success() if outcome else breaker.record_failure("boom")
+    assert breaker.state == OPEN
+
+
+def test_trip_opens_immediately(clock):
+    breaker = make_breaker()
+    breaker.trip("health")
+    assert breaker.state == OPEN
+    assert breaker.last_error == "health"
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = make_breaker()
+    breaker.trip("health")
+    clock[0] += 60
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # второй пробный запрос не пропускается
+
+
+def test_probe_success_closes(clock):
+    breaker = make_breaker()
+    breaker.trip("health")
+    clock[0] += 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens_for_full_cooldown(clock):
+    breaker = make_breaker()
+    breaker.trip("health")
+    clock[0] += 60
+    assert breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == OPEN
+    clock[0] += 59
+    assert breaker.state == OPEN
+    clock[0] += 1
+    assert breaker.state == HALF_OPEN
+
+
+def test_stuck_probe_expires_after_cooldown(clock):
+    breaker = make_breaker()
+    breaker.trip("health")
+    clock[0] += 60
+    assert breaker.allow()
+    clock[0] += 30
+    assert not breaker.allow()
+    clock[0] += 30
+    assert breaker.allow()
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://backend/api/v1/generate")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("status, expected", [(422, CLOSED), (503, OPEN)])
+def test_probe_outcome_of_http_errors(clock, monkeypatch, status, expected):
+    service = QwenService(base_url="http://backend")
+
+    async def failing(*args, **kwargs):
+        raise _status_error(status)
+
+    monkeypatch.setattr(service, "_generate_image", failing)
+    service.breaker.trip("health")
+    clock[0] += service.breaker.cooldown
+    assert service.breaker.allow()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(service.generate_image("cat"))
+    # 4xx: бэкенд отвечает — пробный запрос завершён и автомат замкнут; 5xx — снова разомкнут
+    assert service.breaker.state == expected
+    assert service.breaker._probe_started_at is None
@@ -0,0 +1,100 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import Future
+import pytest
+from utils import database
+from utils.database import MIGRATIONS, _Database, _migrate
+
+
+def _tables(conn) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _connect(tmp_path) -> sqlite3.Connection:
+    return sqlite3.connect(tmp_path / "test.db", isolation_level=None)
+
+
+def test_fresh_database_gets_all_migrations(tmp_path):
+    conn = _connect(tmp_path)
+    assert _migrate(conn) == len(MIGRATIONS) == 9
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 9
+    assert {
+        "daily_images", "telegram_files", "jobs", "job_stages", "prompt_pool", "image_backlog",
+        "reaction_index", "reaction_index_state", "upload_cache", "backend_timings",
+    } <= _tables(conn)
+
+
+def test_upgrade_keeps_data_and_applies_only_missing_migrations(tmp_path):
+    conn = _connect(tmp_path)
+    for statement in filter(str.strip, MIGRATIONS[0].split(";")):
+        conn.execute(statement)
+    conn.execute("PRAGMA user_version = 1")
+    conn.execute(
+        "INSERT INTO daily_images (date, system_prompt, user_prompt, generated_prompt, image_path) VALUES (?, ?, ?, ?, ?)",
+        ("2026-01-01", "s", "u", "g", "/tmp/a.png"),
+    )
+
+    assert _migrate(conn) == 9
+    assert conn.execute("SELECT generated_prompt FROM daily_images").fetchall() == [("g",)]
+    # Повторный запуск ничего не применяет и не падает на уже созданных таблицах
+    assert _migrate(conn) == 9
+
+
+def test_failed_operation_is_rolled_back_to_its_savepoint(tmp_path):
+    db = _Database(str(tmp_path / "test.db"))
+    db.conn = sqlite3.connect(db.path, check_same_thread=False, isolation_level=None)
+    db.conn.execute("CREATE TABLE items (value TEXT)")
+
+    def failing(conn):
+        conn.execute("INSERT INTO items VALUES ('lost')")
+        raise ValueError("boom")
+
+    batch = [
+        (lambda conn: conn.execute("INSERT INTO items VALUES ('first')"), Future()),
+        (failing, Future()),
+        (lambda conn: conn.execute("INSERT INTO items VALUES ('last')").rowcount, Future()),
+    ]
+    db._execute_batch(batch)
+
+    assert [row[0] for row in db.conn.execute("SELECT value FROM items")] == ["first", "last"]
+    assert isinstance(batch[1][1].exception(), ValueError)
+    assert batch[2][1].result() == 1
+
+
+def test_backlog_item_stays_until_marked_used(process_database):
+    async def scenario():
+        database.add_to_backlog("midjourney", "2026-01-01", "prompt", "/a.png", "/a.jpg")
+        first = await database.get_next_backlog_item()
+        # Отправка не удалась: изображение остаётся первым в запасе
+        assert await database.get_next_backlog_item() == first
+        await database.mark_backlog_used(first["id"])
+        return await database.get_next_backlog_item()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_failed_migration_stops_writer_and_can_be_retried(tmp_path, monkeypatch):
+    def writers() -> int:
+        return sum(thread.name == "sqlite-writer" for thread in threading.enumerate())
+
+    database.close_database()
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "db" / "test.db"))
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS + ["CREATE TABLE broken (id INTEGER"])
+    started_with = writers()
+
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            database._get_database()
+    assert database._database is None
+    assert writers() == started_with
+
+    # Все миграции применены в одной транзакции и откатились вместе с ошибочной
+    conn = _connect(tmp_path / "db")
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS)
+    database.initialize_database()
+    assert database._database is not None
+    database.close_database()
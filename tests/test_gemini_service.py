@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from services import gemini_service
+from services.gemini_service import GeminiService, _KeyUnavailable
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_API_KEYS", ["key-a", "key-b"])
+    monkeypatch.setattr(gemini_service, "GEMINI_REQUIRE_PROXY", False)
+    monkeypatch.setattr(GeminiService, "_key_cooldowns", {})
+    return GeminiService(hedge=True, hedge_delay=0.01)
+
+
+def fake_requests(service, monkeypatch, behaviour: dict):
+    """behaviour: ключ -> (задержка, ответ или исключение)."""
+    calls = []
+
+    async def request(key, payload):
+        calls.append(key)
+        delay, outcome = behaviour[key]
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(service, "_request", request)
+    return calls
+
+
+def test_hedged_failure_cools_down_the_key_that_failed(service, monkeypatch):
+    calls = fake_requests(service, monkeypatch, {
+        "key-a": (0.2, "slow answer"),
+        "key-b": (0, _KeyUnavailable("key-b", "503")),
+    })
+
+    assert asyncio.run(service.generate_prompt("system", "user")) == "slow answer"
+    assert calls == ["key-a", "key-b"]
+    assert service._healthy_keys() == ["key-a"]
+
+
+def test_hedged_pair_failure_cools_down_both_keys(service, monkeypatch):
+    fake_requests(service, monkeypatch, {
+        "key-a": (0.05, _KeyUnavailable("key-a", "503")),
+        "key-b": (0, _KeyUnavailable("key-b", "429")),
+    })
+
+    with pytest.raises(RuntimeError, match="исчерпаны"):
+        asyncio.run(service.generate_prompt("system", "user"))
+    assert service._healthy_keys() == []
+
+
+def test_single_key_failure_cools_down_only_that_key(service, monkeypatch):
+    service.hedge = False
+    calls = fake_requests(service, monkeypatch, {
+        "key-a": (0, _KeyUnavailable("key-a", "503")),
+        "key-b": (0, "answer"),
+    })
+
+    assert asyncio.run(service.generate_prompt("system", "user")) == "answer"
+    assert calls == ["key-a", "key-b"]
+    assert service._healthy_keys() == ["key-b"]
@@ -0,0 +1,107 @@
+import asyncio
+import io
+import os
+import random
+import pytest
+from PIL import Image
+from utils import image_utils
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+FONTS_DIR = os.path.join(os.path.dirname(__file__), "..", "fonts")
+
+
+def grid_bytes(size: int = 64) -> bytes:
+    """Сетка 2x2, ячейки которой залиты цветами COLORS в порядке позиций 1-4."""
+    grid = Image.new("RGB", (size, size))
+    half = size // 2
+    for (left, top), color in zip([(0, 0), (half, 0), (0, half), (half, half)], COLORS):
+        grid.paste(color, (left, top, left + half, top + half))
+    buffer = io.BytesIO()
+    grid.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_split_grid_writes_cells_in_position_order(tmp_path):
+    paths = [str(tmp_path / f"cell_{position}.png") for position in range(1, 5)]
+    delivery_paths = asyncio.run(image_utils.split_grid(grid_bytes(), paths, delivery_profile="jpeg"))
+
+    assert delivery_paths == [str(tmp_path / f"cell_{position}_tg.jpg") for position in range(1, 5)]
+    for path, color in zip(paths, COLORS):
+        with Image.open(path) as cell:
+            assert cell.size == (32, 32)
+            assert cell.getpixel((16, 16)) == color
+    assert all(os.path.exists(path) for path in delivery_paths)
+
+
+def test_split_grid_draws_date_and_skips_delivery_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_utils, "FONTS_PATH", FONTS_DIR)
+    paths = [str(tmp_path / f"cell_{position}.png") for position in range(1, 5)]
+    assert image_utils.split_grid_bytes(grid_bytes(400), paths, "18.10.2026", delivery_profile=None) == paths
+
+    with Image.open(paths[0]) as cell:
+        width, height = cell.size
+        # Дата наносится только в правый нижний угол
+        assert cell.crop((0, 0, width // 2, height // 2)).getcolors() == [((width // 2) * (height // 2), COLORS[0])]
+        assert len(cell.crop((width // 2, height // 2, width, height)).getcolors(maxcolors=1 << 16)) > 1
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "RGB", "P"])
+def test_date_on_image_smaller_than_overlay(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(image_utils, "FONTS_PATH", FONTS_DIR)
+    image = Image.new(mode, (40, 12))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    output_path = str(tmp_path / "small.png")
+
+    image_utils.process_image_bytes(buffer.getvalue(), output_path, "18.10.2026", delivery_profile=None)
+
+    with Image.open(output_path) as result:
+        assert result.size == (40, 12)
+        assert len(result.convert("RGB").getcolors()) > 1  # Видимая часть даты нанесена
+
+
+def test_split_grid_requires_four_paths(tmp_path):
+    with pytest.raises(ValueError):
+        image_utils.split_grid_bytes(grid_bytes(), [str(tmp_path / "cell.png")])
+
+
+def noise_image(size: int = 128) -> Image.Image:
+    return Image.frombytes("RGB", (size, size), random.Random(size).randbytes(size * size * 3))
+
+
+def jpeg(img: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def test_encode_image_lossless_profile_ignores_budget():
+    data = image_utils.encode_image(noise_image(), "png", max_bytes=100)
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.format == "PNG"
+
+
+def test_encode_image_uses_max_quality_without_budget():
+    img = noise_image()
+    assert image_utils.encode_image(img, "jpeg") == jpeg(img, image_utils.MAX_QUALITY)
+
+
+def test_encode_image_picks_highest_quality_within_budget():
+    img = noise_image()
+    sizes = {quality: len(jpeg(img, quality)) for quality in (70, 71)}
+    budget = (sizes[70] + sizes[71]) // 2
+    assert sizes[70] <= budget < sizes[71]
+
+    assert image_utils.encode_image(img, "jpeg", max_bytes=budget) == jpeg(img, 70)
+
+
+def test_encode_image_downscales_when_min_quality_is_too_large():
+    img = noise_image().convert("RGBA")
+    budget = len(jpeg(img.convert("RGB"), image_utils.MIN_QUALITY)) // 2
+    data = image_utils.encode_image(img, "jpeg", max_bytes=budget)
+
+    assert len(data) <= budget
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.mode == "RGB"
+        assert decoded.size[0] < img.size[0]
@@ -0,0 +1,50 @@
+import asyncio
+import datetime
+import types
+import pytest
+from services import routing
+from services.latency import TOTAL, LatencyStats, percentile
+
+
+def backend(name: str, totals: list) -> tuple:
+    latency = LatencyStats(name)
+    latency._loaded = True  # Без обращения к базе
+    latency.samples[TOTAL].extend(totals)
+    return name, types.SimpleNamespace(SERVICE_NAME=name, latency=latency)
+
+
+def order(candidates: list, minutes: float) -> list:
+    deadline = datetime.datetime.now() + datetime.timedelta(minutes=minutes)
+    return [name for name, _ in asyncio.run(routing.select_by_deadline(candidates, deadline))]
+
+
+def test_percentile_interpolates():
+    assert percentile([], 0.5) is None
+    assert percentile([30], 0.95) == 30
+    assert percentile([40, 10, 30, 20], 0.5) == 25
+    assert percentile(range(0, 101), 0.95) == pytest.approx(95)
+
+
+def test_window_keeps_last_samples():
+    latency = LatencyStats("qwen", window=3)
+    latency.samples[TOTAL].extend([1000, 10, 20, 30])
+    assert latency.p95() == pytest.approx(29)
+
+
+def test_preferred_stays_first_when_it_fits_or_has_no_samples():
+    fast = backend("ernie", [60])
+    assert order([backend("qwen", [300, 400]), fast], minutes=10) == ["qwen", "ernie"]
+    assert order([backend("qwen", []), fast], minutes=1) == ["qwen", "ernie"]
+
+
+def test_slow_preferred_yields_to_backends_that_fit():
+    candidates = [
+        backend("qwen", [900, 1200]),
+        backend("hidream", [1500, 2000]),
+        backend("zimage", []),
+        backend("ernie", [200, 250]),
+        backend("flux", [100, 120]),
+    ]
+    # В срок 5 минут укладываются flux и ernie (быстрые первыми), затем бэкенд без замеров,
+    # затем остальные по p50
+    assert order(candidates, minutes=5) == ["flux", "ernie", "zimage", "qwen", "hidream"]
@@ -0,0 +1,79 @@
+import asyncio
+import types
+import pytest
+from utils import metrics
+from utils.metrics import Counter, Gauge, Histogram, render_metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Тестовые метрики не должны попадать в общий реестр процесса
+    monkeypatch.setattr(metrics, "_registry", [])
+    return metrics._registry
+
+
+def test_counter_and_gauge_exposition(registry):
+    counter = Counter("test_requests_total", "Запросы", ("host", "status"))
+    counter.inc(host="api", status=200)
+    counter.inc(2, host="api", status=200)
+    counter.inc(host='a"b', status=503)
+    Gauge("test_state", "Состояние", ("backend",), collect=lambda: {("qwen",): 2})
+
+    assert counter.value(host="api", status=200) == 3
+    assert render_metrics() == (
+        "# HELP test_requests_total Запросы\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{host="api",status="200"} 3\n'
+        'test_requests_total{host="a\\"b",status="503"} 1\n'
+        "# HELP test_state Состояние\n"
+        "# TYPE test_state gauge\n"
+        'test_state{backend="qwen"} 2\n'
+    )
+
+
+def test_unknown_labels_are_rejected(registry):
+    counter = Counter("test_total", "Тест", ("host",))
+    with pytest.raises(ValueError):
+        counter.inc(provider="qwen")
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("test_seconds", "Длительность", ("stage",), buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, stage="image")
+
+    lines = histogram.render().splitlines()[2:]
+    assert lines == [
+        'test_seconds_bucket{stage="image",le="1"} 2',
+        'test_seconds_bucket{stage="image",le="5"} 3',
+        'test_seconds_bucket{stage="image",le="+Inf"} 4',
+        'test_seconds_sum{stage="image"} 14.5',
+        'test_seconds_count{stage="image"} 4',
+    ]
+
+
+def test_timer_works_with_and_async_with(registry, monkeypatch):
+    ticks = iter([10.0, 12.5, 20.0, 20.25])
+    # Подменяется только модуль time внутри metrics: часы цикла событий остаются настоящими
+    monkeypatch.setattr(metrics, "time", types.SimpleNamespace(monotonic=lambda: next(ticks)))
+    histogram = Histogram("test_seconds", "Длительность", ("provider",), buckets=(1, 5))
+
+    with histogram.time(provider="qwen"):
+        pass
+
+    async def timed():
+        async with histogram.time(provider="qwen"):
+            pass
+
+    asyncio.run(timed())
+    counts, total = histogram._values[("qwen",)]
+    assert counts == [1, 2, 2]
+    assert total == 2.75
+
+
+def test_timer_records_failed_block(registry):
+    histogram = Histogram("test_seconds", "Длительность")
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError("сбой")
+    assert histogram._values[()][0][-1] == 1
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from services import midjourney_service
+from services.midjourney_callback import MidjourneyCallbackReceiver
+from services.midjourney_service import MidjourneyService
+
+
+def test_callback_before_expect_is_claimed():
+    receiver = MidjourneyCallbackReceiver("http://bot.example.com/midjourney/callback", token="secret")
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post(receiver.path, receiver._handle)
+        async with TestClient(TestServer(app)) as client:
+            rejected = await client.post(receiver.path, json={"requestId": "r1", "status": "success"})
+            accepted = await client.post(
+                receiver.path, params={"token": "secret"}, json={"requestId": "r1", "status": "success"})
+            assert (rejected.status, accepted.status) == (403, 200)
+        return receiver.expect("r1")
+
+    future = asyncio.run(scenario())
+    assert future.done() and future.result()["requestId"] == "r1"
+
+
+def test_pending_waiter_gets_unclaimed_callback():
+    receiver = MidjourneyCallbackReceiver("http://bot.example.com/callback")
+
+    async def scenario():
+        future = receiver.expect("r1")
+        receiver._waiters.pop("r1")  # Колбэк разминулся с Future и попал в буфер
+        receiver._deliver("r1", {"status": "success"})
+        receiver._waiters["r1"] = future
+        return receiver.expect("r1")
+
+    assert asyncio.run(scenario()).result() == {"status": "success"}
+
+
+def test_callback_during_status_read_wakes_waiter(monkeypatch):
+    monkeypatch.setattr(midjourney_service, "MIDJOURNEY_API_TOKEN", "token")
+    monkeypatch.setattr(midjourney_service, "MIDJOURNEY_FALLBACK_POLL", 0.5)
+    receiver = MidjourneyCallbackReceiver("http://bot.example.com/callback")
+    service = MidjourneyService(base_url="http://midjourney.test", callback_receiver=receiver)
+    statuses = iter(["processing", "success"])
+
+    async def get_task_status(request_id):
+        status = next(statuses)
+        if status == "processing":
+            # Колбэк приходит, пока ожидающий читает статус
+            receiver._deliver(request_id, {"requestId": request_id, "status": "success"})
+        return {"status": status}
+
+    monkeypatch.setattr(service, "get_task_status", get_task_status)
+
+    started_at = time.monotonic()
+    result = asyncio.run(service.wait_for_task_completion("r1", timeout=5, poll_interval=0))
+    # Одна резервная пауза до первой проверки; после колбэка вторая пауза не нужна
+    assert result == {"status": "success"}
+    assert time.monotonic() - started_at < 0.9
+    assert receiver._waiters == {}
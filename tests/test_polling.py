@@ -0,0 +1,48 @@
+import pytest
+from services import polling
+from services.polling import AdaptivePoller, median_duration
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(polling.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_median_duration():
+    assert median_duration([]) is None
+    assert median_duration([30, 10, 20]) == 20
+
+
+def test_backoff_without_estimate(clock):
+    poller = AdaptivePoller(min_interval=2, max_interval=10, initial_interval=4, backoff=2, jitter=0)
+    assert [poller.next_delay() for _ in range(4)] == [4, 8, 10, 10]
+
+
+def test_half_of_remaining_time_near_expected_completion(clock):
+    poller = AdaptivePoller(expected_duration=60, min_interval=2, max_interval=60, jitter=0)
+    assert poller.next_delay() == 30  # Задача только началась: половина из 60 сек
+    clock[0] += 30
+    assert poller.next_delay() == 15
+    clock[0] += 26
+    assert poller.next_delay() == 2  # Оставшееся время меньше min_interval — переход к частым проверкам
+
+
+def test_queue_position_scales_the_estimate(clock):
+    poller = AdaptivePoller(expected_duration=20, min_interval=2, max_interval=120, jitter=0)
+    assert poller.next_delay(queue_position=3) == 40  # (3 + 1) * 20 / 2
+
+
+def test_delay_never_exceeds_timeout(clock):
+    poller = AdaptivePoller(expected_duration=600, max_interval=600, jitter=0, timeout=50)
+    assert poller.next_delay() == 50
+    clock[0] += 50
+    assert poller.expired
+    assert poller.next_delay() == 0
+
+
+def test_jitter_stays_within_bounds(clock):
+    poller = AdaptivePoller(min_interval=10, max_interval=10, initial_interval=10, jitter=0.2)
+    for _ in range(50):
+        assert 8 <= poller.next_delay() <= 12
@@ -0,0 +1,64 @@
+import datetime
+import glob
+import os
+import pytest
+from utils import prompt_utils
+from utils.prompt_utils import PromptTemplate, PromptTemplateError, load_template
+
+TEMPLATE = """---SYSTEM_PROMPT---
+Today is {current_date}, {weekday}, {season}.
+---END_SYSTEM_PROMPT---
+---USER_PROMPT---
+Theme {random_theme}. Avoid:
+{recent_themes}
+---END_USER_PROMPT---
+"""
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "bot", "prompts")
+
+
+def test_render_substitutes_variables():
+    template = PromptTemplate(TEMPLATE)
+    system_prompt, user_prompt = template.render(
+        max_theme=1, recent_themes=["a fox"], now=datetime.datetime(2026, 10, 18))
+    assert system_prompt == "Today is 18 October 2026, Sunday, autumn."
+    assert user_prompt == "Theme 1. Avoid:\n- a fox"
+    assert template.variables == {"current_date", "weekday", "season", "random_theme", "recent_themes"}
+
+
+@pytest.mark.parametrize("content", [
+    "---SYSTEM_PROMPT---\nx\n---END_SYSTEM_PROMPT---",  # нет USER_PROMPT
+    "---SYSTEM_PROMPT---\nx\n---USER_PROMPT---\ny\n---END_USER_PROMPT---",  # SYSTEM_PROMPT не закрыт
+    TEMPLATE.replace("{season}", "{unknown}"),
+    TEMPLATE + "---EXTRA---",
+])
+def test_invalid_markup_is_rejected(content):
+    with pytest.raises(PromptTemplateError):
+        PromptTemplate(content)
+
+
+def test_load_template_is_cached_until_file_changes(tmp_path):
+    path = tmp_path / "runner.txt"
+    path.write_text(TEMPLATE, encoding="utf-8")
+    first = load_template(str(path))
+    assert load_template(str(path)) is first
+
+    path.write_text(TEMPLATE.replace("Theme", "Subject"), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    second = load_template(str(path))
+    assert second is not first
+    assert second.render(max_theme=1)[1].startswith("Subject 1")
+    prompt_utils._templates.pop(str(path), None)
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(PROMPTS_DIR, "*.txt"))))
+def test_bundled_prompt_files_compile(path):
+    PromptTemplate(open(path, encoding="utf-8").read(), source=path)
+
+
+@pytest.mark.parametrize("day, expected", [(1, "1"), (10, "10"), (20, "10"), (23, "3"), (31, "1")])
+def test_day_theme_follows_day_of_month(day, expected):
+    template = PromptTemplate("---SYSTEM_PROMPT---\n---END_SYSTEM_PROMPT---\n"
+                              "---USER_PROMPT---\n{day_theme}\n---END_USER_PROMPT---")
+    assert template.render(now=datetime.datetime(2026, 10, day))[1] == expected
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from services import circuit_breaker, routing
+from services.ernie_service import ErnieService
+from services.zimage_service import ZImageService
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    circuit_breaker._breakers.clear()
+    routing._health.clear()
+    monkeypatch.setattr(routing, "LOCAL_FALLBACKS", ["ernie"])
+    yield
+    circuit_breaker._breakers.clear()
+    routing._health.clear()
+
+
+def test_forwarded_params_keep_everything_supported_on_preferred():
+    params = {"model": "base", "aspect_ratio": "16:9", "cfg_scale": 4.0}
+    assert routing.forwarded_params(ZImageService(), params, rerouted=False) == {"model": "base", "aspect_ratio": "16:9"}
+
+
+def test_forwarded_params_drop_model_specific_keys_on_fallback():
+    params = {"model": "base", "aspect_ratio": "16:9", "num_inference_steps": 30, "seed": 7, "negative_prompt": "x"}
+    assert routing.forwarded_params(ErnieService(), params, rerouted=True) == {
+        "aspect_ratio": "16:9", "seed": 7, "negative_prompt": "x",
+    }
+
+
+def test_zimage_request_is_routed_to_ernie_with_its_own_model(monkeypatch):
+    calls = []
+
+    async def healthy(service):
+        return service.SERVICE_NAME != "Z-Image"
+
+    async def generate_image(self, **kwargs):
+        calls.append((self.SERVICE_NAME, kwargs))
+        return "http://ernie/image.png"
+
+    monkeypatch.setattr(routing, "check_health", healthy)
+    monkeypatch.setattr(ErnieService, "generate_image", generate_image)
+
+    result = asyncio.run(routing.generate_local_image("zimage", "cat", model="base", aspect_ratio="16:9"))
+
+    assert result == {"backend": "ernie", "label": "E", "image_url": "http://ernie/image.png"}
+    service_name, kwargs = calls[0]
+    assert service_name == "ERNIE"
+    assert "model" not in kwargs  # ERNIE использует свой model="sft" по умолчанию
+    assert kwargs["aspect_ratio"] == "16:9"
+    assert ErnieService().build_payload("cat", **{k: v for k, v in kwargs.items() if k in ErnieService.PARAMETERS})["model"] == "sft"
@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from utils import job_journal
+from utils.database import fetch_all
+from utils.stage_graph import StageGraph
+
+
+def test_passes_inputs_and_runs_independent_stages_concurrently():
+    events = []
+
+    async def slow(name, value):
+        events.append(f"start {name}")
+        await asyncio.sleep(0.05)
+        events.append(f"end {name}")
+        return value
+
+    graph = StageGraph(name="test")
+    graph.add("prompt", lambda: slow("prompt", "cat"))
+    graph.add("image", lambda prompt: slow("image", f"{prompt}.png"), inputs=("prompt",))
+    graph.add("video", lambda prompt: slow("video", f"{prompt}.mp4"), inputs=("prompt",))
+    graph.add("sent", lambda image, video: [image, video], inputs=("image", "video"))
+
+    results = asyncio.run(graph.run())
+
+    assert results["sent"] == ["cat.png", "cat.mp4"]
+    # image и video зависят только от prompt и стартуют до завершения друг друга
+    assert events.index("start video") < events.index("end image")
+
+
+def test_after_orders_stages_without_passing_results():
+    order = []
+    graph = StageGraph(name="test")
+    graph.add("first", lambda: order.append("first"))
+    graph.add("second", lambda: order.append("second"), after=("first",))
+    asyncio.run(graph.run())
+    assert order == ["first", "second"]
+
+
+def test_failure_cancels_running_stages_and_reraises():
+    cancelled = []
+
+    async def long_running():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("video")
+            raise
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upload failed")
+
+    graph = StageGraph(name="test")
+    graph.add("video", long_running)
+    graph.add("upload", failing)
+    graph.add("sent", lambda: None, after=("video", "upload"))
+
+    with pytest.raises(ValueError, match="upload failed"):
+        asyncio.run(asyncio.wait_for(graph.run(), 2))
+    assert cancelled == ["video"]
+
+
+def test_rejects_duplicate_and_undeclared_dependencies():
+    graph = StageGraph(name="test")
+    graph.add("prompt", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("prompt", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("image", lambda video: None, inputs=("video",))
+
+
+class _FakeJob:
+    runner = "fake"
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    async def stage(self, name, func):
+        if name in self.stages:
+            return self.stages[name]
+        result = func()
+        if hasattr(result, "__await__"):
+            result = await result
+        self.stages[name] = result
+        return result
+
+
+def test_completed_job_stages_are_not_recomputed():
+    calls = []
+    job = _FakeJob({"prompt": "saved"})
+    graph = StageGraph(job)
+    graph.add("prompt", lambda: calls.append("prompt"))
+    graph.add("image", lambda prompt: f"{prompt}.png", inputs=("prompt",))
+    assert asyncio.run(graph.run())["image"] == "saved.png"
+    assert calls == []
+
+
+def _journaled_graph(job, video_fails: bool) -> StageGraph:
+    async def generate_video():
+        await job.set_remote_id("video", "request-1")
+        if video_fails:
+            raise RuntimeError("video failed")
+        await asyncio.sleep(10)
+
+    async def send_image():
+        await asyncio.sleep(0.05)
+        raise ValueError("send failed")
+
+    graph = StageGraph(job)
+    graph.add("image_sent", send_image)
+    graph.add("video", generate_video)
+    graph.add("sent", lambda: None, after=("image_sent", "video"))
+    return graph
+
+
+def test_sibling_failure_keeps_job_with_pending_remote_task_resumable(process_database):
+    async def scenario():
+        job = await job_journal.open_job("graph_test")
+        with pytest.raises(ValueError, match="send failed"):
+            await _journaled_graph(job, video_fails=False).run()
+        await job.fail("send failed")
+
+        # Ожидание видео было прервано: следующий запуск продолжает то же задание с тем же requestId
+        resumed = await job_journal.open_job("graph_test")
+        return job.id, resumed
+
+    job_id, resumed = asyncio.run(scenario())
+    assert resumed.id == job_id
+    assert resumed.remote_id("video") == "request-1"
+
+
+def test_failed_remote_stage_fails_job(process_database):
+    async def scenario():
+        job = await job_journal.open_job("graph_test")
+        with pytest.raises(RuntimeError, match="video failed"):
+            await _journaled_graph(job, video_fails=True).run()
+        await job.fail("video failed")
+        return await fetch_all("SELECT status FROM jobs WHERE id = ?", (job.id,))
+
+    assert asyncio.run(scenario()) == [(job_journal.STATUS_FAILED,)]
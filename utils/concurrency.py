@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from config import PROVIDER_CONCURRENCY, DEFAULT_PROVIDER_CONCURRENCY
+from utils.metrics import PROVIDER_CALL_SECONDS, QUEUE_WAIT_SECONDS, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Провайдеры, к которым обращаются раннеры (лимиты задаются через PROVIDER_CONCURRENCY)
+GEMINI = "gemini"
+MIDJOURNEY = "midjourney"
+LOCAL_GPU = "local_gpu"  # Общий GPU-хост Qwen / Z-Image / ERNIE / HiDream
+TELEGRAM = "telegram"
+
+QUEUE_DELAY_LOG_THRESHOLD = 1.0  # Ожидание слота дольше этого (сек) пишется в лог
+
+_semaphores: dict = {}
+_stats: dict = {}
+_running_pipelines: list = []
+
+PROVIDER_IN_FLIGHT = Gauge(
+    "utriskra_provider_in_flight", "Выполняющиеся операции провайдера", ("provider",),
+    collect=lambda: {(provider,): stats["in_flight"] for provider, stats in _stats.items()})
+PROVIDER_WAITING = Gauge(
+    "utriskra_provider_waiting", "Операции, ожидающие слот провайдера", ("provider",),
+    collect=lambda: {(provider,): stats["waiting"] for provider, stats in _stats.items()})
+
+
+def _get_semaphore(provider: str) -> asyncio.Semaphore:
+    if provider not in _semaphores:
+        limit = PROVIDER_CONCURRENCY.get(provider, DEFAULT_PROVIDER_CONCURRENCY)
+        _semaphores[provider] = asyncio.Semaphore(limit)
+        _stats[provider] = {"limit": limit, "in_flight": 0, "waiting": 0, "queue_delays": deque(maxlen=100)}
+    return _semaphores[provider]
+
+
+def get_provider_stats(provider: str) -> dict:
+    """
+    Возвращает состояние очереди провайдера.
+    :return: Лимит, число выполняющихся и ожидающих операций, последние задержки в очереди (сек).
+    """
+    _get_semaphore(provider)
+    return _stats[provider]
+
+
+@asynccontextmanager
+async def provider_slot(provider: str):
+    """
+    Занимает один слот провайдера на время блока и учитывает время ожидания в очереди.
+    Так медленный раннер ограничивает только свой провайдер, а не весь планировщик.
+    :param provider: Имя провайдера (GEMINI, MIDJOURNEY, LOCAL_GPU, TELEGRAM или другое).
+    """
+    semaphore = _get_semaphore(provider)
+    stats = _stats[provider]
+    queued_at = time.monotonic()
+    stats["waiting"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        stats["waiting"] -= 1
+
+    queue_delay = time.monotonic() - queued_at
+    stats["queue_delays"].append(queue_delay)
+    QUEUE_WAIT_SECONDS.observe(queue_delay, provider=provider)
+    if queue_delay >= QUEUE_DELAY_LOG_THRESHOLD:
+        logger.info(f"Ожидание слота {provider}: {queue_delay:.1f} сек (лимит {stats['limit']})")
+
+    stats["in_flight"] += 1
+    try:
+        yield
+    finally:
+        stats["in_flight"] -= 1
+        semaphore.release()
+
+
+async def run_blocking(provider: str, func, *args, **kwargs):
+    """
+    Выполняет синхронный вызов клиента в отдельном потоке, заняв слот провайдера.
+    Блокирующие requests/time.sleep не останавливают event loop и другие раннеры.
+    """
+    async with provider_slot(provider):
+        with PROVIDER_CALL_SECONDS.time(provider=provider, operation="generation"):
+            return await asyncio.to_thread(functools.partial(func, *args, **kwargs))
+
+
+def pipeline(name: str, func):
+    """
+    Оборачивает раннер для планировщика: пишет в лог длительность и число параллельных пайплайнов.
+    :param name: Имя пайплайна для логов.
+    :param func: Асинхронная функция раннера без аргументов.
+    """
+    @functools.wraps(func)
+    async def wrapper():
+        _running_pipelines.append(name)
+        started_at = time.monotonic()
+        logger.info(f"Запуск пайплайна {name} (параллельно выполняются: {', '.join(_running_pipelines)})")
+        try:
+            await func()
+        finally:
+            _running_pipelines.remove(name)
+            logger.info(f"Пайплайн {name} завершён за {time.monotonic() - started_at:.0f} сек")
+    return wrapper
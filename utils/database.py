@@ -1,50 +1,466 @@
+import asyncio
+import atexit
 import sqlite3
 import os
+import queue
+import threading
 import logging
-from config import BASE_STORAGE_PATH
+from concurrent.futures import Future
+from config import BASE_STORAGE_PATH, DB_PATH as CONFIG_DB_PATH
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Путь к базе данных
-#BASE_STORAGE_PATH = os.path.abspath("../storage")  # Абсолютный путь к storage
-DB_PATH = os.path.join(BASE_STORAGE_PATH, "database", "daily_images.db")
+# Путь к базе данных: DB_PATH из окружения или storage/database/daily_images.db
+DB_PATH = CONFIG_DB_PATH or os.path.join(BASE_STORAGE_PATH, "database", "daily_images.db")
+
+# Версионированные миграции схемы. Номер версии = индекс + 1 (хранится в PRAGMA user_version).
+# Новые изменения схемы добавляются только в конец списка.
+MIGRATIONS = [
+    # 1: исходная таблица изображений
+    """
+    CREATE TABLE IF NOT EXISTS daily_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        system_prompt TEXT NOT NULL,
+        user_prompt TEXT NOT NULL,
+        generated_prompt TEXT NOT NULL,
+        image_path TEXT NOT NULL
+    );
+    """,
+    # 2: кэш Telegram file_id
+    """
+    CREATE TABLE IF NOT EXISTS telegram_files (
+        content_hash TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        media_type TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 3: индекс для выборок по дате
+    """
+    CREATE INDEX IF NOT EXISTS idx_daily_images_date ON daily_images (date);
+    """,
+    # 4: журнал заданий раннеров и их этапов (см. utils/job_journal.py)
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        runner TEXT NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_runner_status ON jobs (runner, status);
+    CREATE TABLE IF NOT EXISTS job_stages (
+        job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+        stage TEXT NOT NULL,
+        remote_id TEXT,
+        result TEXT,
+        completed_at TEXT,
+        PRIMARY KEY (job_id, stage)
+    );
+    """,
+    # 5: пул промптов, заранее сгенерированных одним запросом к Gemini (см. utils/prompt_pool.py)
+    """
+    CREATE TABLE IF NOT EXISTS prompt_pool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pool TEXT NOT NULL,
+        date TEXT NOT NULL,
+        system_prompt TEXT NOT NULL,
+        user_prompt TEXT NOT NULL,
+        generated_prompt TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        used_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_prompt_pool_pool_date ON prompt_pool (pool, date);
+    """,
+    # 6: запас готовых изображений (например, неопубликованные ячейки сетки Midjourney)
+    """
+    CREATE TABLE IF NOT EXISTS image_backlog (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT NOT NULL,
+        date TEXT NOT NULL,
+        generated_prompt TEXT NOT NULL,
+        image_path TEXT NOT NULL,
+        delivery_path TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        used_at TEXT
+    );
+    """,
+    # 7: индекс реакций на фото в группе для поиска лучшего изображения недели (см. utils/reaction_index.py)
+    """
+    CREATE TABLE IF NOT EXISTS reaction_index (
+        peer TEXT NOT NULL,
+        message_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        reactions INTEGER NOT NULL,
+        PRIMARY KEY (peer, message_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_reaction_index_peer_date ON reaction_index (peer, date);
+    CREATE TABLE IF NOT EXISTS reaction_index_state (
+        peer TEXT PRIMARY KEY,
+        last_message_id INTEGER NOT NULL
+    );
+    """,
+    # 8: кэш загрузок изображений во внешние API (хэш содержимого -> CDN URL)
+    """
+    CREATE TABLE IF NOT EXISTS upload_cache (
+        content_hash TEXT NOT NULL,
+        service TEXT NOT NULL,
+        url TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (content_hash, service)
+    );
+    """,
+    # 9: времена генерации бэкендов для скользящей статистики (services/latency.py)
+    """
+    CREATE TABLE IF NOT EXISTS backend_timings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        backend TEXT NOT NULL,
+        generation_seconds REAL,
+        queue_seconds REAL,
+        total_seconds REAL NOT NULL,
+        recorded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_backend_timings_backend ON backend_timings (backend, id);
+    """,
+]
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA foreign_keys=ON",
+]
+
+MAX_BATCH = 100  # Максимум операций в одной транзакции писателя
+
+
+class _Database:
+    """
+    Единственное соединение SQLite процесса, принадлежащее отдельному потоку.
+    Все операции ставятся в очередь; поток выполняет накопившиеся операции
+    пачкой в одной транзакции, поэтому event loop не ждёт fsync и раннеры
+    не конкурируют за файл базы.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self.conn = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)  # Создаем папку для базы, если она отсутствует
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.thread.start()
+
+    def submit(self, operation) -> Future:
+        """Ставит в очередь функцию operation(conn) и возвращает Future с её результатом."""
+        future = Future()
+        self.queue.put((operation, future))
+        return future
+
+    def stop(self):
+        """Дожидается выполнения очереди и закрывает соединение."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._execute_batch(batch)
+            if stop:
+                break
+        self.conn.close()
+
+    def _execute_batch(self, batch: list):
+        results = []
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                # Точка сохранения: ошибка одной операции не откатывает остальные
+                self.conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, operation(self.conn), None))
+                    self.conn.execute("RELEASE op")
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO op")
+                    self.conn.execute("RELEASE op")
+                    results.append((future, None, e))
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка транзакции базы данных: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            results = [(future, None, e) for _, future in batch]
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции и возвращает текущую версию схемы."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number > version:
+            for statement in filter(str.strip, migration.split(";")):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            logger.info(f"Применена миграция базы данных №{number}")
+    return max(version, len(MIGRATIONS))
+
+
+def _get_database() -> _Database:
+    """Возвращает (при необходимости запускает) соединение процесса с применёнными миграциями."""
+    global _database
+    with _database_lock:
+        if _database is None:
+            database = _Database(DB_PATH)
+            database.start()
+            try:
+                database.submit(_migrate).result()
+            except Exception:
+                # Миграции выполняются в транзакции писателя и откатываются целиком;
+                # поток останавливается, чтобы следующий вызов начал с чистого состояния
+                database.stop()
+                raise
+            _database = database
+            # Дописываем очередь при завершении процесса (например, при запуске раннера вручную)
+            atexit.register(close_database)
+    return _database
+
 
 def initialize_database():
     """
-    Создает таблицу в базе данных, если она не существует.
+    Открывает соединение с базой данных и применяет миграции схемы.
     """
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)  # Создаем папку для базы, если она отсутствует
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS daily_images (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    system_prompt TEXT NOT NULL,
-                    user_prompt TEXT NOT NULL,
-                    generated_prompt TEXT NOT NULL,
-                    image_path TEXT NOT NULL
-                )
-            """)
-            conn.commit()
-            logger.info("Таблица базы данных успешно инициализирована.")
+        _get_database()
+        logger.info("Таблица базы данных успешно инициализирована.")
     except sqlite3.Error as e:
         logger.error(f"Ошибка инициализации базы данных: {e}")
 
+
+def close_database():
+    """
+    Записывает накопленные операции и закрывает соединение (при остановке процесса).
+    """
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.stop()
+            _database = None
+            logger.info("Соединение с базой данных закрыто.")
+
+
+def execute(sql: str, params: tuple = ()) -> Future:
+    """
+    Ставит запрос на запись в очередь писателя, не дожидаясь его выполнения.
+    :return: Future с количеством изменённых строк.
+    """
+    return _get_database().submit(lambda conn: conn.execute(sql, params).rowcount)
+
+
+async def run(operation):
+    """Выполняет operation(conn) в потоке базы данных и возвращает результат."""
+    return await asyncio.wrap_future(_get_database().submit(operation))
+
+
+async def fetch_one(sql: str, params: tuple = ()):
+    """Возвращает первую строку результата запроса или None."""
+    return await run(lambda conn: conn.execute(sql, params).fetchone())
+
+
+async def fetch_all(sql: str, params: tuple = ()) -> list:
+    """Возвращает все строки результата запроса."""
+    return await run(lambda conn: conn.execute(sql, params).fetchall())
+
+
+def _log_write_error(future: Future, message: str):
+    """Логирует ошибку фоновой записи."""
+    def _callback(done: Future):
+        if done.exception() is not None:
+            logger.error(f"{message}: {done.exception()}")
+    future.add_done_callback(_callback)
+
+
 def save_to_database(date, system_prompt, user_prompt, generated_prompt, image_path):
     """
     Сохраняет данные о сгенерированном изображении в базу данных.
+    Запись выполняется в фоне потоком базы данных.
+    """
+    future = execute("""
+        INSERT INTO daily_images (date, system_prompt, user_prompt, generated_prompt, image_path)
+        VALUES (?, ?, ?, ?, ?)
+    """, (date, system_prompt, user_prompt, generated_prompt, image_path))
+    _log_write_error(future, "Ошибка сохранения данных в базу")
+    logger.info("Данные поставлены в очередь на запись в базу данных.")
+
+
+def add_to_backlog(source: str, date: str, generated_prompt: str, image_path: str, delivery_path: str):
+    """
+    Добавляет готовое изображение в запас для публикации в другой слот.
+    :param source: Источник изображения (например, midjourney).
+    :param date: Дата генерации.
+    :param generated_prompt: Промпт, по которому создано изображение.
+    :param image_path: Путь к архивной копии.
+    :param delivery_path: Путь к копии для отправки в Telegram.
+    """
+    future = execute(
+        "INSERT INTO image_backlog (source, date, generated_prompt, image_path, delivery_path) VALUES (?, ?, ?, ?, ?)",
+        (source, date, generated_prompt, image_path, delivery_path),
+    )
+    _log_write_error(future, "Ошибка добавления изображения в запас")
+
+
+async def get_next_backlog_item():
+    """
+    Возвращает самое старое неопубликованное изображение из запаса, не отмечая его использованным:
+    после успешной отправки раннер вызывает mark_backlog_used, иначе изображение останется в запасе.
+    :return: Словарь с id, source, date, generated_prompt, image_path, delivery_path или None.
+    """
+    row = await fetch_one("""
+        SELECT id, source, date, generated_prompt, image_path, delivery_path FROM image_backlog
+        WHERE used_at IS NULL ORDER BY id LIMIT 1
+    """)
+    if row is None:
+        return None
+    return dict(zip(("id", "source", "date", "generated_prompt", "image_path", "delivery_path"), row))
+
+
+async def mark_backlog_used(item_id: int):
+    """
+    Отмечает изображение из запаса опубликованным.
+    :param item_id: ID записи image_backlog.
+    """
+    await run(lambda conn: conn.execute(
+        "UPDATE image_backlog SET used_at = CURRENT_TIMESTAMP WHERE id = ?", (item_id,)
+    ))
+
+
+async def get_recent_prompts(limit: int, max_length: int = 200) -> list:
+    """
+    Возвращает последние сгенерированные промпты (новые первыми).
+    :param limit: Количество промптов.
+    :param max_length: Максимальная длина каждого промпта (длинные обрезаются).
+    """
+    rows = await fetch_all("SELECT generated_prompt FROM daily_images ORDER BY id DESC LIMIT ?", (limit,))
+    return [row[0][:max_length] for row in rows]
+
+
+async def get_telegram_file_id(content_hash: str, media_type: str):
+    """
+    Возвращает Telegram file_id ранее отправленного файла по хэшу содержимого.
+    :param content_hash: SHA-256 содержимого файла.
+    :param media_type: Тип медиа (photo, video).
+    :return: file_id или None.
+    """
+    try:
+        row = await fetch_one(
+            "SELECT file_id FROM telegram_files WHERE content_hash = ? AND media_type = ?",
+            (content_hash, media_type),
+        )
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка чтения кэша file_id: {e}")
+        return None
+
+
+def save_telegram_file_id(content_hash: str, file_id: str, media_type: str):
+    """
+    Сохраняет Telegram file_id для хэша содержимого файла.
+    """
+    future = execute(
+        "INSERT OR REPLACE INTO telegram_files (content_hash, file_id, media_type) VALUES (?, ?, ?)",
+        (content_hash, file_id, media_type),
+    )
+    _log_write_error(future, "Ошибка сохранения file_id в кэш")
+
+
+async def get_cached_upload(content_hash: str, service: str, max_age_hours: int):
+    """
+    Возвращает URL ранее загруженного изображения, если загрузка не старше max_age_hours.
+    :param content_hash: SHA-256 содержимого изображения.
+    :param service: Сервис, в который загружалось изображение.
+    :param max_age_hours: Срок годности URL в часах.
+    :return: URL или None.
+    """
+    try:
+        row = await fetch_one(
+            "SELECT url FROM upload_cache WHERE content_hash = ? AND service = ? AND created_at >= datetime('now', ?)",
+            (content_hash, service, f"-{max_age_hours} hours"),
+        )
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка чтения кэша загрузок: {e}")
+        return None
+
+
+def save_cached_upload(content_hash: str, service: str, url: str):
+    """
+    Сохраняет URL загруженного изображения для хэша содержимого.
+    """
+    future = execute(
+        "INSERT OR REPLACE INTO upload_cache (content_hash, service, url) VALUES (?, ?, ?)",
+        (content_hash, service, url),
+    )
+    _log_write_error(future, "Ошибка сохранения URL в кэш загрузок")
+
+
+def save_backend_timing(backend: str, generation_seconds, queue_seconds, total_seconds: float):
+    """
+    Сохраняет времена одной генерации бэкенда.
+    :param backend: Имя бэкенда (SERVICE_NAME).
+    :param generation_seconds: Время генерации по данным бэкенда или None.
+    :param queue_seconds: Ожидание в очереди бэкенда или None.
+    :param total_seconds: Время от создания задачи до результата по нашим часам.
+    """
+    future = execute(
+        "INSERT INTO backend_timings (backend, generation_seconds, queue_seconds, total_seconds) VALUES (?, ?, ?, ?)",
+        (backend, generation_seconds, queue_seconds, total_seconds),
+    )
+    _log_write_error(future, "Ошибка сохранения времени генерации")
+
+
+async def get_backend_timings(backend: str, limit: int) -> list:
+    """
+    Возвращает последние времена генерации бэкенда (старые первыми).
+    :param backend: Имя бэкенда (SERVICE_NAME).
+    :param limit: Количество записей.
+    :return: Список кортежей (generation_seconds, queue_seconds, total_seconds).
     """
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO daily_images (date, system_prompt, user_prompt, generated_prompt, image_path)
-                VALUES (?, ?, ?, ?, ?)
-            """, (date, system_prompt, user_prompt, generated_prompt, image_path))
-            conn.commit()
-            logger.info("Данные успешно сохранены в базу данных.")
+        rows = await fetch_all("""
+            SELECT generation_seconds, queue_seconds, total_seconds FROM backend_timings
+            WHERE backend = ? ORDER BY id DESC LIMIT ?
+        """, (backend, limit))
     except sqlite3.Error as e:
-        logger.error(f"Ошибка сохранения данных в базу: {e}")
+        logger.error(f"Ошибка чтения времён генерации: {e}")
+        return []
+    return list(reversed(rows))
@@ -1,14 +1,39 @@
+import io
 import os
+import asyncio
 import datetime
 import base64
-import requests
-from PIL import Image, ImageDraw, ImageFont
+import functools
+import hashlib
+import aiofiles
+import httpx
+from PIL import Image, ImageDraw, ImageFont, features
 import logging
-from config import IMAGES_PATH, FONTS_PATH
+from concurrent.futures import ThreadPoolExecutor
+from config import IMAGES_PATH, FONTS_PATH, ARCHIVE_PROFILE, DELIVERY_PROFILE, DELIVERY_MAX_BYTES
+from services.http_client import get_client
+from utils.metrics import PROVIDER_CALL_SECONDS, RETRIES
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Для больших видео ограничиваем только ожидание соединения и паузы между блоками
+DOWNLOAD_TIMEOUT = httpx.Timeout(60, connect=30)
+
+# Пул для CPU-работы с изображениями (декодирование, наложение даты, кодирование)
+_image_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image")
+
+# Профили кодирования: archive — без потерь для хранения, остальные — для доставки в Telegram
+OUTPUT_PROFILES = {
+    "png": {"format": "PNG", "extension": "png", "options": {}, "lossy": False},
+    "webp_lossless": {"format": "WEBP", "extension": "webp", "options": {"lossless": True, "method": 4}, "lossy": False},
+    "jpeg": {"format": "JPEG", "extension": "jpg", "options": {"optimize": True, "progressive": True}, "lossy": True},
+    "webp": {"format": "WEBP", "extension": "webp", "options": {"method": 4}, "lossy": True},
+    "avif": {"format": "AVIF", "extension": "avif", "options": {}, "lossy": True},
+}
+MAX_QUALITY = 92
+MIN_QUALITY = 50
+
 def save_image_from_base64(base64_image: str, file_path: str):
     """Сохраняет изображение из Base64 в файл."""
     try:
@@ -20,46 +45,255 @@ def save_image_from_base64(base64_image: str, file_path: str):
         raise
 
 
+@functools.lru_cache(maxsize=16)
+def _load_font(font_size: int) -> ImageFont.FreeTypeFont:
+    """Загружает шрифт Roboto указанного размера (кэшируется по размеру)."""
+    font_path = os.path.join(FONTS_PATH, "Roboto-Regular.ttf")
+    if not os.path.exists(font_path):
+        raise FileNotFoundError(f"Шрифт '{font_path}' не найден.")
+    return ImageFont.truetype(font_path, font_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _date_overlay(date_text: str, font_size: int) -> Image.Image:
+    """
+    Рендерит прозрачную плашку с датой и тенью, точно обрезанную по textbbox.
+    Плашки кэшируются по тексту и размеру шрифта и переиспользуются всеми раннерами,
+    поэтому нельзя изменять возвращаемое изображение.
+    """
+    font = _load_font(font_size)
+    shadow_offset = 2
+    left, top, right, bottom = font.getbbox(date_text)
+    tile = Image.new("RGBA", (right - left + shadow_offset, bottom - top + shadow_offset), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    draw.text((shadow_offset - left, shadow_offset - top), date_text, font=font, fill=(0, 0, 0, 255))
+    draw.text((-left, -top), date_text, font=font, fill=(255, 255, 255, 255))
+    return tile
+
+
+def _draw_date(img: Image.Image, date_text: str) -> Image.Image:
+    """
+    Накладывает дату с тенью в правый нижний угол изображения.
+    :return: Изображение с датой (для палитровых режимов — новое RGB-изображение).
+    """
+    font_size = max(int(min(img.size) * 0.025), 1)
+    tile = _date_overlay(date_text, font_size)
+    margin = 10
+    left = img.size[0] - tile.size[0] - margin
+    top = img.size[1] - tile.size[1] - margin
+    if left < 0 or top < 0:
+        # Изображение меньше плашки: прижимаем к левому верхнему краю и обрезаем по границам
+        # (crop возвращает копию, кэшированная плашка не изменяется)
+        left, top = max(left, 0), max(top, 0)
+        tile = tile.crop((0, 0, min(tile.size[0], img.size[0] - left), min(tile.size[1], img.size[1] - top)))
+    position = (left, top)
+
+    if img.mode == "RGBA":
+        img.alpha_composite(tile, position)
+    else:
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.paste(tile, position, tile)
+    return img
+
+
 def add_date_to_image(image_path: str, date_text: str):
     """Добавляет дату на изображение."""
     try:
-        font_path = os.path.join(FONTS_PATH, "Roboto-Regular.ttf")
-        if not os.path.exists(font_path):
-            raise FileNotFoundError(f"Шрифт '{font_path}' не найден.")
-
-        img = Image.open(image_path)
-        draw = ImageDraw.Draw(img)
-        font_size = int(min(img.size) * 0.025)
-        font = ImageFont.truetype(font_path, font_size)
-
-        text_position = (img.size[0] - font_size * len(date_text) - 10, img.size[1] - font_size - 10)
-        text_color = (255, 255, 255)
-        shadow_color = (0, 0, 0)
-        shadow_offset = 2
-
-        draw.text(
-            (text_position[0] + shadow_offset, text_position[1] + shadow_offset),
-            date_text,
-            font=font,
-            fill=shadow_color,
-        )
-        draw.text(text_position, date_text, font=font, fill=text_color)
-        img.save(image_path)
+        with Image.open(image_path) as img:
+            img.load()
+            _draw_date(img, date_text).save(image_path)
         logger.info(f"Дата '{date_text}' добавлена на изображение {image_path}")
     except Exception as e:
         logger.error(f"Ошибка при добавлении даты на изображение: {e}")
         raise
 
-def create_image_path(prefix: str = "story") -> str:
+
+def _save_outputs(img: Image.Image, output_path: str, date_text: str = None,
+                  delivery_profile: str = DELIVERY_PROFILE) -> str:
+    """
+    Наносит дату и сохраняет архивную копию и, при заданном профиле, копию для доставки.
+    :return: Путь к файлу для отправки в Telegram.
+    """
+    if date_text:
+        img = _draw_date(img, date_text)
+    archive = get_profile(ARCHIVE_PROFILE)
+    archive_options = archive["options"] if output_path.endswith(f".{archive['extension']}") else {}
+    img.save(output_path, **archive_options)
+
+    delivery_path = output_path
+    if delivery_profile and get_profile(delivery_profile)["lossy"]:
+        delivery_path = delivery_path_for(output_path, delivery_profile)
+        with open(delivery_path, "wb") as file:
+            file.write(encode_image(img, delivery_profile, DELIVERY_MAX_BYTES))
+    return delivery_path
+
+
+def process_image_bytes(image_data: bytes, output_path: str, date_text: str = None,
+                        crop_position: int = None, delivery_profile: str = DELIVERY_PROFILE) -> str:
+    """
+    Обрабатывает изображение за один проход: декодирование из памяти,
+    вырезание ячейки сетки 2x2, нанесение даты и кодирование архивной копии без потерь
+    (формат по расширению output_path) и, при заданном профиле, копии для доставки.
+    :param image_data: Исходные байты изображения.
+    :param output_path: Путь для сохранения архивной копии.
+    :param date_text: Текст даты (None — без даты).
+    :param crop_position: Позиция (1-4) ячейки сетки 2x2 (None — без вырезания).
+    :param delivery_profile: Профиль копии для Telegram (None/"" — только архивная копия).
+    :return: Путь к файлу для отправки в Telegram.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            if crop_position is not None:
+                img = img.crop(_grid_box(img.size, crop_position))
+            else:
+                img.load()
+            delivery_path = _save_outputs(img, output_path, date_text, delivery_profile)
+        logger.info(f"Изображение обработано и сохранено в {output_path} (для отправки: {delivery_path})")
+        return delivery_path
+    except Exception as e:
+        logger.error(f"Ошибка при обработке изображения: {e}")
+        raise
+
+
+def split_grid_bytes(image_data: bytes, output_paths: list, date_text: str = None,
+                     delivery_profile: str = DELIVERY_PROFILE) -> list:
+    """
+    Разрезает сетку 2x2 на четыре изображения: сетка декодируется один раз,
+    каждая ячейка получает дату, архивную копию и копию для доставки.
+    :param image_data: Исходные байты сетки.
+    :param output_paths: Четыре пути архивных копий в порядке позиций 1-4.
+    :param date_text: Текст даты (None — без даты).
+    :param delivery_profile: Профиль копии для Telegram (None/"" — только архивные копии).
+    :return: Пути файлов для отправки в Telegram в порядке позиций.
+    """
+    if len(output_paths) != 4:
+        raise ValueError("Для сетки 2x2 нужно ровно четыре пути.")
+    try:
+        with Image.open(io.BytesIO(image_data)) as grid:
+            grid.load()
+            delivery_paths = [
+                _save_outputs(grid.crop(_grid_box(grid.size, position)), output_path, date_text, delivery_profile)
+                for position, output_path in enumerate(output_paths, start=1)
+            ]
+        logger.info(f"Сетка разрезана на {len(delivery_paths)} изображения: {', '.join(output_paths)}")
+        return delivery_paths
+    except Exception as e:
+        logger.error(f"Ошибка при разрезании сетки: {e}")
+        raise
+
+
+async def process_image(image_data: bytes, output_path: str, date_text: str = None,
+                        crop_position: int = None, delivery_profile: str = DELIVERY_PROFILE) -> str:
+    """
+    Асинхронная обёртка над process_image_bytes: декодирование и кодирование
+    выполняются в отдельном пуле потоков, не блокируя event loop.
+    :return: Путь к файлу для отправки в Telegram.
+    """
+    loop = asyncio.get_running_loop()
+    with PROVIDER_CALL_SECONDS.time(provider="local", operation="watermark"):
+        return await loop.run_in_executor(
+            _image_executor,
+            functools.partial(process_image_bytes, image_data, output_path, date_text, crop_position, delivery_profile),
+        )
+
+
+async def split_grid(image_data: bytes, output_paths: list, date_text: str = None,
+                     delivery_profile: str = DELIVERY_PROFILE) -> list:
+    """
+    Асинхронная обёртка над split_grid_bytes (выполняется в пуле потоков обработки изображений).
+    :return: Пути файлов для отправки в Telegram в порядке позиций 1-4.
+    """
+    loop = asyncio.get_running_loop()
+    with PROVIDER_CALL_SECONDS.time(provider="local", operation="watermark"):
+        return await loop.run_in_executor(
+            _image_executor,
+            functools.partial(split_grid_bytes, image_data, output_paths, date_text, delivery_profile),
+        )
+
+
+def get_profile(name: str) -> dict:
+    """
+    Возвращает профиль кодирования по имени.
+    AVIF требует поддержки в Pillow; без неё используется JPEG.
+    """
+    if name not in OUTPUT_PROFILES:
+        raise ValueError(f"Неизвестный профиль кодирования: {name}")
+    if name == "avif" and not features.check("avif"):
+        logger.warning("Pillow собран без поддержки AVIF, используется профиль jpeg.")
+        name = "jpeg"
+    return OUTPUT_PROFILES[name]
+
+
+def encode_image(img: Image.Image, profile_name: str, max_bytes: int = None) -> bytes:
+    """
+    Кодирует изображение по профилю.
+    Для lossy-профилей подбирает максимальное качество (бинарным поиском), при котором
+    файл укладывается в max_bytes; если не укладывается даже при MIN_QUALITY — уменьшает размер.
+    :param img: Изображение.
+    :param profile_name: Имя профиля из OUTPUT_PROFILES.
+    :param max_bytes: Бюджет размера в байтах (None — без ограничения).
+    :return: Закодированные байты.
+    """
+    profile = get_profile(profile_name)
+
+    def _encode(image: Image.Image, quality: int = None) -> bytes:
+        buffer = io.BytesIO()
+        options = dict(profile["options"])
+        if quality is not None:
+            options["quality"] = quality
+        image.save(buffer, format=profile["format"], **options)
+        return buffer.getvalue()
+
+    if not profile["lossy"]:
+        return _encode(img)
+
+    if profile["format"] == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    for _ in range(4):
+        data = _encode(img, MAX_QUALITY)
+        if max_bytes is None or len(data) <= max_bytes:
+            return data
+
+        best = None
+        low, high = MIN_QUALITY, MAX_QUALITY - 1
+        while low <= high:
+            quality = (low + high) // 2
+            candidate = _encode(img, quality)
+            if len(candidate) <= max_bytes:
+                best, low = candidate, quality + 1
+            else:
+                high = quality - 1
+        if best is not None:
+            return best
+
+        # Даже минимальное качество не укладывается в бюджет — уменьшаем изображение
+        img = img.resize((int(img.size[0] * 0.8), int(img.size[1] * 0.8)), Image.LANCZOS)
+
+    logger.warning(f"Не удалось уложить изображение в {max_bytes} байт, размер {len(data)} байт")
+    return data
+
+
+def delivery_path_for(image_path: str, profile_name: str = DELIVERY_PROFILE) -> str:
+    """Возвращает путь копии для доставки рядом с архивным файлом: <имя>_tg.<расширение>."""
+    base, _ = os.path.splitext(image_path)
+    return f"{base}_tg.{get_profile(profile_name)['extension']}"
+
+
+def create_image_path(prefix: str = "story", extension: str = None) -> str:
     """
     Создает путь для сохранения изображения в формате: storage/images/{year}/{month}/{file_name}.
     :param prefix: Префикс имени файла.
+    :param extension: Расширение файла (по умолчанию — расширение архивного профиля ARCHIVE_PROFILE).
     :return: Полный путь к файлу.
     """
+    if extension is None:
+        extension = get_profile(ARCHIVE_PROFILE)["extension"]
     current_date = datetime.datetime.now()
     year = current_date.strftime("%Y")
     month = current_date.strftime("%m")
-    file_name = f"{prefix}_{current_date.strftime('%Y%m%d_%H%M%S')}.png"
+    file_name = f"{prefix}_{current_date.strftime('%Y%m%d_%H%M%S')}.{extension}"
 
     directory = os.path.join(IMAGES_PATH, year, month)
     os.makedirs(directory, exist_ok=True)
@@ -82,6 +316,24 @@ def create_video_path(prefix: str = "video") -> str:
 
     return os.path.join(directory, file_name)
 
+def _grid_box(size: tuple, position: int) -> tuple:
+    """Возвращает координаты ячейки (1-4) сетки 2x2 для изображения указанного размера."""
+    width, height = size
+    cell_width, cell_height = width // 2, height // 2
+
+    # Определяем координаты для вырезания
+    positions = {
+        1: (0, 0, cell_width, cell_height),  # Верхний левый
+        2: (cell_width, 0, width, cell_height),  # Верхний правый
+        3: (0, cell_height, cell_width, height),  # Нижний левый
+        4: (cell_width, cell_height, width, height),  # Нижний правый
+    }
+
+    if position not in positions:
+        raise ValueError("Позиция должна быть от 1 до 4.")
+    return positions[position]
+
+
 def crop_image(grid_path: str, output_path: str, position: int):
     """
     Вырезает одно изображение из сетки 2x2.
@@ -91,56 +343,140 @@ def crop_image(grid_path: str, output_path: str, position: int):
     """
     try:
         with Image.open(grid_path) as img:
-            width, height = img.size
-            cell_width, cell_height = width // 2, height // 2
-
-            # Определяем координаты для вырезания
-            positions = {
-                1: (0, 0, cell_width, cell_height),  # Верхний левый
-                2: (cell_width, 0, width, cell_height),  # Верхний правый
-                3: (0, cell_height, cell_width, height),  # Нижний левый
-                4: (cell_width, cell_height, width, height),  # Нижний правый
-            }
-
-            if position not in positions:
-                raise ValueError("Позиция должна быть от 1 до 4.")
-
-            cropped_img = img.crop(positions[position])
+            cropped_img = img.crop(_grid_box(img.size, position))
             cropped_img.save(output_path)
             logger.info(f"Изображение вырезано и сохранено в {output_path}")
     except Exception as e:
         logger.error(f"Ошибка при вырезании изображения: {e}")
         raise
 
-def download_image(image_url: str, file_path: str):
+
+async def download_bytes(url: str) -> bytes:
+    """
+    Скачивает небольшой файл (изображение) в память через общий HTTP-клиент.
+    :param url: URL файла.
+    :return: Содержимое файла.
+    """
+    try:
+        with PROVIDER_CALL_SECONDS.time(provider=httpx.URL(url).host, operation="download"):
+            response = await get_client(url).get(url, timeout=DOWNLOAD_TIMEOUT, follow_redirects=True)
+        response.raise_for_status()
+        logger.info(f"Скачано {len(response.content)} байт с {url}")
+        return response.content
+    except Exception as e:
+        logger.error(f"Ошибка при скачивании с {url}: {e}")
+        raise
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Вычисляет SHA-256 файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def save_bytes(data: bytes, file_path: str):
+    """Асинхронно сохраняет байты в файл без перекодирования."""
+    async with aiofiles.open(file_path, "wb") as file:
+        await file.write(data)
+
+
+async def download_file(url: str, file_path: str, expected_sha256: str = None,
+                        chunk_size: int = 256 * 1024, max_retries: int = 3) -> str:
+    """
+    Потоково скачивает файл на диск без блокировки event loop.
+    Данные пишутся во временный файл `<file_path>.part`, который после проверки
+    атомарно переименовывается. При обрыве загрузка продолжается через Range-запрос.
+    :param url: URL файла.
+    :param file_path: Путь, куда сохранить файл.
+    :param expected_sha256: Ожидаемая контрольная сумма SHA-256 (опционально).
+    :param chunk_size: Размер блока записи.
+    :param max_retries: Количество повторов при сетевых ошибках.
+    :return: SHA-256 скачанного файла.
+    """
+    part_path = f"{file_path}.part"
+    client = get_client(url)
+
+    for attempt in range(1, max_retries + 1):
+        digest = hashlib.sha256()
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            # Учитываем в контрольной сумме уже скачанную часть
+            async with aiofiles.open(part_path, "rb") as file:
+                while chunk := await file.read(chunk_size):
+                    digest.update(chunk)
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with client.stream("GET", url, headers=headers, timeout=DOWNLOAD_TIMEOUT,
+                                     follow_redirects=True) as response:
+                if response.status_code == 416:
+                    # Частичный файл уже полный или устарел — начинаем заново
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    logger.info(f"Сервер не поддерживает докачку, загрузка {url} начинается заново")
+                    offset = 0
+                    digest = hashlib.sha256()
+
+                expected_size = response.headers.get("Content-Length")
+                received = 0
+                async with aiofiles.open(part_path, "ab" if offset else "wb") as file:
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        await file.write(chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+
+            if expected_size is not None and received != int(expected_size):
+                raise IOError(f"Получено {received} байт вместо {expected_size}")
+        except (httpx.TransportError, IOError) as e:
+            if attempt >= max_retries:
+                logger.error(f"Ошибка при скачивании {url}: {e}")
+                raise
+            RETRIES.inc(provider=httpx.URL(url).host, reason="download")
+            logger.warning(f"Обрыв загрузки {url} ({e}). Докачка, попытка {attempt + 1}/{max_retries}...")
+            continue
+
+        checksum = digest.hexdigest()
+        if expected_sha256 and checksum != expected_sha256.lower():
+            os.remove(part_path)
+            raise ValueError(f"Контрольная сумма {url} не совпадает: {checksum} != {expected_sha256}")
+
+        os.replace(part_path, file_path)
+        logger.info(f"Файл скачан и сохранен в {file_path} ({offset + received} байт)")
+        return checksum
+
+    raise IOError(f"Не удалось скачать {url} за {max_retries} попыток")
+
+
+async def download_image(image_url: str, file_path: str) -> str:
     """
     Скачивает изображение из указанного URL и сохраняет на диск.
     :param image_url: URL изображения.
     :param file_path: Путь, куда сохранить изображение.
+    :return: SHA-256 файла.
     """
     try:
-        response = requests.get(image_url)
-        response.raise_for_status()
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        logger.info(f"Изображение скачано и сохранено в {file_path}")
+        with PROVIDER_CALL_SECONDS.time(provider=httpx.URL(image_url).host, operation="download"):
+            return await download_file(image_url, file_path)
     except Exception as e:
         logger.error(f"Ошибка при скачивании изображения с {image_url}: {e}")
         raise
 
-def download_video(video_url: str, file_path: str):
+
+async def download_video(video_url: str, file_path: str) -> str:
     """
     Скачивает видео из указанного URL и сохраняет на диск.
     :param video_url: URL видео.
     :param file_path: Путь, куда сохранить видео.
+    :return: SHA-256 файла.
     """
     try:
-        response = requests.get(video_url, stream=True)
-        response.raise_for_status()
-        with open(file_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        logger.info(f"Видео скачано и сохранено в {file_path}")
+        with PROVIDER_CALL_SECONDS.time(provider=httpx.URL(video_url).host, operation="download"):
+            return await download_file(video_url, file_path, chunk_size=1024 * 1024)
     except Exception as e:
         logger.error(f"Ошибка при скачивании видео с {video_url}: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,198 @@
+import datetime
+import json
+import logging
+import time
+from config import JOB_RESUME_HOURS
+from utils.database import fetch_all, run
+from utils.metrics import STAGE_FAILURES, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_ABANDONED = "abandoned"
+
+# Задания, которые сейчас выполняются в этом процессе (не подхватываются повторно)
+_active_jobs: set = set()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class Job:
+    """
+    Задание одного запуска раннера с контрольными точками этапов.
+
+    Результат каждого этапа (промпт, URL изображения, пути файлов) сохраняется в базу
+    сразу после выполнения, а ID удалённой задачи — сразу после её создания.
+    При повторном запуске после сбоя выполненные этапы не повторяются,
+    а ожидание удалённой задачи продолжается по сохранённому ID.
+    """
+
+    def __init__(self, job_id: int, runner: str, created_at: str, stages: dict = None, remote_ids: dict = None):
+        self.id = job_id
+        self.runner = runner
+        self.created_at = created_at
+        self.stages = stages or {}
+        self.remote_ids = remote_ids or {}
+        self._failed_stages: set = set()  # Этапы, завершившиеся ошибкой в этом запуске
+
+    @property
+    def date(self) -> datetime.datetime:
+        """Время создания задания (для даты на изображении и записи в базу при продолжении)."""
+        return datetime.datetime.fromisoformat(self.created_at)
+
+    async def stage(self, name: str, func):
+        """
+        Выполняет этап один раз за задание.
+        :param name: Имя этапа.
+        :param func: Функция без аргументов, возвращающая корутину (или значение) с JSON-совместимым результатом.
+        :return: Результат этапа (сохранённый, если этап уже выполнялся).
+        """
+        if name in self.stages:
+            logger.info(f"Задание {self.runner} #{self.id}: этап '{name}' уже выполнен, пропускаем.")
+            return self.stages[name]
+
+        started_at = time.monotonic()
+        try:
+            result = func()
+            if hasattr(result, "__await__"):
+                result = await result
+        except Exception:
+            # Отмена этапа (asyncio.CancelledError) ошибкой этапа не считается
+            self._failed_stages.add(name)
+            STAGE_FAILURES.inc(runner=self.runner, stage=name)
+            raise
+        STAGE_SECONDS.observe(time.monotonic() - started_at, runner=self.runner, stage=name)
+
+        payload = json.dumps(result, ensure_ascii=False)
+        await run(lambda conn: conn.execute("""
+            INSERT INTO job_stages (job_id, stage, result, completed_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (job_id, stage) DO UPDATE SET result = excluded.result, completed_at = excluded.completed_at
+        """, (self.id, name, payload, _now())))
+        await self._touch()
+        self.stages[name] = result
+        logger.info(f"Задание {self.runner} #{self.id}: этап '{name}' выполнен.")
+        return result
+
+    def remote_id(self, stage: str):
+        """Возвращает сохранённый ID удалённой задачи этапа или None."""
+        return self.remote_ids.get(stage)
+
+    async def set_remote_id(self, stage: str, remote_id: str):
+        """Сохраняет ID удалённой задачи этапа до начала ожидания её результата."""
+        await run(lambda conn: conn.execute("""
+            INSERT INTO job_stages (job_id, stage, remote_id) VALUES (?, ?, ?)
+            ON CONFLICT (job_id, stage) DO UPDATE SET remote_id = excluded.remote_id
+        """, (self.id, stage, str(remote_id))))
+        self.remote_ids[stage] = str(remote_id)
+        logger.info(f"Задание {self.runner} #{self.id}: удалённая задача этапа '{stage}': {remote_id}")
+
+    def remote_saver(self, stage: str):
+        """Возвращает колбэк on_task_created для сервисов, сохраняющий ID удалённой задачи этапа."""
+        return lambda remote_id: self.set_remote_id(stage, remote_id)
+
+    async def complete(self):
+        """Отмечает задание выполненным."""
+        await self._set_status(STATUS_DONE)
+        logger.info(f"Задание {self.runner} #{self.id} завершено.")
+
+    def pending_remote_stages(self) -> list:
+        """
+        Возвращает ключи удалённых задач, ожидание которых было прервано: задача создана,
+        а её этап не выполнен и не завершился ошибкой (например, отменён из-за сбоя соседнего этапа).
+        Ключ вида "image:ernie" относится к этапу "image".
+        """
+        return [
+            key for key in self.remote_ids
+            if key.split(":")[0] not in self.stages and key.split(":")[0] not in self._failed_stages
+        ]
+
+    async def fail(self, error: str):
+        """
+        Отмечает задание неудачным (оно не будет продолжено).
+        Если ожидание уже оплаченной удалённой задачи было прервано, задание остаётся незавершённым,
+        чтобы следующий запуск раннера дождался этой задачи, а не создавал новую.
+        """
+        pending = self.pending_remote_stages()
+        if pending:
+            await self._set_status(STATUS_RUNNING, error)
+            logger.warning(
+                f"Задание {self.runner} #{self.id} не завершено ({error}); "
+                f"удалённые задачи {', '.join(pending)} будут продолжены при следующем запуске."
+            )
+            return
+        await self._set_status(STATUS_FAILED, error)
+
+    async def _touch(self):
+        await run(lambda conn: conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (_now(), self.id)))
+
+    async def _set_status(self, status: str, error: str = None):
+        await run(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, _now(), self.id),
+        ))
+        _active_jobs.discard(self.id)
+
+
+def _resume_cutoff() -> str:
+    return (datetime.datetime.now() - datetime.timedelta(hours=JOB_RESUME_HOURS)).isoformat(timespec="seconds")
+
+
+async def _abandon_stale_jobs():
+    """Отмечает брошенными незавершённые задания старше JOB_RESUME_HOURS."""
+    await run(lambda conn: conn.execute(
+        "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND created_at < ?",
+        (STATUS_ABANDONED, _now(), STATUS_RUNNING, _resume_cutoff()),
+    ))
+
+
+async def open_job(runner: str) -> Job:
+    """
+    Возвращает незавершённое задание раннера (если процесс прервался во время его выполнения)
+    или создаёт новое.
+    :param runner: Имя раннера.
+    :return: Задание с загруженными результатами выполненных этапов.
+    """
+    await _abandon_stale_jobs()
+    rows = await fetch_all(
+        "SELECT id, created_at FROM jobs WHERE runner = ? AND status = ? ORDER BY id DESC",
+        (runner, STATUS_RUNNING),
+    )
+    row = next((row for row in rows if row[0] not in _active_jobs), None)
+
+    if row is None:
+        created_at = _now()
+        job_id = await run(lambda conn: conn.execute(
+            "INSERT INTO jobs (runner, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (runner, STATUS_RUNNING, created_at, created_at),
+        ).lastrowid)
+        _active_jobs.add(job_id)
+        logger.info(f"Создано задание {runner} #{job_id}.")
+        return Job(job_id, runner, created_at)
+
+    job_id, created_at = row
+    stages, remote_ids = {}, {}
+    for stage, remote_id, result, completed_at in await fetch_all(
+        "SELECT stage, remote_id, result, completed_at FROM job_stages WHERE job_id = ?", (job_id,)
+    ):
+        if completed_at is not None:
+            stages[stage] = json.loads(result)
+        if remote_id is not None:
+            remote_ids[stage] = remote_id
+    _active_jobs.add(job_id)
+    logger.info(
+        f"Продолжение задания {runner} #{job_id} от {created_at}: "
+        f"выполнено этапов {len(stages)}, удалённых задач {len(remote_ids)}."
+    )
+    return Job(job_id, runner, created_at, stages, remote_ids)
+
+
+async def unfinished_runners() -> list:
+    """Возвращает имена раннеров с незавершёнными заданиями, которые можно продолжить."""
+    await _abandon_stale_jobs()
+    rows = await fetch_all("SELECT DISTINCT runner FROM jobs WHERE status = ?", (STATUS_RUNNING,))
+    return [row[0] for row in rows]
+
@@ -0,0 +1,214 @@
+import logging
+import math
+import threading
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм длительностей (сек): от быстрых HTTP-запросов до генераций в очереди
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_registry: list = []
+_lock = threading.Lock()  # Метрики обновляются и из потоков (изображения, синхронные клиенты)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовый класс метрики с набором меток; наследники выдают строки через _samples()."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        """
+        :param name: Имя метрики в формате Prometheus.
+        :param documentation: Описание для строки # HELP.
+        :param labels: Имена меток.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: ожидались метки {self.labels}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент выдачи метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), collect=None):
+        """
+        :param collect: Функция без аргументов, возвращающая словарь: кортеж значений меток -> значение.
+        """
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    def _samples(self):
+        values = self.collect() if self.collect else self._values
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram(_Metric):
+    """Распределение значений (длительностей, размеров) по корзинам."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels) -> "_Timer":
+        """
+        Измеряет длительность блока. Работает и как with, и как async with
+        (например, в одной строке с async with provider_slot(...)).
+        """
+        return _Timer(self, labels)
+
+    def _samples(self):
+        for key, (counts, total) in self._values.items():
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _format_labels(self.labels, key, f'le="{_format_value(bound)}"'), count
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total
+            yield f"{self.name}_count", _format_labels(self.labels, key), counts[-1]
+
+
+class _Timer:
+    """Контекстный менеджер замера длительности для Histogram.time."""
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.started_at = None
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started_at, **self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        return self.__exit__(*exc_info)
+
+
+# Метрики раннеров и провайдеров
+STAGE_SECONDS = Histogram(
+    "utriskra_stage_seconds", "Длительность этапов раннеров", ("runner", "stage"))
+STAGE_FAILURES = Counter(
+    "utriskra_stage_failures_total", "Этапы раннеров, завершившиеся ошибкой", ("runner", "stage"))
+PROVIDER_CALL_SECONDS = Histogram(
+    "utriskra_provider_call_seconds",
+    "Длительность обращений к провайдерам: llm, generation, download, watermark, upload",
+    ("provider", "operation"))
+QUEUE_WAIT_SECONDS = Histogram(
+    "utriskra_queue_wait_seconds", "Ожидание слота провайдера внутри процесса", ("provider",))
+REMOTE_QUEUE_SECONDS = Histogram(
+    "utriskra_remote_queue_seconds", "Ожидание задачи в очереди удалённого бэкенда до начала генерации", ("provider",))
+RETRIES = Counter(
+    "utriskra_retries_total", "Повторные попытки обращения к провайдерам", ("provider", "reason"))
+HTTP_RESPONSES = Counter(
+    "utriskra_http_responses_total", "HTTP-ответы внешних API по хосту и коду статуса", ("host", "status"))
+HTTP_BYTES = Counter(
+    "utriskra_http_bytes_total", "Переданные байты (по Content-Length) по хосту и направлению", ("host", "direction"))
+
+
+def render_metrics() -> str:
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+_runner = None
+
+
+async def start_metrics_server(host: str, port: int):
+    """
+    Запускает HTTP-сервер с эндпоинтом /metrics.
+    :param host: Адрес (по умолчанию только локальный).
+    :param port: Порт.
+    """
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+
+async def stop_metrics_server():
+    """Останавливает HTTP-сервер метрик."""
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
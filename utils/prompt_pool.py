@@ -0,0 +1,179 @@
+import datetime
+import json
+import logging
+import os
+from config import PROMPTS_DIR, PROMPT_POOL_SIZE
+from services.gemini_service import GeminiService
+from utils.database import fetch_all, get_recent_prompts, run
+from utils.prompt_utils import RECENT_THEMES_LIMIT, generate_dynamic_prompt, load_template
+
+logger = logging.getLogger(__name__)
+
+# Источники пула: имя пула -> (файл промптов, max_theme, сколько раннеров берут из пула)
+POOL_SOURCES = {
+    "daily": ("daily_runner.txt", 10, 2),  # daily_runner и gemini_image_runner
+    "kandinsky": ("kandinsky_runner.txt", 10, 1),
+    "midjourney": ("midjourney_runner.txt", 10, 1),
+    "dalle": ("dalle_runner.txt", 50, 1),
+    "flux": ("flux_runner.txt", 10, 1),
+    "yandex": ("yandex_runner.txt", 10, 1),
+    "midjourney_video": ("midjourney_video_runner.txt", 10, 1),
+    "zimage": ("zimage_runner.txt", 10, 1),
+}
+
+BATCH_SYSTEM_PROMPT = (
+    "Ты готовишь промпты для нескольких генераторов изображений за один раз. "
+    "Каждый раздел ниже — отдельное независимое задание со своими системными инструкциями и запросом. "
+    "Выполни каждое задание так, как если бы оно было единственным, соблюдая все его требования к формату и длине. "
+    "Если в разделе нужно несколько промптов, они должны раскрывать разные темы. "
+    "Ответь одним JSON-объектом: ключ — имя раздела, значение — массив строк с готовыми промптами. "
+    "Никакого текста вне JSON."
+)
+
+
+def _today() -> str:
+    return datetime.date.today().isoformat()
+
+
+def _parse_batch(text: str) -> dict:
+    """Разбирает JSON-ответ Gemini (допускает обрамление в блок кода)."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1].rsplit("```", 1)[0]
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError(f"Ожидался JSON-объект, получено: {type(data).__name__}")
+    return data
+
+
+async def _render_prompts(prompts_file: str, max_theme: int) -> tuple:
+    """Подставляет переменные шаблона; последние темы читаются из базы, только если шаблон их использует."""
+    recent_themes = None
+    if "recent_themes" in load_template(prompts_file).variables:
+        recent_themes = await get_recent_prompts(RECENT_THEMES_LIMIT)
+    return generate_dynamic_prompt(prompts_file, max_theme=max_theme, recent_themes=recent_themes)
+
+
+async def _generated(pool_date: str) -> dict:
+    """Возвращает число промптов каждого пула, уже заготовленных на дату (включая использованные)."""
+    rows = await fetch_all(
+        "SELECT pool, COUNT(*) FROM prompt_pool WHERE date = ? GROUP BY pool",
+        (pool_date,),
+    )
+    return dict(rows)
+
+
+async def fill_prompt_pool(gemini_service: GeminiService = None, temperature: float = 1.0):
+    """
+    Генерирует промпты на день для всех раннеров одним запросом к Gemini и сохраняет их в пул.
+    Пулы, для которых промпты на сегодня уже заготовлены, пропускаются (повторный запуск не тратит запросы).
+    """
+    pool_date = _today()
+    generated = await _generated(pool_date)
+
+    sources = {}
+    for pool, (file_name, max_theme, consumers) in POOL_SOURCES.items():
+        count = PROMPT_POOL_SIZE * consumers - generated.get(pool, 0)
+        if count <= 0:
+            continue
+        try:
+            system_prompt, user_prompt = await _render_prompts(os.path.join(PROMPTS_DIR, file_name), max_theme)
+        except (OSError, ValueError) as e:
+            logger.error(f"Пул {pool} пропущен: {e}")
+            continue  # Раннер сгенерирует промпт сам
+        sources[pool] = (system_prompt, user_prompt, count)
+
+    if not sources:
+        logger.info("Пул промптов на сегодня уже заполнен.")
+        return
+
+    sections = [
+        f"### {pool} (промптов: {count})\n"
+        f"Системные инструкции:\n{system_prompt or '—'}\n\n"
+        f"Запрос:\n{user_prompt}"
+        for pool, (system_prompt, user_prompt, count) in sources.items()
+    ]
+    gemini_service = gemini_service or GeminiService()
+    logger.info(f"Генерация пула промптов одним запросом: {', '.join(sources)}")
+    try:
+        response = await gemini_service.generate_prompt(
+            system_prompt=BATCH_SYSTEM_PROMPT,
+            user_prompt="\n\n".join(sections),
+            temperature=temperature,
+            max_output_tokens=32000,
+            response_mime_type="application/json",
+        )
+        batch = _parse_batch(response)
+    except (RuntimeError, ValueError) as e:
+        # json.JSONDecodeError — подкласс ValueError
+        logger.error(f"Не удалось заполнить пул промптов, раннеры обратятся к Gemini напрямую: {e}")
+        return
+
+    rows = []
+    for pool, (system_prompt, user_prompt, count) in sources.items():
+        prompts = batch.get(pool) or []
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        prompts = [prompt.strip() for prompt in prompts if isinstance(prompt, str) and prompt.strip()][:count]
+        if len(prompts) < count:
+            logger.warning(f"Пул {pool}: получено промптов {len(prompts)} из {count}")
+        rows.extend((pool, pool_date, system_prompt, user_prompt, prompt) for prompt in prompts)
+
+    await run(lambda conn: conn.executemany("""
+        INSERT INTO prompt_pool (pool, date, system_prompt, user_prompt, generated_prompt)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows))
+    logger.info(f"В пул добавлено промптов: {len(rows)}")
+
+
+async def take_prompt(pool: str):
+    """
+    Забирает неиспользованный промпт на сегодня из пула.
+    :param pool: Имя пула (см. POOL_SOURCES).
+    :return: Словарь с system_prompt, user_prompt, generated_prompt или None, если пул пуст.
+    """
+    def _take(conn):
+        row = conn.execute("""
+            SELECT id, system_prompt, user_prompt, generated_prompt FROM prompt_pool
+            WHERE pool = ? AND date = ? AND used_at IS NULL ORDER BY id LIMIT 1
+        """, (pool, _today())).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE prompt_pool SET used_at = ? WHERE id = ?",
+                (datetime.datetime.now().isoformat(timespec="seconds"), row[0]),
+            )
+        return row
+
+    row = await run(_take)
+    if row is None:
+        return None
+    return {"system_prompt": row[1], "user_prompt": row[2], "generated_prompt": row[3]}
+
+
+async def draw_prompt(pool: str, prompts_file: str, gemini_service: GeminiService,
+                      temperature: float = 0.7, max_theme: int = 10) -> dict:
+    """
+    Возвращает промпт из пула, а если пул пуст — генерирует его запросом к Gemini.
+    :param pool: Имя пула раннера.
+    :param prompts_file: Файл промптов для генерации без пула.
+    :param gemini_service: Экземпляр GeminiService.
+    :param temperature: Температура генерации без пула.
+    :param max_theme: Верхняя граница {random_theme} и {day_theme}.
+    :return: Словарь с system_prompt, user_prompt, generated_prompt.
+    """
+    prompts = await take_prompt(pool)
+    if prompts:
+        logger.info(f"Промпт взят из пула {pool}.")
+        return prompts
+
+    # Читаем промпты из файла
+    system_prompt, user_prompt = await _render_prompts(prompts_file, max_theme)
+
+    logger.info(f"Системный промпт: {system_prompt}")
+    logger.info(f"Пользовательский промпт для Gemini: {user_prompt}")
+    generated_prompt = await gemini_service.generate_prompt(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        temperature=temperature
+    )
+    return {"system_prompt": system_prompt, "user_prompt": user_prompt, "generated_prompt": generated_prompt}
@@ -1,37 +1,148 @@
 import os
+import re
 import datetime
 import logging
 import random
 
 logger = logging.getLogger(__name__)  # Устанавливаем логгер для текущего модуля
 
-def generate_dynamic_prompt(prompts_file: str, max_theme: int = 10) -> tuple:
+SECTIONS = ("SYSTEM_PROMPT", "USER_PROMPT")  # Обязательные разделы файла промптов
+MARKER_RE = re.compile(r"---([A-Z_]+)---")
+VARIABLE_RE = re.compile(r"\{(\w+)\}")
+
+SEASONS = {12: "winter", 1: "winter", 2: "winter", 3: "spring", 4: "spring", 5: "spring",
+           6: "summer", 7: "summer", 8: "summer", 9: "autumn", 10: "autumn", 11: "autumn"}
+
+# Переменные, доступные в шаблонах
+VARIABLES = {
+    "current_date",   # Дата, например "18 October 2026"
+    "random_theme",   # Случайный номер темы от 1 до max_theme
+    "day_theme",      # Номер темы по дню месяца: день % max_theme (0 -> max_theme), один на весь день
+    "weekday",        # День недели, например "Sunday"
+    "season",         # Время года: winter, spring, summer, autumn
+    "recent_themes",  # Последние сгенерированные промпты (чтобы не повторяться)
+}
+
+RECENT_THEMES_LIMIT = 5  # Сколько последних промптов подставлять в {recent_themes}
+
+
+class PromptTemplateError(ValueError):
+    """Ошибка разметки файла промптов (маркеры разделов или неизвестная переменная)."""
+
+
+class PromptTemplate:
     """
-    Читает системный и пользовательский промпт из файла с многострочным форматом.
-    :param prompts_file: Путь к файлу с промптами.
-    :param max_theme: Верхняя граница диапазона для {random_theme} (включительно).
-    :return: Кортеж (system_prompt, user_prompt).
+    Файл промптов, разобранный один раз: разделы SYSTEM_PROMPT и USER_PROMPT
+    разбиты на текст и переменные, поэтому подстановка не требует повторного разбора.
     """
-    try:
-        with open(prompts_file, "r", encoding="utf-8") as file:
-            content = file.read()
 
-        # Извлекаем SYSTEM_PROMPT
-        system_prompt_start = "---SYSTEM_PROMPT---"
-        system_prompt_end = "---END_SYSTEM_PROMPT---"
-        system_prompt = content.split(system_prompt_start)[1].split(system_prompt_end)[0].strip()
+    def __init__(self, content: str, source: str = "<string>"):
+        """
+        :param content: Текст файла промптов.
+        :param source: Имя источника для сообщений об ошибках.
+        :raises PromptTemplateError: При ошибке разметки.
+        """
+        self.source = source
+        sections = self._split_sections(content)
+        self.system_parts = self._compile(sections["SYSTEM_PROMPT"])
+        self.user_parts = self._compile(sections["USER_PROMPT"])
+        # Имена переменных, которые встречаются в шаблоне
+        self.variables = {name for parts in (self.system_parts, self.user_parts) for name in parts[1::2]}
+
+    def _split_sections(self, content: str) -> dict:
+        """Проверяет маркеры и возвращает тексты разделов."""
+        sections = {}
+        current, start = None, None
+        for match in MARKER_RE.finditer(content):
+            marker = match.group(1)
+            if marker in SECTIONS:
+                if current is not None:
+                    raise PromptTemplateError(f"{self.source}: раздел {current} не закрыт перед ---{marker}---")
+                if marker in sections:
+                    raise PromptTemplateError(f"{self.source}: раздел {marker} указан повторно")
+                current, start = marker, match.end()
+            elif marker.startswith("END_") and marker[4:] in SECTIONS:
+                if current != marker[4:]:
+                    raise PromptTemplateError(f"{self.source}: ---{marker}--- без открывающего маркера")
+                sections[current] = content[start:match.start()].strip()
+                current = None
+            else:
+                raise PromptTemplateError(f"{self.source}: неизвестный маркер ---{marker}---")
+
+        if current is not None:
+            raise PromptTemplateError(f"{self.source}: раздел {current} не закрыт")
+        missing = [name for name in SECTIONS if name not in sections]
+        if missing:
+            raise PromptTemplateError(f"{self.source}: отсутствуют разделы {', '.join(missing)}")
+        return sections
+
+    def _compile(self, text: str) -> list:
+        """Разбивает текст на чередующиеся части: текст, имя переменной, текст, ..."""
+        parts = VARIABLE_RE.split(text)
+        unknown = set(parts[1::2]) - VARIABLES
+        if unknown:
+            raise PromptTemplateError(f"{self.source}: неизвестные переменные {', '.join(sorted(unknown))}")
+        return parts
+
+    @staticmethod
+    def _render_parts(parts: list, values: dict) -> str:
+        return "".join(part if index % 2 == 0 else values[part] for index, part in enumerate(parts))
 
-        # Извлекаем USER_PROMPT
-        user_prompt_start = "---USER_PROMPT---"
-        user_prompt_end = "---END_USER_PROMPT---"
-        user_prompt = content.split(user_prompt_start)[1].split(user_prompt_end)[0].strip()
+    def render(self, max_theme: int = 10, recent_themes: list = None, now: datetime.datetime = None) -> tuple:
+        """
+        Подставляет переменные в шаблон.
+        :param max_theme: Верхняя граница диапазона для {random_theme} и {day_theme} (включительно).
+        :param recent_themes: Последние промпты для {recent_themes}.
+        :param now: Момент, для которого вычисляются дата, день недели и время года.
+        :return: Кортеж (system_prompt, user_prompt).
+        """
+        now = now or datetime.datetime.now()
+        values = {
+            "current_date": now.strftime("%d %B %Y"),
+            "random_theme": str(random.randint(1, max_theme)),
+            "day_theme": str(now.day % max_theme or max_theme),
+            "weekday": now.strftime("%A"),
+            "season": SEASONS[now.month],
+            "recent_themes": "\n".join(f"- {theme}" for theme in recent_themes or []) or "—",
+        }
+        return self._render_parts(self.system_parts, values), self._render_parts(self.user_parts, values)
 
-        # Заменяем {current_date} в пользовательском промпте
-        current_date = datetime.datetime.now().strftime("%d %B %Y")
-        random_theme = str(random.randint(1, max_theme))
-        user_prompt = user_prompt.replace("{current_date}", current_date)
-        user_prompt = user_prompt.replace("{random_theme}", random_theme)
 
+# Скомпилированные шаблоны: путь -> ((st_mtime_ns, st_ino, st_size), PromptTemplate)
+_templates: dict = {}
+
+
+def load_template(prompts_file: str) -> PromptTemplate:
+    """
+    Возвращает скомпилированный шаблон файла промптов.
+    Файл разбирается заново, только если изменились его mtime, inode или размер,
+    поэтому правки промптов подхватываются без перезапуска.
+    :param prompts_file: Путь к файлу с промптами.
+    :raises PromptTemplateError: При ошибке разметки.
+    """
+    stat = os.stat(prompts_file)
+    key = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    cached = _templates.get(prompts_file)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with open(prompts_file, "r", encoding="utf-8") as file:
+        template = PromptTemplate(file.read(), source=prompts_file)
+    _templates[prompts_file] = (key, template)
+    logger.info(f"Шаблон промптов {prompts_file} скомпилирован.")
+    return template
+
+
+def generate_dynamic_prompt(prompts_file: str, max_theme: int = 10, recent_themes: list = None) -> tuple:
+    """
+    Читает системный и пользовательский промпт из файла с многострочным форматом.
+    :param prompts_file: Путь к файлу с промптами.
+    :param max_theme: Верхняя граница диапазона для {random_theme} и {day_theme} (включительно).
+    :param recent_themes: Последние промпты для {recent_themes}.
+    :return: Кортеж (system_prompt, user_prompt).
+    """
+    try:
+        system_prompt, user_prompt = load_template(prompts_file).render(max_theme=max_theme, recent_themes=recent_themes)
         logger.info("Промпты успешно извлечены из файла.")
         return system_prompt, user_prompt
     except FileNotFoundError:
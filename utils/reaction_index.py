@@ -0,0 +1,98 @@
+import datetime
+import logging
+from telethon.tl.types import MessageMediaPhoto
+from utils.database import fetch_all, fetch_one, run
+
+logger = logging.getLogger(__name__)
+
+REFRESH_CHUNK = 100  # Сколько сообщений запрашивать за раз при обновлении реакций
+
+
+def count_reactions(message) -> int:
+    """Возвращает общее количество реакций на сообщение."""
+    if not message.reactions:
+        return 0
+    return sum(reaction.count for reaction in message.reactions.results)
+
+
+async def _last_seen(peer: str) -> int:
+    row = await fetch_one("SELECT last_message_id FROM reaction_index_state WHERE peer = ?", (peer,))
+    return row[0] if row else 0
+
+
+async def update_reaction_index(client, entity, peer: str, since: datetime.datetime):
+    """
+    Дополняет индекс реакций новыми сообщениями и обновляет реакции на фото внутри окна.
+    Новые сообщения читаются только после последнего обработанного ID (min_id),
+    поэтому каждый запуск проходит лишь сообщения, появившиеся с прошлого раза.
+    :param client: Подключённый TelegramClient.
+    :param entity: Группа или канал.
+    :param peer: Ключ группы в индексе.
+    :param since: Начало окна (aware datetime); фото старше удаляются из индекса.
+    """
+    last_seen = await _last_seen(peer)
+    newest = last_seen
+    new_rows = []
+
+    # iter_messages возвращает сообщения от новых к старым, min_id отсекает уже обработанные
+    async for message in client.iter_messages(entity, min_id=last_seen):
+        newest = max(newest, message.id)
+        if message.date < since:
+            break  # При первом запуске не уходим глубже окна
+        if message.media and isinstance(message.media, MessageMediaPhoto):
+            new_rows.append((peer, message.id, message.date.isoformat(), count_reactions(message)))
+
+    # Реакции на ранее проиндексированные фото могли измениться — перечитываем только окно
+    new_ids = {row[1] for row in new_rows}
+    indexed = await fetch_all(
+        "SELECT message_id FROM reaction_index WHERE peer = ? AND date >= ?",
+        (peer, since.isoformat()),
+    )
+    refresh_ids = [row[0] for row in indexed if row[0] not in new_ids]
+    updated, deleted = [], []
+    for start in range(0, len(refresh_ids), REFRESH_CHUNK):
+        chunk = refresh_ids[start:start + REFRESH_CHUNK]
+        messages = await client.get_messages(entity, ids=chunk)
+        for message_id, message in zip(chunk, messages):
+            if message is None:
+                deleted.append((peer, message_id))
+            else:
+                updated.append((count_reactions(message), peer, message_id))
+
+    def _write(conn):
+        conn.executemany("""
+            INSERT INTO reaction_index (peer, message_id, date, reactions) VALUES (?, ?, ?, ?)
+            ON CONFLICT (peer, message_id) DO UPDATE SET reactions = excluded.reactions
+        """, new_rows)
+        conn.executemany("UPDATE reaction_index SET reactions = ? WHERE peer = ? AND message_id = ?", updated)
+        conn.executemany("DELETE FROM reaction_index WHERE peer = ? AND message_id = ?", deleted)
+        conn.execute("DELETE FROM reaction_index WHERE peer = ? AND date < ?", (peer, since.isoformat()))
+        conn.execute("""
+            INSERT INTO reaction_index_state (peer, last_message_id) VALUES (?, ?)
+            ON CONFLICT (peer) DO UPDATE SET last_message_id = excluded.last_message_id
+        """, (peer, newest))
+
+    await run(_write)
+    logger.info(
+        f"Индекс реакций обновлён: новых фото {len(new_rows)}, "
+        f"обновлено {len(updated)}, удалено {len(deleted)}, последнее сообщение {newest}"
+    )
+
+
+async def top_reacted(peer: str, since: datetime.datetime, limit: int = 1) -> list:
+    """
+    Возвращает фото окна с наибольшим количеством реакций (без фото с нулём реакций).
+    :param peer: Ключ группы в индексе.
+    :param since: Начало окна (aware datetime).
+    :param limit: Сколько фото вернуть.
+    :return: Список словарей с message_id, date (datetime) и reactions_count.
+    """
+    rows = await fetch_all("""
+        SELECT message_id, date, reactions FROM reaction_index
+        WHERE peer = ? AND date >= ? AND reactions > 0
+        ORDER BY reactions DESC, message_id DESC LIMIT ?
+    """, (peer, since.isoformat(), limit))
+    return [
+        {"message_id": message_id, "date": datetime.datetime.fromisoformat(date), "reactions_count": reactions}
+        for message_id, date, reactions in rows
+    ]
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from utils.metrics import STAGE_FAILURES, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _Stage:
+    def __init__(self, name: str, func, inputs: tuple, after: tuple):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.after = after
+
+
+class StageGraph:
+    """
+    Декларативный граф этапов раннера.
+    Каждый этап объявляет, результаты каких этапов ему нужны (inputs) и после каких этапов
+    он должен выполняться (after). Этапы без взаимных зависимостей выполняются параллельно:
+    например, отправка изображения в Telegram не задерживает создание видео.
+
+    Пример:
+        graph = StageGraph(job)
+        graph.add("prompt", generate_prompts)
+        graph.add("image", generate_image, inputs=("prompt",))
+        results = await graph.run()
+    """
+
+    def __init__(self, job=None, name: str = None):
+        """
+        :param job: Задание журнала (utils.job_journal.Job); если задано, результаты этапов
+                    сохраняются как контрольные точки и не вычисляются повторно при продолжении.
+        :param name: Имя графа для логов (по умолчанию — имя раннера задания).
+        """
+        self.job = job
+        self.name = name or (job.runner if job is not None else "pipeline")
+        self._stages: dict = {}
+
+    def add(self, name: str, func, inputs: tuple = (), after: tuple = ()):
+        """
+        Добавляет этап в граф.
+        :param name: Уникальное имя этапа (используется и как имя контрольной точки журнала).
+        :param func: Асинхронная функция (или функция, возвращающая значение), получающая
+                     результаты этапов inputs позиционными аргументами в том же порядке.
+        :param inputs: Этапы, результаты которых передаются в func.
+        :param after: Этапы, которые должны завершиться раньше, без передачи результата.
+        :raises ValueError: Если этап уже объявлен или зависит от необъявленного этапа.
+        """
+        if name in self._stages:
+            raise ValueError(f"Этап '{name}' уже объявлен")
+        # Зависимости только от ранее объявленных этапов — граф не может содержать циклов
+        unknown = [dependency for dependency in (*inputs, *after) if dependency not in self._stages]
+        if unknown:
+            raise ValueError(f"Этап '{name}' зависит от необъявленных этапов: {', '.join(unknown)}")
+        self._stages[name] = _Stage(name, func, tuple(inputs), tuple(after))
+        return self
+
+    async def _run_stage(self, stage: _Stage, tasks: dict):
+        args = [await tasks[dependency] for dependency in stage.inputs]
+        for dependency in stage.after:
+            await tasks[dependency]
+
+        def call():
+            return stage.func(*args)
+
+        started_at = time.monotonic()
+        if self.job is not None:
+            result = await self.job.stage(stage.name, call)
+        else:
+            # Без журнала метрики этапа пишутся здесь (Job.stage пишет их сам)
+            try:
+                result = call()
+                if hasattr(result, "__await__"):
+                    result = await result
+            except Exception:
+                STAGE_FAILURES.inc(runner=self.name, stage=stage.name)
+                raise
+            STAGE_SECONDS.observe(time.monotonic() - started_at, runner=self.name, stage=stage.name)
+        logger.info(f"{self.name}: этап '{stage.name}' занял {time.monotonic() - started_at:.1f} сек")
+        return result
+
+    async def run(self) -> dict:
+        """
+        Выполняет все этапы, запуская каждый, как только готовы его зависимости.
+        При ошибке любого этапа остальные отменяются, а исключение пробрасывается.
+        ID удалённых задач отменённых этапов остаются в журнале, и Job.fail оставляет такое
+        задание незавершённым, чтобы следующий запуск дождался уже оплаченной задачи.
+        :return: Словарь: имя этапа -> результат.
+        """
+        tasks: dict = {}
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(self._run_stage(stage, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
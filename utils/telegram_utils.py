@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, FSInputFile, InputMediaPhoto, Message
+from config import TELEGRAM_API_URL, TELEGRAM_TOKEN
+from utils.concurrency import TELEGRAM, provider_slot
+from utils.database import get_telegram_file_id, save_telegram_file_id
+from utils.image_utils import file_sha256
+from utils.metrics import PROVIDER_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot(timeout=None) -> Bot:
+    """
+    Создаёт экземпляр Bot для раннера.
+    Если задан TELEGRAM_API_URL, запросы идут на этот сервер Bot API (например, локальный или тестовый).
+    :param timeout: Тайм-аут сессии aiogram (по умолчанию — стандартный).
+    :return: Экземпляр aiogram Bot; сессию закрывает вызывающий код.
+    """
+    session_kwargs = {}
+    if timeout is not None:
+        session_kwargs["timeout"] = timeout
+    if TELEGRAM_API_URL:
+        session_kwargs["api"] = TelegramAPIServer.from_base(TELEGRAM_API_URL)
+    return Bot(token=TELEGRAM_TOKEN, session=AiohttpSession(**session_kwargs))
+
+
+async def _send_cached(bot: Bot, chat_id, file, media_type: str, **kwargs) -> Message:
+    """
+    Отправляет медиа, переиспользуя file_id, если такой же файл уже загружался в Telegram.
+    После загрузки нового файла его file_id сохраняется в кэш по SHA-256 содержимого.
+    :param file: Путь к файлу или содержимое файла (bytes).
+    """
+    send = bot.send_photo if media_type == "photo" else bot.send_video
+    if isinstance(file, bytes):
+        content_hash = hashlib.sha256(file).hexdigest()
+        upload = BufferedInputFile(file, filename=f"{content_hash[:16]}.{'jpg' if media_type == 'photo' else 'mp4'}")
+        file_name = f"из памяти ({len(file)} байт)"
+    else:
+        content_hash = await asyncio.to_thread(file_sha256, file)
+        upload = FSInputFile(file)
+        file_name = file
+
+    file_id = await get_telegram_file_id(content_hash, media_type)
+    async with provider_slot(TELEGRAM), PROVIDER_CALL_SECONDS.time(provider=TELEGRAM, operation="upload"):
+        if file_id:
+            try:
+                message = await send(chat_id, file_id, **kwargs)
+                logger.info(f"Файл {file_name} отправлен по кэшированному file_id без повторной загрузки")
+                return message
+            except TelegramBadRequest as e:
+                logger.warning(f"Кэшированный file_id недействителен ({e}), загружаем файл заново")
+
+        message = await send(chat_id, upload, **kwargs)
+        if media_type == "photo":
+            file_id = message.photo[-1].file_id
+        else:
+            file_id = message.video.file_id
+        save_telegram_file_id(content_hash, file_id, media_type)
+        return message
+
+
+async def send_photo_cached(bot: Bot, chat_id, file_path: str, **kwargs) -> Message:
+    """
+    Отправляет фото в чат с использованием кэша file_id.
+    :param bot: Экземпляр aiogram Bot.
+    :param chat_id: ID чата.
+    :param file_path: Путь к файлу изображения или его содержимое (bytes).
+    :return: Отправленное сообщение.
+    """
+    return await _send_cached(bot, chat_id, file_path, "photo", **kwargs)
+
+
+async def send_video_cached(bot: Bot, chat_id, file_path: str, **kwargs) -> Message:
+    """
+    Отправляет видео в чат с использованием кэша file_id.
+    :param bot: Экземпляр aiogram Bot.
+    :param chat_id: ID чата.
+    :param file_path: Путь к видеофайлу.
+    :return: Отправленное сообщение.
+    """
+    return await _send_cached(bot, chat_id, file_path, "video", **kwargs)
+
+
+async def send_album_cached(bot: Bot, chat_id, file_paths: list, **kwargs) -> list:
+    """
+    Отправляет несколько фото одним альбомом с использованием кэша file_id.
+    :param bot: Экземпляр aiogram Bot.
+    :param chat_id: ID чата.
+    :param file_paths: Пути к файлам изображений (2-10).
+    :return: Отправленные сообщения.
+    """
+    hashes = await asyncio.gather(*(asyncio.to_thread(file_sha256, path) for path in file_paths))
+    file_ids = [await get_telegram_file_id(content_hash, "photo") for content_hash in hashes]
+
+    def _media(use_cache: bool) -> list:
+        return [
+            InputMediaPhoto(media=file_id if use_cache and file_id else FSInputFile(path))
+            for path, file_id in zip(file_paths, file_ids)
+        ]
+
+    async with provider_slot(TELEGRAM), PROVIDER_CALL_SECONDS.time(provider=TELEGRAM, operation="upload"):
+        try:
+            messages = await bot.send_media_group(chat_id, media=_media(use_cache=True), **kwargs)
+        except TelegramBadRequest as e:
+            if not any(file_ids):
+                raise
+            logger.warning(f"Кэшированный file_id недействителен ({e}), загружаем альбом заново")
+            messages = await bot.send_media_group(chat_id, media=_media(use_cache=False), **kwargs)
+
+    for content_hash, message in zip(hashes, messages):
+        save_telegram_file_id(content_hash, message.photo[-1].file_id, "photo")
+    return messages